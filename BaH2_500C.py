@@ -76,6 +76,10 @@ class BackwardInitialConditions(GeneralInitialConditions):
     # Boolean Flags to control script
     MSCorrectionFlag = True
     GammaCorrectionFlag = False
+    noOfPreviewGroups = None     # No of detector groups for quick preview fit that seeds main fit, None to skip
+    previewOnly = False          # Stops after preview fit, main fit and fit in y space are not run
+    coarseTOFBinningFactor = None    # Integer, first fits NCP on bins this many times wider, then refines on tofBinning
+    saveRunTimes = False         # Stores run times of fits and corrections, used to estimate time of Bootstrap
 
     # # Parameters of workspaces in input_ws
     tofBinning="110,1.,420"                    # Binning of ToF spectra
@@ -111,6 +115,10 @@ class ForwardInitialConditions(GeneralInitialConditions):
     # Boolean Flags to control script
     MSCorrectionFlag = True
     GammaCorrectionFlag = True
+    noOfPreviewGroups = None     # No of detector groups for quick preview fit that seeds main fit, None to skip, not run in JOINT
+    previewOnly = False          # Stops after preview fit, main fit and fit in y space are not run
+    coarseTOFBinningFactor = None    # Integer, first fits NCP on bins this many times wider, then refines on tofBinning
+    saveRunTimes = False         # Stores run times of fits and corrections, used to estimate time of Bootstrap
 
     maskedSpecAllNo = np.array([171, 172, 173, 174])
 
@@ -121,11 +129,17 @@ class YSpaceFitInitialConditions:
     showPlots = True
     symmetrisationFlag = True
     rebinParametersForYSpaceFit = "-25, 0.5, 25"    # Needs to be symetric
+    ySpaceConversion = "MANTID"      # Options: 'MANTID' (ConvertToYSpace and Rebin algorithms), 'NUMPY' (arrays, all spectra at once)
     fitModel = "DOUBLE_WELL" #"DOUBLE_WELL"   # Options: 'SINGLE_GAUSSIAN', 'GC_C4', 'GC_C6', 'GC_C4_C6', 'DOUBLE_WELL', 'DOUBLE_WELL_ANSIO'
     runMinos = True
+    minosMode = "GRID"               # Options: 'GRID' (dense profile scan), 'ROOT' (root finding, sparse profile)
+    minosWorkers = 1                 # Processes running the manual minos scans, 1 runs them one after the other
+    crossCheckMinimizers = ["Levenberg-Marquardt", "Simplex"]    # Mantid Fit run alongside Minuit, [] to skip
     globalFit = True
     nGlobalFitGroups = 4       # Number or string "ALL"
+    cacheGroupings = True      # Reuse groupings found for the same detectors and no of groups
     maskTOFRange = "157, 163"    # Range for the resonance peak, masks with NCP fit values
+    useYFitCache = False             # Loads fits of previous run when weighted avg, resolution and settings are unchanged
 
 
 
@@ -145,8 +159,20 @@ class BootstrapInitialConditions:
     fitInYSpace = "FORWARD"   
     
     runningJackknife = False
+    jackknifeGroupSize = 1          # Columns deleted in each jackknife replica, needs to divide the no of bins
+    jackknifeGrouping = "CONTIGUOUS"    # Options: "CONTIGUOUS", "STRIDED" (columns spread across the TOF range)
+    infinitesimalJackknife = False  # First order jackknife from derivatives of the parent fit, without refits
     nSamples = 2
     skipMSIterations = False
+    warmStartReplicas = False       # Fits of each spectrum in replicas start from the parent best fit
+    replicaCorrections = "RECOMPUTE"  # Options: "RECOMPUTE", "REUSE" (parent MS and gamma corrections), "DRIFT" (reuse unless means drift)
+    correctionsDriftTol = 0.02      # Relative drift of mean widths and intensities from parent, used with "DRIFT"
+    verboseReplicas = False         # Prints reuse or recomputing of parent corrections at each MS iteration of replicas
+    batchYFit = False               # Replicas are fitted in y space all at once, after all replicas are formed
+    blockBootstrap = False          # Resamples blocks of residuals, with lengths from their lag-1 correlation in each spectrum
+    nWorkers = 1                    # Replicas run in this many separate processes, each with its own workspaces
+    masterSeed = None               # Seed from which the random state of each replica is derived, None for random
+    resumeRun = False               # Runs only the replicas missing from an interrupted run with the same settings
     userConfirmation = True
 
 
@@ -10,18 +10,40 @@ suite  = unittest.TestSuite()
 import vesuvio_analysis.tests.test_analysis as analysis
 # Add tests to the test suite
 suite.addTests(loader.loadTestsFromModule(analysis))
+import vesuvio_analysis.tests.test_analysis_functions as analysisfunctions
+suite.addTests(loader.loadTestsFromModule(analysisfunctions))
+import vesuvio_analysis.tests.test_coarse_fit as coarsefit
+suite.addTests(loader.loadTestsFromModule(coarsefit))
+
+import vesuvio_analysis.tests.test_preview as preview
+suite.addTests(loader.loadTestsFromModule(preview))
 
 import vesuvio_analysis.tests.test_yspace_fit as yspacefit
 suite.addTests(loader.loadTestsFromModule(yspacefit))
 import vesuvio_analysis.tests.test_yspace_fit_GC as yspacefit_GC
 suite.addTests(loader.loadTestsFromModule(yspacefit_GC))
+import vesuvio_analysis.tests.test_yspace_conversion as yspaceconversion
+suite.addTests(loader.loadTestsFromModule(yspaceconversion))
+import vesuvio_analysis.tests.test_double_well as doublewell
+suite.addTests(loader.loadTestsFromModule(doublewell))
+import vesuvio_analysis.tests.test_minos as minos
+suite.addTests(loader.loadTestsFromModule(minos))
+import vesuvio_analysis.tests.test_batch_fit as batchfit
+suite.addTests(loader.loadTestsFromModule(batchfit))
+import vesuvio_analysis.tests.test_yspace_functions as yspacefunctions
+suite.addTests(loader.loadTestsFromModule(yspacefunctions))
 
 import vesuvio_analysis.tests.test_bootstrap as bootstrap
 suite.addTests(loader.loadTestsFromModule(bootstrap))
+import vesuvio_analysis.tests.test_parallel_bootstrap as parallelbootstrap
+suite.addTests(loader.loadTestsFromModule(parallelbootstrap))
 
 import vesuvio_analysis.tests.test_jackknife as jackknife
 suite.addTests(loader.loadTestsFromModule(jackknife))
 
+import vesuvio_analysis.tests.test_bootstrap_functions as bootstrapfunctions
+suite.addTests(loader.loadTestsFromModule(bootstrapfunctions))
+
 
 # Initialize a runner, pass it your suite and run it
 runner = unittest.TextTestRunner(verbosity=1)
@@ -72,6 +72,10 @@ class BackwardInitialConditions(GeneralInitialConditions):
     # Boolean Flags to control script
     MSCorrectionFlag = True
     GammaCorrectionFlag = False
+    noOfPreviewGroups = None     # No of detector groups for quick preview fit that seeds main fit, None to skip
+    previewOnly = False          # Stops after preview fit, main fit and fit in y space are not run
+    coarseTOFBinningFactor = None    # Integer, first fits NCP on bins this many times wider, then refines on tofBinning
+    saveRunTimes = False         # Stores run times of fits and corrections, used to estimate time of Bootstrap
 
     tofBinning='275.,1.,420'   
 
@@ -102,6 +106,10 @@ class ForwardInitialConditions(GeneralInitialConditions):    # Same structure as
     # Boolean Flags to control script
     MSCorrectionFlag = True
     GammaCorrectionFlag = True
+    noOfPreviewGroups = None     # No of detector groups for quick preview fit that seeds main fit, None to skip, not run in JOINT
+    previewOnly = False          # Stops after preview fit, main fit and fit in y space are not run
+    coarseTOFBinningFactor = None    # Integer, first fits NCP on bins this many times wider, then refines on tofBinning
+    saveRunTimes = False         # Stores run times of fits and corrections, used to estimate time of Bootstrap
 
     maskedSpecAllNo = np.array([173, 174, 179])
 
@@ -112,11 +120,17 @@ class YSpaceFitInitialConditions:
     showPlots = True
     symmetrisationFlag = False
     rebinParametersForYSpaceFit = "-30, 0.5, 30"    # Needs to be symetric
+    ySpaceConversion = "MANTID"      # Options: 'MANTID' (ConvertToYSpace and Rebin algorithms), 'NUMPY' (arrays, all spectra at once)
     fitModel = "SINGLE_GAUSSIAN"     # Options: 'SINGLE_GAUSSIAN', 'GC_C4', 'GC_C6', 'GC_C4_C6', 'DOUBLE_WELL', 'DOUBLE_WELL_ANSIO'
     runMinos = True
+    minosMode = "GRID"               # Options: 'GRID' (dense profile scan), 'ROOT' (root finding, sparse profile)
+    minosWorkers = 1                 # Processes running the manual minos scans, 1 runs them one after the other
+    crossCheckMinimizers = ["Levenberg-Marquardt", "Simplex"]    # Mantid Fit run alongside Minuit, [] to skip
     globalFit = True                 # Performs global fit with Minuit by default
     nGlobalFitGroups = 4             # Number or string "ALL"
+    cacheGroupings = True            # Reuse groupings found for the same detectors and no of groups
     maskTOFRange = None              # Option to mask TOF range with NCP fit on resonance peak
+    useYFitCache = False             # Loads fits of previous run when weighted avg, resolution and settings are unchanged
 
 
 class UserScriptControls:
@@ -135,8 +149,20 @@ class BootstrapInitialConditions:
     fitInYSpace = "FORWARD"
 
     runningJackknife = False         # Overwrites normal Bootstrap with Jackknife
+    jackknifeGroupSize = 1          # Columns deleted in each jackknife replica, needs to divide the no of bins
+    jackknifeGrouping = "CONTIGUOUS"    # Options: "CONTIGUOUS", "STRIDED" (columns spread across the TOF range)
+    infinitesimalJackknife = False  # First order jackknife from derivatives of the parent fit, without refits
     nSamples = 2                  # Used if running Bootstrap, otherwise code ignores it
     skipMSIterations = False        # Each replica runs with no MS or Gamma corrections
+    warmStartReplicas = False       # Fits of each spectrum in replicas start from the parent best fit
+    replicaCorrections = "RECOMPUTE"  # Options: "RECOMPUTE", "REUSE" (parent MS and gamma corrections), "DRIFT" (reuse unless means drift)
+    correctionsDriftTol = 0.02      # Relative drift of mean widths and intensities from parent, used with "DRIFT"
+    verboseReplicas = False         # Prints reuse or recomputing of parent corrections at each MS iteration of replicas
+    batchYFit = False               # Replicas are fitted in y space all at once, after all replicas are formed
+    blockBootstrap = False          # Resamples blocks of residuals, with lengths from their lag-1 correlation in each spectrum
+    nWorkers = 1                    # Replicas run in this many separate processes, each with its own workspaces
+    masterSeed = None               # Seed from which the random state of each replica is derived, None for random
+    resumeRun = False               # Runs only the replicas missing from an interrupted run with the same settings
     userConfirmation = True         # Asks user to confirm procedure, will probably be deleted in the future
 
 
@@ -53,12 +53,18 @@ def completeICFromInputs(IC, scriptName, wsIC):
     
     # Do not run bootstrap sample, by default
     IC.runningSampleWS = False
+    IC.replicaInitPars = None    # Per-spectrum initial parameters of replica fits, one array per MS iteration
+    IC.parentCorrections = None  # MS and gamma corrections of parent at each MS iteration, reused by replicas
 
     # Store script name
     IC.scriptName = scriptName
 
     # Default not running preliminary procedure to estimate HToMass0Ratio
     IC.runningPreliminary = False
+
+    # Options not present in older scripts keep previous behaviour
+    setDefaultAttrs(IC, noOfPreviewGroups=None, previewOnly=False, coarseTOFBinningFactor=None, saveRunTimes=False)
+    IC.runTimeScales = runTimeScales(IC)    # Sizes stored with run times of procedures
     
     # Set directories for figures
     figSavePath = experimentsPath / scriptName /"figures" 
@@ -102,6 +108,9 @@ def setOutputDirsForSample(IC, sampleName):
 
     IC.resultsSavePath = outputPath / fileName
     IC.ySpaceFitSavePath = outputPath / fileNameYSpace
+
+    # Run times of each procedure, used to estimate Bootstrap total run time
+    IC.runTimesPath = experimentsPath / sampleName / "running_times.json"
     return
 
 
@@ -141,6 +150,12 @@ def completeBootIC(bootIC, bckwdIC, fwdIC, yFitIC):
     except AttributeError:
         bootIC.runningTest = False
 
+    # Options not present in older scripts keep previous behaviour
+    setDefaultAttrs(bootIC, batchYFit=False, blockBootstrap=False, nWorkers=1, masterSeed=None, resumeRun=False,
+                    jackknifeGroupSize=1, jackknifeGrouping="CONTIGUOUS", infinitesimalJackknife=False,
+                    warmStartReplicas=False, replicaCorrections="RECOMPUTE", correctionsDriftTol=0.02,
+                    verboseReplicas=False)
+
     setBootstrapDirs(bckwdIC, fwdIC, bootIC, yFitIC)
     return
 
@@ -152,9 +167,6 @@ def setBootstrapDirs(bckwdIC, fwdIC, bootIC, yFitIC):
     sampleName = bckwdIC.scriptName   # Name of sample currently running
     experimentsPath = currentPath/".."/".."/"experiments"
     
-    # Used to store running times required to estimate Bootstrap total run time.
-    bootIC.runTimesPath = experimentsPath / sampleName / "running_times.txt"
-
     # Make bootstrap and jackknife data directories
     if bootIC.runningJackknife:
         bootPath = experimentsPath / sampleName / "jackknife_data"
@@ -192,7 +204,7 @@ def genBootFilesName (IC, bootIC):
 
     nSamples = bootIC.nSamples
     if bootIC.runningJackknife: 
-        nSamples = 3 if bootIC.runningTest else noOfHistsFromTOFBinning(IC)
+        nSamples = 3 if bootIC.runningTest else noOfJackknifeGroups(noOfHistsFromTOFBinning(IC), bootIC)
 
     # Build Filename based on ic
     corr = ""
@@ -202,6 +214,8 @@ def genBootFilesName (IC, bootIC):
         corr+="_GC"
 
     fileName = f"spec_{IC.firstSpec}-{IC.lastSpec}_iter_{IC.noOfMSIterations}{corr}"
+    if bootIC.runningJackknife and bootIC.infinitesimalJackknife:
+        fileName += "_IJ"     # No refits, kept apart from full jackknife
     bootName = fileName + f"_nsampl_{nSamples}"+".npz"
     bootNameYFit = fileName + "_ySpaceFit" + f"_nsampl_{nSamples}"+".npz"
     return bootName, bootNameYFit
@@ -212,6 +226,10 @@ def logString(bootDataName, IC, yFitIC, bootIC, isYFit):
         log = bootDataName+" : "+str(bootIC.fitInYSpace)+" - "+str(yFitIC.symmetrisationFlag)+" - "+yFitIC.rebinParametersForYSpaceFit+" - "+yFitIC.fitModel
     else:
         log = bootDataName+" : "+str(bootIC.procedure)+" - "+IC.tofBinning
+        if bootIC.runningJackknife and (bootIC.jackknifeGroupSize > 1):
+            log += " - "+bootIC.jackknifeGrouping+" groups of "+str(bootIC.jackknifeGroupSize)
+        if bootIC.runningJackknife and bootIC.infinitesimalJackknife:
+            log += " - infinitesimal"
     return log
 
 
@@ -220,6 +238,18 @@ def noOfHistsFromTOFBinning(IC):
     return int((end-start)/spacing) - 1 # To account for last column being ignored
 
 
+def runTimeScales(IC):
+    """Sizes of the fit of IC that run times scale with."""
+    nSpec = IC.lastSpec - IC.firstSpec + 1 - len(IC.maskedDetectorIdx)
+    return {"nSpec": int(nSpec), "nBins": noOfHistsFromTOFBinning(IC), "nMasses": int(IC.noOfMasses)}
+
+
+def noOfJackknifeGroups(nBins, bootIC):
+    """Number of jackknife replicas, each deleting a group of jackknifeGroupSize columns."""
+    assert nBins % bootIC.jackknifeGroupSize == 0, f"Jackknife groups need to be of equal size, {nBins} columns not divisible by jackknifeGroupSize={bootIC.jackknifeGroupSize}."
+    return nBins // bootIC.jackknifeGroupSize
+
+
 def buildFinalWSName(scriptName: str, procedure: str, IC):
     # Format of corrected ws from last iteration
     name = scriptName + "_" + procedure + "_" + str(IC.noOfMSIterations)
@@ -231,4 +261,16 @@ def completeYFitIC(yFitIC, sampleName):
     figSavePath = experimentsPath / sampleName /  "figures" 
     figSavePath.mkdir(exist_ok=True)
     yFitIC.figSavePath = figSavePath
+
+    # Options not present in older scripts keep previous behaviour
+    setDefaultAttrs(yFitIC, minosMode="GRID", minosWorkers=1, crossCheckMinimizers=["Levenberg-Marquardt", "Simplex"],
+                    cacheGroupings=True, ySpaceConversion="MANTID", useYFitCache=False)
+    return
+
+
+def setDefaultAttrs(IC, **defaults):
+    """Sets attributes of initial conditions that were not defined by the user."""
+    for key, value in defaults.items():
+        if not hasattr(IC, key):
+            setattr(IC, key, value)
     return
\ No newline at end of file
@@ -2,6 +2,9 @@ import matplotlib.pyplot as plt
 import numpy as np
 from mantid.simpleapi import *
 from scipy import optimize
+import json
+import os
+import time
 
 # Format print output of arrays
 np.set_printoptions(suppress=True, precision=4, linewidth=100, threshold=sys.maxsize)
@@ -18,11 +21,15 @@ def iterativeFitForDataReduction(ic):
     cropedWs = cropAndMaskWorkspace(ic, initialWs)
     wsToBeFitted = CloneWorkspace(InputWorkspace=cropedWs, OutputWorkspace=cropedWs.name()+"0")
 
+    tFits, tCorrections = [], []     # Run times of each stage, stored to estimate run time of Bootstrap
     for iteration in range(ic.noOfMSIterations + 1):
         # Workspace from previous iteration
         wsToBeFitted = mtd[ic.name+str(iteration)]
 
-        fitNcpToWorkspace(ic, wsToBeFitted)
+        t0 = time.time()
+        specInitPars = None if ic.replicaInitPars is None else ic.replicaInitPars[iteration]   # Bootstrap replicas seeded from parent
+        fitNcpToWorkspace(ic, wsToBeFitted, specInitPars)
+        tFits.append(time.time() - t0)
         
         mWidths, stdWidths, mIntRatios, stdIntRatios = extractMeans(wsToBeFitted.name(), ic)
         createMeansAndStdTableWS(wsToBeFitted.name(), ic, mWidths, stdWidths, mIntRatios, stdIntRatios)
@@ -31,27 +38,135 @@ def iterativeFitForDataReduction(ic):
         if iteration == ic.noOfMSIterations:
           break 
 
+        t0 = time.time()
         CloneWorkspace(InputWorkspace=ic.name, OutputWorkspace="tmpNameWs")
 
+        parentCorrections = parentCorrectionsToReuse(ic, iteration, mWidths, mIntRatios)
+
         if ic.MSCorrectionFlag:
-            wsMS = createWorkspacesForMSCorrection(ic, mWidths, mIntRatios)
+            if parentCorrections is None:
+                wsMS = createWorkspacesForMSCorrection(ic, mWidths, mIntRatios)
+            else:
+                wsMS = passDataIntoWS(mtd[ic.name], *parentCorrections["_MulScattering"], ic.name+"_MulScattering")
             Minus(LHSWorkspace="tmpNameWs", RHSWorkspace=wsMS, OutputWorkspace="tmpNameWs")
 
         if ic.GammaCorrectionFlag:  
-            wsGC = createWorkspacesForGammaCorrection(ic, mWidths, mIntRatios)
+            if parentCorrections is None:
+                wsGC = createWorkspacesForGammaCorrection(ic, mWidths, mIntRatios)
+            else:
+                wsGC = passDataIntoWS(mtd[ic.name], *parentCorrections["_Gamma_Background"], ic.name+"_Gamma_Background")
             Minus(LHSWorkspace="tmpNameWs", RHSWorkspace=wsGC, OutputWorkspace="tmpNameWs")
 
+        cacheParentCorrections(ic, iteration, mWidths, mIntRatios)
+
         RenameWorkspace(InputWorkspace="tmpNameWs", OutputWorkspace=ic.name+str(iteration+1))
+        tCorrections.append(time.time() - t0)
 
         if ic.runningSampleWS and ic.runningJackknife:
             maskColumnWithZeros(ic.name, ic.name+str(iteration+1))
 
+    saveProcedureRunTimes(ic, tFits, tCorrections)
+
     wsFinal = mtd[ic.name+str(ic.noOfMSIterations)]
     fittingResults = resultsObject(ic)
     fittingResults.save()
     return wsFinal, fittingResults
 
 
+def cacheParentCorrections(ic, iteration, meanWidths, meanIntensityRatios):
+    """Stores MS and gamma corrections of the parent at each MS iteration, when replicas are set to reuse them."""
+    if ic.runningSampleWS or (ic.parentCorrections is None):
+        return
+
+    corrections = {"meanWidths": meanWidths, "meanIntensityRatios": meanIntensityRatios, "dataIntegrals": dataIntegrals(mtd[ic.name])}
+    for suffix, flag in zip(["_MulScattering", "_Gamma_Background"], [ic.MSCorrectionFlag, ic.GammaCorrectionFlag]):
+        if flag:
+            ws = mtd[ic.name+suffix]
+            corrections[suffix] = (ws.extractY(), ws.extractE())
+    ic.parentCorrections[iteration] = corrections
+
+
+def saveProcedureRunTimes(ic, tFits, tCorrections):
+    """
+    Stores seconds spent in each NCP fit and in each MS and gamma correction, with the sizes they scale by.
+    Only stored when ic.saveRunTimes is set.
+    """
+    if ic.runningSampleWS or not(ic.saveRunTimes):    # Replicas are timed together by the Bootstrap
+        return
+
+    record = {"mode": ic.modeRunning, **ic.runTimeScales, "MSCorrection": bool(ic.MSCorrectionFlag), 
+              "GammaCorrection": bool(ic.GammaCorrectionFlag), "tFits": tFits, "tCorrections": tCorrections}
+    appendRunTimes(ic.runTimesPath, "procedures", record)
+
+
+def loadRunTimes(savePath):
+    """Run times stored by previous runs of the sample, in seconds."""
+    if not(savePath.is_file()):
+        return {"procedures": [], "bootstrap": []}
+    with open(savePath, "r") as jsonFile:
+        return json.load(jsonFile)
+
+
+def appendRunTimes(savePath, kind, record):
+    runTimes = loadRunTimes(savePath)
+    runTimes[kind].append(record)
+
+    tmpPath = savePath.with_suffix(".tmp")    # Replaced in one step, file is not left incomplete if interrupted
+    with open(tmpPath, "w") as jsonFile:
+        json.dump(runTimes, jsonFile, indent=1)
+    os.replace(tmpPath, savePath)
+
+
+def parentCorrectionsToReuse(ic, iteration, meanWidths, meanIntensityRatios):
+    """
+    MS and gamma corrections of the parent at the same MS iteration, for a bootstrap replica
+    whose mean widths and intensity ratios stay within a relative ic.correctionsDriftTol of the parent ones.
+    Corrections are scaled to the counts in each spectrum of the replica, as MS is normalised to the data.
+    Returns None when corrections need to be recomputed.
+    """
+    if not(ic.runningSampleWS) or (ic.parentCorrections is None):
+        return None
+
+    parent = ic.parentCorrections[iteration]
+    drift = max(
+        np.max(np.abs(meanWidths / parent["meanWidths"] - 1)), 
+        np.max(np.abs(meanIntensityRatios / parent["meanIntensityRatios"] - 1))
+        )
+    if not(drift <= ic.correctionsDriftTol):    # Nan drift also recomputes
+        if ic.verboseReplicas:
+            print(f"\nMean widths and intensities drifted {drift:.3f} from parent, recomputing MS and gamma corrections.")
+        return None
+
+    if ic.verboseReplicas:
+        print(f"\nReusing MS and gamma corrections of parent at iteration {iteration}, drift of means {drift:.3f}.")
+
+    if ic.runningJackknife:     # Corrections of jackknife replicas are computed from the parent ws
+        return parent
+
+    scales = countsRatios(dataIntegrals(mtd[ic.name]), parent["dataIntegrals"])[:, np.newaxis]
+    corrections = dict(parent)
+    for suffix in ["_MulScattering", "_Gamma_Background"]:
+        if suffix in parent:
+            dataY, dataE = parent[suffix]
+            corrections[suffix] = (dataY * scales, dataE * scales)
+    return corrections
+
+
+def dataIntegrals(ws):
+    """Counts in each spectrum, as from Integration, used to normalise the MS correction."""
+    dataY = ws.extractY()
+    if ws.isDistribution():
+        dataY = dataY * np.diff(ws.extractX(), axis=1)
+    return np.nansum(dataY, axis=1)
+
+
+def countsRatios(replicaIntegrals, parentIntegrals):
+    """Ratios of counts of replica and parent in each spectrum, spectra without parent counts left unscaled."""
+    ratios = np.ones(len(parentIntegrals))
+    np.divide(replicaIntegrals, parentIntegrals, out=ratios, where=parentIntegrals!=0)
+    return ratios
+
+
 def maskColumnWithZeros(maskedWSName, wsToBeMaskedName):
 
     maskedWS = mtd[maskedWSName]
@@ -63,9 +178,11 @@ def maskColumnWithZeros(maskedWSName, wsToBeMaskedName):
     zeroCol = np.all(dataE==0, axis=0)
     assert np.all(zeroCol == np.all(dataY==0, axis=0)), "Jackknife column needs to be masked in dataY and dataE"
 
-    for i in range(wsToBeMasked.getNumberHistograms()):
-        wsToBeMasked.dataY(i)[zeroCol] = 0
-        wsToBeMasked.dataE(i)[zeroCol] = 0
+    dataYMasked = wsToBeMasked.extractY()
+    dataEMasked = wsToBeMasked.extractE()
+    dataYMasked[:, zeroCol] = 0
+    dataEMasked[:, zeroCol] = 0
+    passDataIntoWS(wsToBeMasked, dataYMasked, dataEMasked, wsToBeMaskedName)
 
 
 def createTableInitialParameters(ic):
@@ -156,20 +273,30 @@ def createSlabGeometry(ic):
         CreateSampleShape(ic.name, xml_str)
 
 
-def fitNcpToWorkspace(IC, ws):
+def fitNcpToWorkspace(IC, ws, specInitPars=None):
     """
     Performs the fit of ncp to the workspace.
     Firtly the arrays required for the fit are prepared and then the fit is performed iteratively
     on a spectrum by spectrum basis.
+    Fit of each spectrum starts from the corresponding row of specInitPars if given.
     """
     dataYws, dataXws, dataEws = arraysFromWS(ws)   
     dataY, dataX, dataE = histToPointData(dataYws, dataXws, dataEws)      
 
     resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass = prepareFitArgs(IC, dataX)
+
+    coarseInitPars = None
+    if (specInitPars is None) and (IC.coarseTOFBinningFactor is not None):
+        coarseInitPars = specInitPars = fitNcpToCoarseBins(IC, dataY, dataX, dataE, instrPars)
     
     print("\nFitting NCP:\n")
 
-    arrFitPars = fitNcpToArray(IC, dataY, dataE, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass)
+    nfevs = np.zeros(len(dataY))
+    arrFitPars = fitNcpToArray(IC, dataY, dataE, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass, specInitPars, nfevs)
+
+    if coarseInitPars is not None:
+        print(f"\nFunction evaluations on requested binning: {np.sum(nfevs):.0f}, "
+            + f"on {IC.coarseTOFBinningFactor}x coarser binning: {np.sum(coarseInitPars[:, -1]):.0f}")
     createTableWSForFitPars(ws.name(), IC.noOfMasses, arrFitPars)
     arrBestFitPars = arrFitPars[:, 1:-2]
     allNcpForEachMass, allNcpTotal = calculateNcpArr(IC, arrBestFitPars, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass)
@@ -180,6 +307,46 @@ def fitNcpToWorkspace(IC, ws):
     return
 
 
+def fitNcpToCoarseBins(IC, dataY, dataX, dataE, instrPars):
+    """
+    First pass of coarse-to-fine fit: NCP is fitted to data averaged over blocks of 
+    IC.coarseTOFBinningFactor neighbouring TOF bins, so each evaluation runs on fewer bins.
+    Output: best fit parameters of each spectrum, used as starting point of fit on the requested binning,
+    followed by the number of function evaluations in last column.
+    """
+    coarseY, coarseX, coarseE = coarsenPointData(dataY, dataX, dataE, IC.coarseTOFBinningFactor)
+    resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass = prepareFitArgs(IC, coarseX, instrPars)
+
+    print(f"\nFitting NCP on {IC.coarseTOFBinningFactor}x coarser TOF binning:\n")
+    nfevs = np.zeros(len(coarseY))
+    arrFitPars = fitNcpToArray(IC, coarseY, coarseE, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass, nfevs=nfevs)
+    return np.hstack((arrFitPars[:, 1:-2], nfevs[:, np.newaxis]))
+
+
+def coarsenPointData(dataY, dataX, dataE, factor):
+    """
+    Averages blocks of neighbouring TOF bins, last block might be smaller.
+    Points with zero error are ignored, blocks without valid points get zero value and error.
+    """
+    assert int(factor)==factor and factor > 1, "Factor of coarse binning needs to be an integer bigger than 1."
+
+    nBins = dataY.shape[1]
+    starts = np.arange(0, nBins, int(factor))
+    blockSizes = np.diff(np.append(starts, nBins))
+
+    valid = dataE!=0
+    nValid = np.add.reduceat(valid, starts, axis=1)
+    sumY = np.add.reduceat(np.where(valid, dataY, 0), starts, axis=1)
+    sumE2 = np.add.reduceat(np.where(valid, dataE**2, 0), starts, axis=1)
+
+    noData = nValid==0
+    nValid = np.where(noData, 1, nValid)
+    coarseY = np.where(noData, 0, sumY / nValid)
+    coarseE = np.where(noData, 0, np.sqrt(sumE2) / nValid)
+    coarseX = np.add.reduceat(dataX, starts, axis=1) / blockSizes
+    return coarseY, coarseX, coarseE
+
+
 def arraysFromWS(ws):
     """Output: dataY, dataX and dataE as arrays"""
     dataY = ws.extractY()
@@ -188,6 +355,20 @@ def arraysFromWS(ws):
     return dataY, dataX, dataE
 
 
+def passDataIntoWS(parentWS, dataY, dataE, wsName):
+    """
+    Creates workspace from dataY and dataE, arrays of shape (no of spectra, no of bins), in a single call.
+    X values, units, instrument and masking are copied from parentWS.
+    Replaces writing into each spectrum of a cloned workspace at a time.
+    """
+    return CreateWorkspace(
+        DataX=parentWS.extractX().ravel(), DataY=np.ravel(dataY), DataE=np.ravel(dataE), 
+        NSpec=parentWS.getNumberHistograms(), UnitX=parentWS.getAxis(0).getUnit().unitID(),
+        YUnitLabel=parentWS.YUnitLabel(), Distribution=parentWS.isDistribution(),
+        ParentWorkspace=parentWS, OutputWorkspace=wsName
+        )
+
+
 def histToPointData(dataY, dataX, dataE):
     """Output: middle points of dataX hists"""
 
@@ -200,8 +381,9 @@ def histToPointData(dataY, dataX, dataE):
     return dataYp, dataXp, dataEp
 
 
-def prepareFitArgs(ic, dataX):
-    instrPars = loadInstrParsFileIntoArray(ic.InstrParsPath, ic.firstSpec, ic.lastSpec)       
+def prepareFitArgs(ic, dataX, instrPars=None):
+    if instrPars is None:       # Instrument parameters of each spectrum in ic
+        instrPars = loadInstrParsFileIntoArray(ic.InstrParsPath, ic.firstSpec, ic.lastSpec)       
     resolutionPars = loadResolutionPars(instrPars)                                   
 
     v0, E0, delta_E, delta_Q = calculateKinematicsArrays(dataX, instrPars)   
@@ -281,12 +463,21 @@ def convertDataXToYSpacesForEachMass(dataX, masses, delta_Q, delta_E):
     return ySpacesForEachMass
 
 
-def fitNcpToArray(ic, dataY, dataE, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass):
-    """Takes dataY as a 2D array and returns the 2D array best fit parameters."""
+def fitNcpToArray(ic, dataY, dataE, resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass, specInitPars=None, nfevs=None):
+    """
+    Takes dataY as a 2D array and returns the 2D array best fit parameters.
+    Fit of each spectrum starts from ic.initPars, or from the corresponding row of specInitPars if given.
+    Number of function evaluations of each fit is written to nfevs if given.
+    """
 
     arrFitPars = np.zeros((len(dataY), len(ic.initPars)+3))
     for i in range(len(dataY)):
 
+        fitInfo = {}
+        initPars = ic.initPars
+        if (specInitPars is not None) and np.any(specInitPars[i, :len(ic.initPars)]!=0):   # Failed fits are zero
+            initPars = specInitPars[i, :len(ic.initPars)]
+
         specFitPars = fitNcpToSingleSpec(
             dataY[i],
             dataE[i],
@@ -294,10 +485,14 @@ def fitNcpToArray(ic, dataY, dataE, resolutionPars, instrPars, kinematicArrays,
             resolutionPars[i],
             instrPars[i],
             kinematicArrays[i],
-            ic
+            ic,
+            initPars,
+            fitInfo
             ) 
 
         arrFitPars[i] = specFitPars
+        if nfevs is not None:
+            nfevs[i] = fitInfo.get("nfev", 0)
 
         if np.all(specFitPars==0):
             print("Skipped spectra.")
@@ -511,15 +706,21 @@ def filterWidthsAndIntensities(widthsIn, intensitiesIn, IC):
     return betterWidths, betterIntensities
 
 
-def fitNcpToSingleSpec(dataY, dataE, ySpacesForEachMass, resolutionPars, instrPars, kinematicArrays, ic):
-    """Fits the NCP and returns the best fit parameters for one spectrum"""
+def fitNcpToSingleSpec(dataY, dataE, ySpacesForEachMass, resolutionPars, instrPars, kinematicArrays, ic, initPars=None, fitInfo=None):
+    """
+    Fits the NCP and returns the best fit parameters for one spectrum.
+    Number of function evaluations is stored in fitInfo if given.
+    """
+
+    if initPars is None:
+        initPars = ic.initPars
 
     if np.all(dataY == 0) : 
         return np.zeros(len(ic.initPars)+3)  
 
     result = optimize.minimize(
         errorFunction, 
-        ic.initPars, 
+        initPars, 
         args=(dataY, dataE, ySpacesForEachMass, resolutionPars, instrPars, kinematicArrays, ic),
         method='SLSQP', 
         bounds = ic.bounds, 
@@ -527,6 +728,8 @@ def fitNcpToSingleSpec(dataY, dataE, ySpacesForEachMass, resolutionPars, instrPa
         )
 
     fitPars = result["x"]
+    if fitInfo is not None:
+        fitInfo["nfev"] = result["nfev"]
 
     noDegreesOfFreedom = len(dataY) - len(fitPars)
     specFitPars = np.append(instrPars[0], fitPars)
@@ -556,6 +759,73 @@ def errorFunction(pars, dataY, dataE, ySpacesForEachMass, resolutionPars, instrP
     return np.sum(chi2)
 
 
+def weightedResidualsJacobian(pars, dataY, dataE, ySpacesForEachMass, resolutionPars, instrPars, kinematicArrays, ic):
+    """
+    Weighted residuals (dataY-ncp)/dataE of one spectrum and the jacobian of the weighted ncp, ncp/dataE,
+    with respect to the fit parameters, from central differences.
+    Points with zero error are ignored, as in errorFunction().
+    """
+    valid = dataE!=0
+    weights = np.zeros(dataE.shape)
+    weights[valid] = 1 / dataE[valid]
+
+    def ncpTotal(p):
+        return calculateNcpSpec(ic, p, ySpacesForEachMass, resolutionPars, instrPars, kinematicArrays)[1]
+
+    residuals = (dataY - ncpTotal(pars)) * weights
+
+    jac = np.zeros((len(dataY), len(pars)))
+    steps = 1e-6 * np.maximum(np.abs(pars), 1)
+    for p, step in enumerate(steps):
+        dPars = np.zeros(len(pars))
+        dPars[p] = step
+        jac[:, p] = (ncpTotal(pars+dPars) - ncpTotal(pars-dPars)) / (2*step) * weights
+    return residuals, jac
+
+
+def leaveGroupsOutShifts(residuals, jac, groupOfColumns, nGroups):
+    """
+    First order change of best fit parameters of one spectrum when each group of columns is deleted from the fit.
+    Linearised least squares solution without group g, relative to the one with all columns:
+    (J^T J - J_g^T J_g)^-1 (J^T r - J_g^T r_g) - (J^T J)^-1 J^T r
+    groupOfColumns: index of the group each column belongs to, -1 for columns never deleted.
+    Output shape: (nGroups, no of parameters)
+    """
+    nPars = jac.shape[1]
+    oneHot = (groupOfColumns == np.arange(nGroups)[:, np.newaxis]).astype(float)
+
+    hess = jac.T @ jac
+    grad = jac.T @ residuals
+    hessGroups = (oneHot @ (jac[:, :, np.newaxis] * jac[:, np.newaxis, :]).reshape(len(jac), -1)).reshape(nGroups, nPars, nPars)
+    gradGroups = oneHot @ (jac * residuals[:, np.newaxis])
+
+    # Pseudo-inverse for parameters without effect on the ncp
+    shiftsWithout = np.einsum("gij,gj->gi", np.linalg.pinv(hess - hessGroups, hermitian=True), grad - gradGroups)
+    return shiftsWithout - np.linalg.pinv(hess, hermitian=True) @ grad
+
+
+def infinitesimalJackknifeShifts(ic, ws, arrBestFitPars, groupOfColumns, nGroups):
+    """
+    First order shifts of the best fit parameters of all spectra of ws, for each group of TOF columns deleted,
+    computed at once from the parent fit, without fitting any jackknife replica.
+    Output shape: (nGroups, no of spectra, no of parameters)
+    """
+    dataYws, dataXws, dataEws = arraysFromWS(ws)
+    dataY, dataX, dataE = histToPointData(dataYws, dataXws, dataEws)
+    resolutionPars, instrPars, kinematicArrays, ySpacesForEachMass = prepareFitArgs(ic, dataX)
+
+    shifts = np.zeros((nGroups, *arrBestFitPars.shape))
+    for i, pars in enumerate(arrBestFitPars):
+        if np.all(pars==0) or np.any(np.isnan(pars)):     # Skipped or masked spectra
+            continue
+
+        residuals, jac = weightedResidualsJacobian(
+            pars, dataY[i], dataE[i], ySpacesForEachMass[i], resolutionPars[i], instrPars[i], kinematicArrays[i], ic
+            )
+        shifts[:, i] = leaveGroupsOutShifts(residuals, jac, groupOfColumns, nGroups)
+    return shifts
+
+
 def calculateNcpSpec(ic, pars, ySpacesForEachMass, resolutionPars, instrPars, kinematicArrays):    
     """Creates a synthetic C(t) to be fitted to TOF values of a single spectrum, from J(y) and resolution functions
        Shapes: datax (1, n), ySpacesForEachMass (4, n), res (4, 2), deltaQ (1, n), E0 (1,n),
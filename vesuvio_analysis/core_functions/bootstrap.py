@@ -1,11 +1,17 @@
-from vesuvio_analysis.core_functions.fit_in_yspace import fitInYSpaceProcedure
+from vesuvio_analysis.core_functions.fit_in_yspace import fitInYSpaceProcedure, ySpaceAvgProcedure, fitYSpaceBatch, ResultsYSpaceAvgObject
 from vesuvio_analysis.core_functions.procedures import runJointBackAndForwardProcedure, runIndependentIterativeProcedure
-from vesuvio_analysis.core_functions.ICHelpers import buildFinalWSName, noOfHistsFromTOFBinning
+from vesuvio_analysis.core_functions.ICHelpers import buildFinalWSName, noOfHistsFromTOFBinning, noOfJackknifeGroups
+from vesuvio_analysis.core_functions.analysis_functions import passDataIntoWS, infinitesimalJackknifeShifts, loadRunTimes, appendRunTimes
 from mantid.api import AnalysisDataService, mtd
-from mantid.simpleapi import CloneWorkspace, SaveNexus, Load, SumSpectra
+from mantid.simpleapi import CloneWorkspace, SaveNexus
 from scipy import stats
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import tempfile
+import json
+import os
 import time
 import matplotlib.pyplot as plt
 plt.style.use("ggplot")
@@ -13,8 +19,10 @@ currentPath = Path(__file__).parent.absolute()
 
 
 def runBootstrap(bckwdIC, fwdIC, bootIC, yFitIC):
+    assert not(bckwdIC.previewOnly or fwdIC.previewOnly), "Preview only does not run the main fit, not available for Bootstrap."
 
     checkOutputDirExists(bckwdIC, fwdIC, bootIC)            # Checks to see if those directories exits already
+    checkParallelWorkers(bootIC)
     askUserConfirmation(bckwdIC, fwdIC, bootIC)
     AnalysisDataService.clear()
 
@@ -30,19 +38,36 @@ def checkOutputDirExists(bckwdIC, fwdIC, bootIC):
 
     proc = bootIC.procedure
     if (proc=="BACKWARD") | (proc=="JOINT"):
-        checkOutDirIC(bckwdIC)
+        checkOutDirIC(bckwdIC, bootIC)
     if (proc=="FORWARD") | (proc=="JOINT"):
-        checkOutDirIC(fwdIC)
+        checkOutDirIC(fwdIC, bootIC)
     return 
 
 
-def checkOutDirIC(IC):
+def checkParallelWorkers(bootIC):
+    """Replicas run in parallel only in forked workers, which share the parent data and ICs."""
+    if (bootIC.nWorkers <= 1) or (bootIC.runningJackknife and bootIC.infinitesimalJackknife):   # No replicas to run in parallel
+        return
+    if "fork" not in mp.get_all_start_methods():
+        raise ValueError(f"nWorkers={bootIC.nWorkers} needs worker processes started with fork, not available on this platform. "
+                         "Set nWorkers=1 to run replicas serially.")
+    return
+
+
+def checkOutDirIC(IC, bootIC):
     if IC.bootSavePath.is_file() or IC.bootYFitSavePath.is_file():
         print(f"\nOutput data files were detected:" \
             f"\n{IC.bootSavePath.name}\n{IC.bootYFitSavePath.name}" \
             f"\nAborting Run of Bootstrap to prevent overwriting data." \
             f"\nTo avoid this issue you can change the number of samples to run.")
         raise ValueError("Output data directories already exist. Aborted Bootstrap.")
+
+    stores = [samplesStorePath(path) for path in [IC.bootSavePath, IC.bootYFitSavePath]]
+    if any(store.is_file() for store in stores) and not(bootIC.resumeRun):
+        print(f"\nSamples of an interrupted run were detected:" \
+            f"\n{stores[0].name}\n{stores[1].name}" \
+            f"\nSet resumeRun=True to run only the missing replicas.")
+        raise ValueError("Interrupted run would be overwritten. Aborted Bootstrap.")
     return
 
 
@@ -79,109 +104,270 @@ def bootstrapProcedure(bckwdIC, fwdIC, bootIC, yFitIC):
     nSamples = chooseNSamples(bootIC, parentWSnNCPs)
 
     bootResults = initializeResults(parentResults, nSamples, corrCoefs)
-    saveBootstrapLogs(bootResults, bckwdIC, fwdIC)
-    parentWSNCPSavePaths = convertWSToSavePaths(parentWSnNCPs)
+    if bootIC.runningJackknife and bootIC.infinitesimalJackknife:
+        # Replicas are never formed, so there is no y space fit of replicas to store or log
+        bootResults = {key: res for key, res in bootResults.items() if not(key.endswith("YFit"))}
 
-    iStart, iEnd = chooseLoopRange(bootIC, nSamples)
+    resumed = bootIC.resumeRun and resumeFromCheckpoints(bootResults, bckwdIC, fwdIC, bootIC)
+    if not(resumed):
+        saveBootstrapLogs(bootResults, bckwdIC, fwdIC)
 
-    # Form each bootstrap workspace and run ncp fit with MS corrections
-    for i in range(iStart, iEnd):
-        AnalysisDataService.clear()
-        plt.close("all")    # Not sure if previous step clears plt figures, so introduced this step to be safe
-
-        sampleInputWS, parentWS = createSampleWS(parentWSNCPSavePaths, i, bootIC)   # Creates ith sample
-        formSampleIC(bckwdIC, fwdIC, bootIC, sampleInputWS, parentWS)  
-
-        # try:
-        iterResults = runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC)   # Conversion to YSpace with masked column
-        # except RuntimeError:    # TODO: Think about the errors to except
-        #     continue     # If due to a very unlikely random sample the procedure fails, skip to next iteration
-        
-        storeBootIter(bootResults, i, iterResults)   # Stores results for each iteration
-        saveBootstrapResults(bootResults, bckwdIC, fwdIC)
+    rngs = replicaGenerators(bootIC, nSamples)   # After resuming, to use master seed of interrupted run
+    openBootstrapStores(bootResults, bckwdIC, fwdIC, bootIC)
+    parentData = storeParentData(parentResults, parentWSnNCPs, corrCoefs, bootIC)
+
+    iStart, iEnd = chooseLoopRange(bootIC, nSamples)
+    replicaIdxs = missingReplicas(bootResults, iStart, iEnd)
+    if resumed:
+        print(f"\nResuming interrupted run, {len(replicaIdxs)} out of {iEnd-iStart} replicas left to run.")
+
+    t0 = time.time()
+    if bootIC.runningJackknife and bootIC.infinitesimalJackknife:
+        storeInfinitesimalJackknife(bootResults, bckwdIC, fwdIC, bootIC)
+    elif bootIC.nWorkers > 1:
+        runReplicasParallel(bootResults, bckwdIC, fwdIC, bootIC, yFitIC, parentData, replicaIdxs, rngs)
+    else:
+        # Form each bootstrap workspace and run ncp fit with MS corrections
+        for i in replicaIdxs:
+            iterResults = runReplica(bckwdIC, fwdIC, bootIC, yFitIC, parentData, i, rngs[i])
+            storeBootIter(bootResults, i, iterResults)   # Stores results for each iteration
+            flushBootstrapStores(bootResults)
+
+    if bootIC.batchYFit:     # Fit in y space of all replicas at once
+        for key in bootResults:
+            if key.endswith("YFit"):
+                bootResults[key].fitReplicasBatch(yFitIC)
+
+    if not(bootIC.runningJackknife and bootIC.infinitesimalJackknife):
+        saveBootstrapRunTimes(bckwdIC, fwdIC, bootIC, len(replicaIdxs), time.time()-t0)
+
+    saveBootstrapResults(bootResults, bckwdIC, fwdIC)
+    closeBootstrapStores(bootResults)
     return bootResults
 
 
+def storeInfinitesimalJackknife(bootResults, bckwdIC, fwdIC, bootIC):
+    """
+    Jackknife samples from first order shifts of the parent best fit parameters, without refitting any replica.
+    Shifts are taken around the fit of the final parent ws, keeping its MS and gamma corrections fixed.
+    """
+    for IC, key in zip([bckwdIC, fwdIC], ["bckwd", "fwd"]):
+        if key+"Scat" not in bootResults:
+            continue
+
+        bootResult = bootResults[key+"Scat"]
+        nGroups = len(bootResult.bootSamples)
+        wsFinal = mtd[IC.name+str(IC.noOfMSIterations)]
+        nBins = wsFinal.blocksize()-1   # Last column is ignored during procedure
+
+        groupOfColumns = np.full(nBins, -1)
+        for j in range(nGroups):
+            groupOfColumns[jackknifeColumns(j, nBins, bootIC)] = j
+
+        shifts = infinitesimalJackknifeShifts(IC, wsFinal, bootResult.parentResult[:, 1:-2], groupOfColumns, nGroups)
+        bootResult.bootSamples[:] = bootResult.parentResult
+        bootResult.bootSamples[:, :, 1:-2] += shifts
+    return
+
+
+def runReplica(bckwdIC, fwdIC, bootIC, yFitIC, parentData, i, rng=None):
+    """Creates the ith replica and runs the main procedure on it."""
+    AnalysisDataService.clear()
+    plt.close("all")    # Not sure if previous step clears plt figures, so introduced this step to be safe
+
+    sampleInputWS, parentWS = createSampleWS(parentData, i, bootIC, rng)   # Creates ith sample
+    formSampleIC(bckwdIC, fwdIC, bootIC, sampleInputWS, parentWS, parentData)  
+
+    # try:
+    return runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC, batchYFit=bootIC.batchYFit)   # Conversion to YSpace with masked column
+    # except RuntimeError:    # TODO: Think about the errors to except
+    #     continue     # If due to a very unlikely random sample the procedure fails, skip to next iteration
+
+
+def replicaGenerators(bootIC, nSamples):
+    """
+    Independent random generator for each replica, spawned from a single master seed,
+    such that each replica does not depend on the worker or order in which it runs.
+    Serial runs without a seed keep using the global numpy random state, as the stored test samples.
+    Parallel runs without a seed draw it from the numpy random state, so np.random.seed() still fixes the run,
+    and the seed is stored in the checkpoint to resume the run.
+    Jackknife replicas are not random.
+    """
+    if bootIC.runningJackknife or ((bootIC.masterSeed is None) and (bootIC.nWorkers <= 1)):
+        return [None] * nSamples
+
+    if bootIC.masterSeed is None:
+        bootIC.masterSeed = int(np.random.randint(2**31 - 1))
+        print(f"\nMaster seed of bootstrap replicas: {bootIC.masterSeed}")
+    seedSeq = np.random.SeedSequence(bootIC.masterSeed)
+    return [np.random.default_rng(seed) for seed in seedSeq.spawn(nSamples)]
+
+
+# State of the workers running bootstrap replicas, set by initBootWorker() in each worker
+bootWorkerState = {}
+
+
+def runReplicasParallel(bootResults, bckwdIC, fwdIC, bootIC, yFitIC, parentData, replicaIdxs, rngs):
+    """
+    Runs ranges of replicas in forked worker processes, each with its own copy of the Mantid ADS.
+    Results are merged into bootResults in replica order.
+    """
+    nChunks = max(1, min(len(replicaIdxs), 4*bootIC.nWorkers))    # Smaller ranges to balance workers
+    chunks = np.array_split(np.array(replicaIdxs), nChunks)
+
+    with tempfile.TemporaryDirectory() as scratchDir:
+        initArgs = (bckwdIC, fwdIC, bootIC, yFitIC, bootResults, parentData, rngs, scratchDir)
+        with ProcessPoolExecutor(bootIC.nWorkers, mp_context=mp.get_context("fork"), initializer=initBootWorker, initargs=initArgs) as executor:
+            futures = [executor.submit(replicaRangeWorker, idxs) for idxs in chunks]
+
+            for future in futures:
+                idxs, rows = future.result()
+                for key in bootResults:
+                    bootResults[key].storeReplicaRows(idxs, rows[key])
+                flushBootstrapStores(bootResults)
+    return
+
+
+def initBootWorker(bckwdIC, fwdIC, bootIC, yFitIC, bootResults, parentData, rngs, scratchDir):
+    AnalysisDataService.clear()     # Forked copy of the ADS, not shared with the parent
+
+    # Results of single replicas are overwritten at each iteration, keep them away from other workers
+    workerDir = Path(scratchDir) / str(os.getpid())
+    workerDir.mkdir()
+    for IC in [bckwdIC, fwdIC]:
+        IC.resultsSavePath = workerDir / IC.resultsSavePath.name
+        IC.ySpaceFitSavePath = workerDir / IC.ySpaceFitSavePath.name
+    yFitIC.figSavePath = workerDir
+
+    bootWorkerState["ICs"] = (bckwdIC, fwdIC, bootIC, yFitIC)
+    bootWorkerState["bootResults"] = bootResults
+    bootWorkerState["parentData"] = parentData
+    bootWorkerState["rngs"] = rngs
+
+
+def replicaRangeWorker(idxs):
+    bootResults = bootWorkerState["bootResults"]
+    for i in idxs:
+        iterResults = runReplica(*bootWorkerState["ICs"], bootWorkerState["parentData"], i, bootWorkerState["rngs"][i])
+        storeBootIter(bootResults, i, iterResults)
+    AnalysisDataService.clear()
+    return idxs, {key: bootResults[key].replicaRows(idxs) for key in bootResults}
+
+
 def askUserConfirmation(bckwdIC, fwdIC, bootIC):
     """Estimates running time for all samples and asks the user to confirm the run."""
     
     if not(bootIC.userConfirmation):   # Skip user confirmation 
         return
 
-    tDict = storeRunnningTime(fwdIC, bckwdIC, bootIC)   # Run times file path stores in bootIC
-
-    proc = bootIC.procedure
-    runTime = 0
-    if (proc=="BACKWARD") | (proc=="JOINT"):
-        runTime += calcRunTime(bckwdIC, tDict["tBackNoMS"], tDict["tBackPerMS"], bootIC)
-
-    if (proc=="FORWARD") | (proc=="JOINT"):
-        runTime += calcRunTime(fwdIC, tDict["tFowNoMS"], tDict["tFowPerMS"], bootIC)
+    runTime = estimateBootstrapRunTime(bckwdIC, fwdIC, bootIC, loadRunTimes(bckwdIC.runTimesPath))
+    if runTime is None:
+        message = "\n\nNo run times of this sample stored yet, unable to estimate time for Bootstrap procedure."
+    else:
+        message = f"\n\nEstimated time for Bootstrap procedure: {runTime/3600:.1f} hours."
 
-    userInput = input(f"\n\nEstimated time for Bootstrap procedure: {runTime/60:.1f} hours.\nProceed? (y/n): ")
+    userInput = input(message + "\nProceed? (y/n): ")
     if (userInput == "y") or (userInput == "Y"):
         return
     else:
         raise KeyboardInterrupt ("Bootstrap procedure interrupted.")
 
 
-def storeRunnningTime(fwdIC, bckwdIC, bootIC):
-    """Used to write run times to txt file."""
+def bootstrapICs(bckwdIC, fwdIC, bootIC):
+    proc = bootIC.procedure
+    ICs = []
+    if (proc=="BACKWARD") | (proc=="JOINT"):
+        ICs.append(bckwdIC)
+    if (proc=="FORWARD") | (proc=="JOINT"):
+        ICs.append(fwdIC)
+    return ICs
 
-    savePath = bootIC.runTimesPath
 
-    if not(savePath.is_file()):
-        with open(savePath, "w") as txtFile:
-            txtFile.write("This file stores run times to estimate Bootstrap total run time.")
-            txtFile.write("\nTime in minutes.\n\n")
-    
-    resDict = {}
-    with open(savePath, "r") as txtFile:
-        for line in txtFile:
-            if line[0]=="{":   # If line contains dictionary
-                resDict = eval(line)
+def estimateBootstrapRunTime(bckwdIC, fwdIC, bootIC, runTimes):
+    """
+    Estimated seconds for the parent procedure and all replicas, from run times stored by previous runs of the sample.
+    Time of replicas is calibrated with previous bootstrap runs with the same no of workers.
+    Returns None if no procedure of the sample was timed yet.
+    """
+    tParent, tReplicas = 0, 0
+    for IC in bootstrapICs(bckwdIC, fwdIC, bootIC):
+        tFit, tCorrection = stageRunTimes(IC, runTimes)
+        if tFit is None:
+            return None
 
-    if len(resDict)<4:
-        ans = input("Did not find necessary information to estimate runtime. Will run a short routine to store an estimate. Please wait until this is finished. Press any key to continue.")
-        resDict = buildRunTimes(fwdIC, bckwdIC)
+        tParent += procedureRunTime(IC.noOfMSIterations, tFit, tCorrection)
+        tReplicas += noOfReplicas(IC, bootIC) * procedureRunTime(replicaMSIterations(IC, bootIC), tFit, tCorrection)
+    return tParent + tReplicas * workersCalibration(bootIC, runTimes)
 
-        with open(savePath, "a") as txtFile:
-            print(resDict, file=txtFile)
 
-    return resDict
+def stageRunTimes(IC, runTimes):
+    """
+    Time of a single NCP fit and of a single MS and gamma correction of IC, scaled from the stored procedures.
+    Fits scale with no of spectra, bins and masses, corrections with no of spectra and bins.
+    Procedures of the same mode are used if available, (None, None) if there are none stored.
+    """
+    records = [r for r in runTimes["procedures"] if r["mode"]==IC.modeRunning] or runTimes["procedures"]
+    if len(records) == 0:
+        return None, None
 
+    fitUnits = lambda r: r["nSpec"] * r["nBins"] * r["nMasses"]
+    correctionUnits = lambda r: r["nSpec"] * r["nBins"]
+    scales = IC.runTimeScales
 
-def buildRunTimes(fwdIC, bckwdIC):
-    resDict = {}
-    for IC, mode in zip([bckwdIC, fwdIC], ["Back", "Fow"]):
-        oriMS = IC.noOfMSIterations
-        for NIter, key in zip([0, 1], ["NoMS", "PerMS"]):
-            IC.noOfMSIterations = NIter
-            t0 = time.time()
-            runIndependentIterativeProcedure(IC)
-            t1 = time.time()
-            resDict["t"+mode+key] = (t1-t0) / 60
-        # Restore starting value
-        IC.noOfMSIterations = oriMS
+    tFit = np.median([t / fitUnits(r) for r in records for t in r["tFits"]]) * fitUnits(scales)
 
-        # Correct times of only MS by subtacting time spend on fitting ncps
-        resDict["t"+mode+"PerMS"] -= 2 * resDict["t"+mode+"NoMS"]   
+    sameCorrections = [r for r in records if (r["MSCorrection"], r["GammaCorrection"]) == (IC.MSCorrectionFlag, IC.GammaCorrectionFlag)]
+    correctionRates = [t / correctionUnits(r) for r in (sameCorrections or records) for t in r["tCorrections"]]
+    tCorrection = np.median(correctionRates) * correctionUnits(scales) if correctionRates else 0   # No MS iterations timed yet
+    return tFit, tCorrection
 
-    return resDict
 
+def procedureRunTime(noOfMSIterations, tFit, tCorrection):
+    return (noOfMSIterations + 1) * tFit + noOfMSIterations * tCorrection
 
-def calcRunTime(IC, tNoMS, tPerMS, bootIC):
-    if bootIC.skipMSIterations:
-        timePerSample = tNoMS
-    else:
-        timePerSample = tNoMS + (IC.noOfMSIterations) * (tNoMS+tPerMS)
 
-    nSamples = bootIC.nSamples 
-    if bootIC.runningJackknife:
-        nSamples = 3 if bootIC.runningTest else noOfHistsFromTOFBinning(IC)
+def replicaMSIterations(IC, bootIC):
+    return 0 if bootIC.skipMSIterations else IC.noOfMSIterations
+
+
+def noOfReplicas(IC, bootIC):
+    if not(bootIC.runningJackknife):
+        return bootIC.nSamples
+    if bootIC.infinitesimalJackknife:   # Only the parent procedure is run
+        return 0
+    return 3 if bootIC.runningTest else noOfJackknifeGroups(noOfHistsFromTOFBinning(IC), bootIC)
+
+
+def workersCalibration(bootIC, runTimes):
+    """
+    Median ratio of measured to estimated serial time of replicas, from previous bootstrap runs with the same no of workers.
+    Includes time not spent in the procedures, like fits in y space.
+    Without previous runs, replicas are assumed to be split evenly between workers.
+    """
+    ratios = [r["tReplicas"] / r["tEstimate"] for r in runTimes["bootstrap"] if (r["nWorkers"]==bootIC.nWorkers) and (r["tEstimate"]>0)]
+    if len(ratios) == 0:
+        return 1 / max(1, bootIC.nWorkers)
+    return np.median(ratios)
+
+
+def saveBootstrapRunTimes(bckwdIC, fwdIC, bootIC, nReplicas, tReplicas):
+    """Stores measured time of replicas with its serial estimate, to calibrate future estimates."""
+    if (nReplicas == 0) or not(bckwdIC.saveRunTimes):
+        return
+
+    runTimes = loadRunTimes(bckwdIC.runTimesPath)   # Includes the parent procedure that just ran
+    tEstimate = 0
+    for IC in bootstrapICs(bckwdIC, fwdIC, bootIC):
+        tFit, tCorrection = stageRunTimes(IC, runTimes)
+        if tFit is None:
+            return
+        tEstimate += nReplicas * procedureRunTime(replicaMSIterations(IC, bootIC), tFit, tCorrection)
+
+    record = {"procedure": bootIC.procedure, "runningJackknife": bootIC.runningJackknife, "nWorkers": bootIC.nWorkers, 
+              "nReplicas": nReplicas, "tReplicas": tReplicas, "tEstimate": tEstimate}
+    appendRunTimes(bckwdIC.runTimesPath, "bootstrap", record)
+    return
 
-    return  nSamples * timePerSample
-    
 
 def chooseLoopRange(bootIC, nSamples):
     iStart = 0
@@ -196,16 +382,35 @@ def runOriginalBeforeBootstrap(bckwdIC, fwdIC, bootIC, yFitIC):
     """Runs unaltered procedure to store parent results and select parent ws"""
 
     setICsToDefault(bckwdIC, fwdIC, yFitIC)
+
+    # Parent MS and gamma corrections at each iteration are cached when replicas may reuse them
+    for IC in [bckwdIC, fwdIC]:
+        IC.parentCorrections = None if replicaCorrectionsTol(bootIC) is None else {}
+
     parentResults = runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC)
     parentWSnNCPs = selectParentWorkspaces(bckwdIC, fwdIC, bootIC)
 
     return parentResults, parentWSnNCPs
 
 
+def replicaCorrectionsTol(bootIC):
+    """
+    Relative drift of the mean widths and intensity ratios of a replica from the parent ones
+    up to which replicas reuse the parent MS and gamma corrections, None to always recompute them.
+    """
+    if bootIC.replicaCorrections == "RECOMPUTE":
+        return None
+    elif bootIC.replicaCorrections == "REUSE":
+        return np.inf
+    elif bootIC.replicaCorrections == "DRIFT":
+        return bootIC.correctionsDriftTol
+    raise ValueError(f"Replica corrections {bootIC.replicaCorrections} not recognized, use 'RECOMPUTE', 'REUSE' or 'DRIFT'.")
+
+
 def chooseNSamples(bootIC, parentWSnNCPs: dict):
     """
     Returns number of samples to run.
-    If Jackknife is running, no of samples is the number of bins in the workspace."""
+    If Jackknife is running, no of samples is the number of groups of bins in the workspace."""
 
     nSamples = bootIC.nSamples
     if bootIC.runningJackknife:
@@ -213,7 +418,7 @@ def chooseNSamples(bootIC, parentWSnNCPs: dict):
         if bootIC.procedure=="FORWARD": key = "fwdWS"
         elif bootIC.procedure=="BACKWARD": key = "bckwdWS"
 
-        nSamples = parentWSnNCPs[key].blocksize()-1   # -1 becuase last column is ignored during procedure
+        nSamples = noOfJackknifeGroups(parentWSnNCPs[key].blocksize()-1, bootIC)   # -1 becuase last column is ignored during procedure
     return nSamples
 
 
@@ -229,15 +434,26 @@ def setICsToDefault(bckwdIC, fwdIC, yFitIC):
     # Don't show plots
     if yFitIC.showPlots: yFitIC.showPlots = False
 
+    # Replicas never repeat inputs, don't store cache of fit results
+    if yFitIC.useYFitCache: yFitIC.useYFitCache = False
+
     if bckwdIC.runningSampleWS: bckwdIC.runningSampleWS = False
     if fwdIC.runningSampleWS: fwdIC.runningSampleWS = False
+
+    # Parent fit starts from initial parameters, even if replicas of a previous run were warm started
+    bckwdIC.replicaInitPars = None
+    fwdIC.replicaInitPars = None
     return
 
 
-def runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC):
-    """Decides main procedure to run based on the initial conditions offered as inputs."""
+def runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC, batchYFit=False):
+    """
+    Decides main procedure to run based on the initial conditions offered as inputs.
+    With batchYFit, stops at the weighted avg in y space, to be fitted later together with other replicas.
+    """
 
     resultsDict = {}
+    yFitProcedure = ySpaceAvgProcedure if batchYFit else fitInYSpaceProcedure
 
     if (bootIC.procedure=="FORWARD") | (bootIC.procedure=="BACKWARD"):
 
@@ -248,7 +464,7 @@ def runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC):
                 resultsDict[key+"Scat"] = bckwdScatRes
 
                 if not(bootIC.runningJackknife):
-                    bckwdYFitRes = fitInYSpaceProcedure(yFitIC, IC, wsFinal)
+                    bckwdYFitRes = yFitProcedure(yFitIC, IC, wsFinal)
                     resultsDict[key+"YFit"] = bckwdYFitRes
 
     
@@ -263,7 +479,7 @@ def runMainProcedure(bckwdIC, fwdIC, bootIC, yFitIC):
 
                 if (bootIC.fitInYSpace==mode) | (bootIC.fitInYSpace=="JOINT"):
                     wsName = buildFinalWSName(IC.scriptName, mode, IC)  
-                    fwdYFitRes = fitInYSpaceProcedure(yFitIC, IC, mtd[wsName])
+                    fwdYFitRes = yFitProcedure(yFitIC, IC, mtd[wsName])
                     resultsDict[key+"YFit"] = fwdYFitRes
     else:
         raise ValueError("Bootstrap procedure not recognized.")
@@ -333,42 +549,176 @@ def initializeResults(parentResults: dict, nSamples, corrCoefs):
     return bootResultObjs
 
 
-class BootScattResults:
+def samplesStorePath(savePath):
+    return savePath.parent / (savePath.stem + "_samples.npy")
+
+
+class BootSamplesStore:
+    """
+    Keeps bootSamples in a preallocated .npy file mapped in memory while replicas run,
+    such that each replica writes only its own rows to disk.
+    Other arrays with one row per replica listed in storedArrays are kept next to it in the same way.
+    Consolidated into the .npz file once all replicas are finished.
+    A .json checkpoint with the settings of the run allows to resume it if interrupted.
+    """
+    storedArrays = ["bootSamples"]
+
+    def setStorePaths(self, IC):
+        self.storePath = samplesStorePath(self.savePath(IC))
+        self.checkpointPath = self.storePath.with_suffix(".json")
+
+    def arrayStorePath(self, attr):
+        if attr == "bootSamples":
+            return self.storePath
+        return self.storePath.with_name(self.storePath.stem + "_" + attr + ".npy")
+
+    def readCheckpoint(self, IC):
+        """Settings of the interrupted run, None if there is no run to resume."""
+        self.setStorePaths(IC)
+        if not(self.storePath.is_file()):
+            return None
+        with open(self.checkpointPath, "r") as jsonFile:
+            return json.load(jsonFile)
+
+    def openStore(self, IC, bootIC):
+        self.setStorePaths(IC)
+        resuming = bootIC.resumeRun and self.storePath.is_file()
+
+        for attr in self.storedArrays:
+            arr, path = getattr(self, attr), self.arrayStorePath(attr)
+
+            if resuming:
+                store = np.lib.format.open_memmap(path, mode="r+")
+                if store.shape != arr.shape:
+                    raise ValueError(f"Samples in {path.name} do not match the shape of current run.")
+            else:
+                store = np.lib.format.open_memmap(path, mode="w+", dtype=arr.dtype, shape=arr.shape)
+                store[:] = arr
+                store.flush()
+            setattr(self, attr, store)
+
+        if not(resuming):
+            with open(self.checkpointPath, "w") as jsonFile:
+                json.dump(runCheckpoint(bootIC, self.logString(IC)), jsonFile)
+
+    def completedReplicas(self):
+        """Replicas stored so far, since samples are initialized with nans."""
+        return ~np.all(np.isnan(self.bootSamples.reshape(len(self.bootSamples), -1)), axis=1)
+
+    def flushStore(self):
+        for attr in self.storedArrays:
+            if isinstance(getattr(self, attr), np.memmap):
+                getattr(self, attr).flush()
+
+    def closeStore(self):
+        if not(isinstance(self.bootSamples, np.memmap)):
+            return
+        for attr in self.storedArrays:
+            setattr(self, attr, np.array(getattr(self, attr)))
+            self.arrayStorePath(attr).unlink()
+        self.checkpointPath.unlink()
+
+
+class BootScattResults(BootSamplesStore):
+    storedArrays = ["bootSamples", "bootIterations"]
 
     def __init__(self, parentResults, nSamples, corr):
         self.parentResult = parentResults.all_spec_best_par_chi_nit[-1]
         self.bootSamples = np.full((nSamples, *self.parentResult.shape), np.nan)
         self.corrResiduals = corr
 
+        # Total fit iterations over all spectra at each MS iteration
+        self.parentIterations = totalFitIterations(parentResults)
+        self.bootIterations = np.full((nSamples, len(self.parentIterations)), np.nan)
+
     def storeBootIterResults(self, j, bootResult):
         self.bootSamples[j] = bootResult.all_spec_best_par_chi_nit[-1]
+        iterations = totalFitIterations(bootResult)
+        self.bootIterations[j, -len(iterations):] = iterations     # Skipping MS, single iteration aligned with last of parent
+
+    def replicaRows(self, idxs):
+        return self.bootSamples[idxs], self.bootIterations[idxs]
+
+    def savePath(self, IC):
+        return IC.bootSavePath
+
+    def logString(self, IC):
+        return IC.bootSavePathLog
+
+    def storeReplicaRows(self, idxs, rows):
+        self.bootSamples[idxs], self.bootIterations[idxs] = rows
     
     def saveResults(self, IC):
-        np.savez(IC.bootSavePath, boot_samples=self.bootSamples,
-             parent_result=self.parentResult, corr_residuals=self.corrResiduals)
+        np.savez(IC.bootSavePath, boot_samples=np.asarray(self.bootSamples),
+             parent_result=self.parentResult, corr_residuals=self.corrResiduals,
+             boot_iterations=np.asarray(self.bootIterations), parent_iterations=self.parentIterations)
 
     def saveLog(self, IC):
         with open(IC.logFilePath, "a") as logFile:
-            logFile.write("\n"+IC.bootSavePathLog)
+            logFile.write("\n"+self.logString(IC))
+
 
+def totalFitIterations(scatResults):
+    return np.nansum(scatResults.all_spec_best_par_chi_nit[:, :, -1], axis=1)
 
-class BootYFitResults:
+
+class BootYFitResults(BootSamplesStore):
+    # Weighted avgs in y space of replicas waiting for batch fit, kept on disk to resume interrupted runs
+    storedArrays = ["bootSamples", "replicasX", "replicasY", "replicasE"]
 
     def __init__(self, parentResults, nSamples):
         self.parentPopt = parentResults.popt
         self.parentPerr = parentResults.perr
+        self.parentResolution = parentResults.resolution
         self.bootSamples = np.full((nSamples, *self.parentPopt.shape), np.nan)
+        nBins = parentResults.YSpaceSymSumDataY.shape[-1]
+        self.replicasX, self.replicasY, self.replicasE = [np.full((nSamples, nBins), np.nan) for i in range(3)]
 
     def storeBootIterResults(self, j, bootResult):
+        if isinstance(bootResult, ResultsYSpaceAvgObject):
+            self.replicasX[j], self.replicasY[j], self.replicasE[j] = bootResult.dataX, bootResult.dataY, bootResult.dataE
+            return
         self.bootSamples[j] = bootResult.popt
+
+    def replicaRows(self, idxs):
+        return self.bootSamples[idxs], self.replicasX[idxs], self.replicasY[idxs], self.replicasE[idxs]
+
+    def storeReplicaRows(self, idxs, rows):
+        self.bootSamples[idxs], self.replicasX[idxs], self.replicasY[idxs], self.replicasE[idxs] = rows
+
+    def waitingBatchFit(self):
+        """Replicas with weighted avg in y space stored but not fitted yet."""
+        return ~np.all(np.isnan(self.replicasY), axis=1) & ~super().completedReplicas()
+
+    def completedReplicas(self):
+        """Replicas fitted or waiting for batch fit."""
+        return super().completedReplicas() | self.waitingBatchFit()
+
+    def savePath(self, IC):
+        return IC.bootYFitSavePath
+
+    def logString(self, IC):
+        return IC.bootYFitSavePathLog
+
+    def fitReplicasBatch(self, yFitIC):
+        """Fits all stored replicas together, including the ones of an interrupted run, results stored in the row of Minuit fit."""
+        idxs = np.flatnonzero(self.waitingBatchFit())
+        if len(idxs) == 0:
+            return
+
+        popt, perr = fitYSpaceBatch(yFitIC, self.replicasX[idxs], self.replicasY[idxs], self.replicasE[idxs], 
+                                    self.parentResolution[0], self.parentPopt[0])
+
+        self.bootSamples[idxs, 0, :] = 0      # Same padding with zeros as the parent
+        self.bootSamples[idxs, 0, :popt.shape[1]] = popt
     
     def saveResults(self, IC):
-        np.savez(IC.bootYFitSavePath, boot_samples=self.bootSamples,
+        np.savez(IC.bootYFitSavePath, boot_samples=np.asarray(self.bootSamples),
              parent_popt=self.parentPopt, parent_perr=self.parentPerr)    
 
     def saveLog(self, IC):
         with open(IC.logFilePath, "a") as logFile:
-            logFile.write("\n"+IC.bootYFitSavePathLog)
+            logFile.write("\n"+self.logString(IC))
 
 
 def storeBootIter(bootResultObjs: dict, j: int, bootIterResults: dict):
@@ -377,27 +727,126 @@ def storeBootIter(bootResultObjs: dict, j: int, bootIterResults: dict):
     return
 
 
-def saveBootstrapResults(bootResultObjs: dict, bckwdIC, fwdIC):
+def resultsWithIC(bootResultObjs: dict, bckwdIC, fwdIC):
+    """Pairs each results object with the IC of its mode."""
     for key, IC in zip(["bckwd", "fwd"], [bckwdIC, fwdIC]):
         for res in ["Scat", "YFit"]:
             if key+res in bootResultObjs:
-                bootResultObjs[key+res].saveResults(IC)
+                yield bootResultObjs[key+res], IC
+
+
+def saveBootstrapResults(bootResultObjs: dict, bckwdIC, fwdIC):
+    for bootResult, IC in resultsWithIC(bootResultObjs, bckwdIC, fwdIC):
+        bootResult.saveResults(IC)
     return
 
 
 def saveBootstrapLogs(bootResultObjs: dict, bckwdIC, fwdIC):
-    for key, IC in zip(["bckwd", "fwd"], [bckwdIC, fwdIC]):
-        for res in ["Scat", "YFit"]:
-            if key+res in bootResultObjs:
-                bootResultObjs[key+res].saveLog(IC)
+    for bootResult, IC in resultsWithIC(bootResultObjs, bckwdIC, fwdIC):
+        bootResult.saveLog(IC)
+    return
+
+
+def openBootstrapStores(bootResultObjs: dict, bckwdIC, fwdIC, bootIC):
+    for bootResult, IC in resultsWithIC(bootResultObjs, bckwdIC, fwdIC):
+        bootResult.openStore(IC, bootIC)
     return
 
 
-def convertWSToSavePaths(parentWSnNCPs: dict):
-    savePaths = {}
-    for key in parentWSnNCPs:
-        savePaths[key] = saveWorkspacesLocally(parentWSnNCPs[key])
-    return savePaths
+# Settings of bootIC that need to match to resume an interrupted run
+checkpointAttrs = ["procedure", "fitInYSpace", "runningJackknife", "runningTest", "nSamples", "skipMSIterations", "batchYFit", "blockBootstrap",
+                   "jackknifeGroupSize", "jackknifeGrouping", "infinitesimalJackknife", "warmStartReplicas", "replicaCorrections", 
+                   "correctionsDriftTol", "masterSeed"]
+
+
+def runCheckpoint(bootIC, log):
+    return {"log": log, "bootIC": {attr: getattr(bootIC, attr) for attr in checkpointAttrs}}
+
+
+def resumeFromCheckpoints(bootResultObjs: dict, bckwdIC, fwdIC, bootIC):
+    """
+    Checks that settings of current run match the ones of the interrupted run and restores its master seed.
+    Returns False if there is no interrupted run to resume.
+    """
+    resumed = False
+    for bootResult, IC in resultsWithIC(bootResultObjs, bckwdIC, fwdIC):
+        checkpoint = bootResult.readCheckpoint(IC)
+        if checkpoint is None:
+            continue
+
+        if bootIC.masterSeed is None:
+            bootIC.masterSeed = checkpoint["bootIC"]["masterSeed"]
+
+        if runCheckpoint(bootIC, bootResult.logString(IC)) != checkpoint:
+            raise ValueError(f"Settings of current run do not match the ones of interrupted run:\n{checkpoint}")
+        resumed = True
+    return resumed
+
+
+def missingReplicas(bootResultObjs: dict, iStart, iEnd):
+    """Replicas in the loop range not yet stored in all of the results."""
+    completed = np.all([bootResultObjs[key].completedReplicas() for key in bootResultObjs], axis=0)
+    return [i for i in range(iStart, iEnd) if not(completed[i])]
+
+
+def flushBootstrapStores(bootResultObjs: dict):
+    """Writes to disk only the rows of the replicas stored since the last flush."""
+    for key in bootResultObjs:
+        bootResultObjs[key].flushStore()
+    return
+
+
+def closeBootstrapStores(bootResultObjs: dict):
+    for key in bootResultObjs:
+        bootResultObjs[key].closeStore()
+    return
+
+
+def storeParentData(parentResults: dict, parentWSnNCPs: dict, corrCoefs: dict, bootIC):
+    """
+    Keeps parent ws and ncp in memory to form each replica, together with the parent best fit parameters.
+    Saved to disk only once, for inspection after the run.
+    """
+    parentData = {}
+    for key in ["bckwd", "fwd"]:
+        try:
+            parentWS = parentWSnNCPs[key+"WS"]
+            parentNCP = parentWSnNCPs[key+"NCP"]
+        except KeyError: continue
+
+        savePath = saveWorkspacesLocally(parentWS)
+        saveWorkspacesLocally(parentNCP)
+        parentData[key] = ParentData(parentWS, parentNCP, savePath.stem)
+        parentData[key].fitPars = np.nan_to_num(parentResults[key+"Scat"].all_spec_best_par_chi_nit[:, :, 1:-2])   # Masked spectra start from initPars
+
+        if bootIC.blockBootstrap:
+            parentData[key].blockLengths = blockLengthsFromCorr(corrCoefs[key+"Scat"], parentData[key].residuals.shape[1])
+            print(f"\nBlock lengths of residuals in {key} spectra:\n{parentData[key].blockLengths}")
+    return parentData
+
+
+class ParentData:
+    """
+    Copies of parent ws and ncp outside of the ADS, which is cleared at each replica, and their arrays.
+    Forked workers share these copies with the main process.
+    """
+    def __init__(self, parentWS, parentNCP, name):
+        self.name = name
+        self.ws = CloneWorkspace(parentWS, StoreInADS=False)
+        self.ncpWS = CloneWorkspace(parentNCP, StoreInADS=False)
+
+        self.dataY = parentWS.extractY()
+        self.dataE = parentWS.extractE()
+        self.totNcp = parentNCP.extractY()
+        self.residuals = self.dataY[:, :-1] - self.totNcp
+        self.blockLengths = None    # Resampling of single points
+        self.fitPars = None         # Per-spectrum best fit parameters at each MS iteration
+
+    def addToADS(self):
+        """Parent ws is needed in the ADS by name for the corrections of jackknife replicas."""
+        AnalysisDataService.addOrReplace(self.name, self.ws)
+        AnalysisDataService.addOrReplace(self.name+"_NCP", self.ncpWS)
+        return mtd[self.name], mtd[self.name+"_NCP"]
 
 
 def saveWorkspacesLocally(ws):
@@ -418,43 +867,31 @@ def saveWorkspacesLocally(ws):
     return savePath 
 
 
-def createSampleWS(parentWSNCPSavePaths: dict, j: int, bootIC):
+def createSampleWS(parentData: dict, j: int, bootIC, rng=None):
 
     if bootIC.runningJackknife:
-        return createJackknifeWS(parentWSNCPSavePaths, j)
+        return createJackknifeWS(parentData, j, bootIC)
     else:
-        return createBootstrapWS(parentWSNCPSavePaths)
+        return createBootstrapWS(parentData, rng)
 
 
-def createBootstrapWS(parentWSNCPSavePaths:dict):
+def createBootstrapWS(parentData: dict, rng=None):
     """
     Creates bootstrap ws replica.
-    Inputs: Experimental (parent) workspace and corresponding NCP total fit
+    Inputs: Experimental (parent) data and corresponding NCP total fit
     """
 
     bootInputWS = {}
     parentInputWS = {} 
-    for key in ["bckwd", "fwd"]:
-        try:
-            parentWSPath = parentWSNCPSavePaths[key+"WS"]
-            totNcpWSPath = parentWSNCPSavePaths[key+"NCP"]
-        except KeyError: continue
-
-        parentWS, totNcpWS = loadWorkspacesFromPath(parentWSPath, totNcpWSPath)
-
-        dataY = parentWS.extractY()[:, :-1]
-        totNcp = totNcpWS.extractY()[:, :]     
-
-        residuals = dataY - totNcp
+    for key, parent in parentData.items():
+        parentWS, totNcpWS = parent.addToADS()
 
-        bootRes = bootstrapResidualsSample(residuals)
-        bootDataY = totNcp + bootRes
+        bootRes = bootstrapResidualsSample(parent.residuals, rng, parent.blockLengths)
+        bootDataY = parent.totNcp + bootRes
 
-        wsBoot = CloneWorkspace(parentWS, OutputWorkspace=parentWS.name()+"_Bootstrap")
-        for i, row in enumerate(bootDataY):
-            wsBoot.dataY(i)[:-1] = row     # Last column will be ignored in ncp fit anyway
-
-        assert np.all(wsBoot.extractY()[:, :-1] == bootDataY), "Bootstrap data not being correctly passed onto ws."
+        wsBootY = parent.dataY.copy()
+        wsBootY[:, :-1] = bootDataY     # Last column will be ignored in ncp fit anyway
+        wsBoot = passDataIntoWS(parentWS, wsBootY, parent.dataE, parentWS.name()+"_Bootstrap")
 
         bootInputWS[key+"WS"] = wsBoot
         parentInputWS[key+"WS"] = parentWS
@@ -462,48 +899,56 @@ def createBootstrapWS(parentWSNCPSavePaths:dict):
     return bootInputWS, parentInputWS
 
 
-def bootstrapResidualsSample(residuals):
-    """Randomly choose points from residuals of each spectra (same statistical weigth)"""
+def bootstrapResidualsSample(residuals, rng=None, blockLengths=None):
+    """
+    Randomly choose points from residuals of each spectra (same statistical weigth), all spectra drawn at once.
+    With blockLengths, chooses moving blocks of consecutive points instead, with one length for each spectra.
+    Uses the global numpy random state when no generator is given.
+    """
+    randint = np.random.randint if rng is None else rng.integers
 
-    bootRes = np.zeros(residuals.shape)
-    for i, res in enumerate(residuals):
-        rowIdxs = np.random.randint(0, len(res), len(res))    # [low, high)
-        bootRes[i] = res[rowIdxs]
-    return bootRes
+    nSpec, nBins = residuals.shape
+    if blockLengths is None:
+        blockLengths = np.ones(nSpec, dtype=int)
+    blockLengths = blockLengths[:, np.newaxis]
 
+    # Draws one start for each bin, only the first ceil(nBins/blockLength) are used
+    blockStarts = randint(0, nBins-blockLengths+1, (nSpec, nBins))    # [low, high)
+    bins = np.arange(nBins)
+    rowIdxs = np.take_along_axis(blockStarts, bins // blockLengths, axis=1) + bins % blockLengths
+    return np.take_along_axis(residuals, rowIdxs, axis=1)
 
-def createJackknifeWS(parentWSNCPSavePaths: list, j: int):
+
+def blockLengthsFromCorr(corr, nBins):
     """
-    Creates jackknife ws replicas.
-    Inputs: Experimental (parent) workspace and corresponding NCP total fit
+    Block lengths for moving block bootstrap of residuals of each spectra.
+    Uses the plug-in rule for an AR(1) process with the lag-1 correlation rho from autoCorrResiduals():
+    (3*nBins/2)**(1/3) * (2*rho/(1-rho**2))**(2/3)
     """
+    rho = np.clip(np.nan_to_num(corr[:, 0]), 0, 0.99)    # Masked spectra and negative correlations use single points
+    blockLengths = np.ceil((1.5*nBins)**(1/3) * (2*rho/(1-rho**2))**(2/3))
+    return np.clip(blockLengths, 1, nBins).astype(int)
 
-    jackInputWS = {}
-    parentInputWS = {} 
-    for key in ["bckwd", "fwd"]:
-        try:
-            parentWSPath = parentWSNCPSavePaths[key+"WS"]
-            totNcpWSPath = parentWSNCPSavePaths[key+"NCP"]
-        except KeyError: continue
-
-        parentWS, totNcpWS = loadWorkspacesFromPath(parentWSPath, totNcpWSPath)
 
-        dataY = parentWS.extractY()[:, :-1]
-        dataE = parentWS.extractE()[:, :-1]
+def createJackknifeWS(parentData: dict, j: int, bootIC):
+    """
+    Creates jackknife ws replicas, deleting the jth group of columns.
+    Inputs: Experimental (parent) data and corresponding NCP total fit
+    """
 
-        jackDataY = dataY.copy()
-        jackDataE = dataE.copy()
+    jackInputWS = {}
+    parentInputWS = {} 
+    for key, parent in parentData.items():
+        parentWS, totNcpWS = parent.addToADS()
 
-        jackDataY[:, j] = 0   # Masks j collumn with zeros
-        jackDataE[:, j] = 0   # The fit fails if these errors are accidentally used
+        jackDataY = parent.dataY.copy()
+        jackDataE = parent.dataE.copy()
 
-        wsJack = CloneWorkspace(parentWS, OutputWorkspace=parentWS.name()+"_Jackknife")
-        for i, (yRow, eRow) in enumerate(zip(jackDataY, jackDataE)):
-            wsJack.dataY(i)[:-1] = yRow     # Last column will be ignored in ncp fit anyway
-            wsJack.dataE(i)[:-1] = eRow
+        cols = jackknifeColumns(j, jackDataY.shape[1]-1, bootIC)
+        jackDataY[:, cols] = 0   # Masks j group of columns with zeros, last column will be ignored in ncp fit anyway
+        jackDataE[:, cols] = 0   # The fit fails if these errors are accidentally used
 
-        assert np.all(wsJack.extractY()[:, :-1] == jackDataY), "Bootstrap data not being correctly passed onto ws."
-        assert np.all(wsJack.extractE()[:, :-1] == jackDataE), "Bootstrap data not being correctly passed onto ws."
+        wsJack = passDataIntoWS(parentWS, jackDataY, jackDataE, parentWS.name()+"_Jackknife")
 
         jackInputWS[key+"WS"] = wsJack
         parentInputWS[key+"WS"] = parentWS
@@ -511,19 +956,21 @@ def createJackknifeWS(parentWSNCPSavePaths: list, j: int):
     return jackInputWS, parentInputWS
 
 
-def loadWorkspacesFromPath(*savePaths):
-    wsList = []
-    for path in savePaths:
-        saveName = path.name.split(".")[0]
-        ws = Load(str(path), OutputWorkspace=saveName)
-        SumSpectra(ws, OutputWorkspace=ws.name()+"_Sum")
-        wsList.append(ws)
+def jackknifeColumns(j: int, nBins: int, bootIC):
+    """Columns deleted in the jth replica, in contiguous blocks or strided across the whole TOF range."""
+    if bootIC.jackknifeGrouping == "CONTIGUOUS":
+        return np.arange(j*bootIC.jackknifeGroupSize, (j+1)*bootIC.jackknifeGroupSize)
+    elif bootIC.jackknifeGrouping == "STRIDED":
+        return np.arange(j, nBins, noOfJackknifeGroups(nBins, bootIC))
+    raise ValueError(f"Jackknife grouping {bootIC.jackknifeGrouping} not recognized, use 'CONTIGUOUS' or 'STRIDED'.")
 
-    return wsList
 
-
-def formSampleIC(bckwdIC, fwdIC, bootIC, sampleInputWS:dict, parentWS:dict):
-    """Adds atributes to initial conditions to start procedure with sample ws."""
+def formSampleIC(bckwdIC, fwdIC, bootIC, sampleInputWS:dict, parentWS:dict, parentData:dict):
+    """
+    Adds atributes to initial conditions to start procedure with sample ws.
+    With warmStartReplicas, fits of each spectrum start from the parent best fit at the same MS iteration.
+    Sets the drift of means up to which MS and gamma corrections of the parent are reused.
+    """
 
     for mode, IC, key in zip(["FORWARD", "BACKWARD"], [fwdIC, bckwdIC], ["fwd", "bckwd"]):
 
@@ -537,3 +984,11 @@ def formSampleIC(bckwdIC, fwdIC, bootIC, sampleInputWS:dict, parentWS:dict):
             IC.sampleWS = sampleInputWS[key+"WS"]
             IC.parentWS = parentWS[key+"WS"]
 
+            IC.correctionsDriftTol = replicaCorrectionsTol(bootIC)
+            IC.verboseReplicas = bootIC.verboseReplicas
+
+            IC.replicaInitPars = None
+            if bootIC.warmStartReplicas:
+                fitPars = parentData[key].fitPars
+                IC.replicaInitPars = fitPars[-1:] if bootIC.skipMSIterations else fitPars   # Parent ws is the last corrected ws
+
@@ -2,7 +2,7 @@
 from xml.dom import NotFoundErr
 from vesuvio_analysis.core_functions.analysis_functions import calculateMeansAndStds, filterWidthsAndIntensities
 from vesuvio_analysis.core_functions.ICHelpers import setBootstrapDirs
-from vesuvio_analysis.core_functions.fit_in_yspace import selectModelAndPars
+from vesuvio_analysis.core_functions.fit_in_yspace import selectFitModel
 import numpy as np
 import matplotlib .pyplot as plt
 from pathlib import Path
@@ -46,6 +46,10 @@ def runAnalysisOfStoredBootstrap(bckwdIC, fwdIC, yFitIC, bootIC, analysisIC, use
         # If filer is on, check that it matches original procedure
         checkMeansProcedure(analysisIC, IC, meanWidths, meanIntensities, bootParsRaw)
 
+        if bootIC.runningJackknife:
+            nGroups = len(np.load(IC.bootSavePath)["boot_samples"])   # Including failed replicas
+            printJackknifeErrors(meanWidths, meanIntensities, nGroups)
+
         plotMeanWidthsAndIntensities(analysisIC, IC, meanWidths, meanIntensities, parentParsRaw)
         plotMeansEvolution(analysisIC, meanWidths, meanIntensities)
         plot2DHistsWidthsAndIntensities(analysisIC, meanWidths, meanIntensities)
@@ -92,6 +96,11 @@ def readBootData(dataPath):
             corrResiduals = np.array([np.nan]) 
             print("\nCorrelation of coefficients not found!\n")
 
+        try:
+            printFitIterations(bootData["boot_iterations"], bootData["parent_iterations"])
+        except KeyError:
+            pass    # Samples stored before iterations were recorded
+
         failMask = np.all(np.isnan(bootParsRaw), axis=(1, 2))
         assert failMask.shape == (len(bootParsRaw),), f"Wrong shape of masking: {failMask.shape} != {bootParsRaw.shape} "
         if np.sum(failMask) > 0:
@@ -133,6 +142,12 @@ def readYFitData(dataPath, yFitIC):
         return minFitVals
 
 
+def printFitIterations(bootIterations, parentIterations):
+    """Mean of total fit iterations of replicas at each MS iteration, compared with the parent."""
+    print(f"\nTotal fit iterations of parent at each MS iteration:\n{parentIterations}")
+    print(f"Mean over replicas:\n{np.nanmean(bootIterations, axis=0)}")
+
+
 def checkResiduals(corrRes):
     if np.all(np.isnan(corrRes)):
         return
@@ -169,6 +184,25 @@ def checkBootSamplesVSParent(bestPars, parentPars, IC):
     printResults(avgIntP, stdIntP, "Parent Intensities")
 
 
+def jackknifeStd(samples, nGroups=None):
+    """
+    Std of the delete-a-group jackknife, with one sample for each of the m groups deleted (last axis):
+    sqrt((m-1)/m * sum((samples-mean)**2)), same as the usual jackknife when each group is a single bin.
+    When some of the nGroups replicas failed, the sum over the m groups is estimated from the k samples left,
+    giving sqrt((m-1)/k * sum((samples-mean)**2)).
+    """
+    k = samples.shape[-1]
+    m = k if nGroups is None else nGroups
+    deviations = samples - np.mean(samples, axis=-1, keepdims=True)
+    return np.sqrt((m-1) / k * np.sum(deviations**2, axis=-1))
+
+
+def printJackknifeErrors(meanWidths, meanIntensities, nGroups):
+    print("\nJackknife estimates of mean widths and intensities:\n")
+    printResults(np.mean(meanWidths, axis=1), jackknifeStd(meanWidths, nGroups), "Jackknife Widths")
+    printResults(np.mean(meanIntensities, axis=1), jackknifeStd(meanIntensities, nGroups), "Jackknife Intensities")
+
+
 def printResults(arrM, arrE, mode):
     print(f"\n{mode}:\n")
     for i, (m, e) in enumerate(zip(arrM, arrE)):
@@ -448,9 +482,7 @@ def plot2DHists(bootSamples, mode):
 
 def printYFitParentPars(yFitIC, parentPopt, parentPerr):
 
-    model, defaultPars, sharedPars = selectModelAndPars(yFitIC.fitModel)
-    sig = [p for p in defaultPars]
-    sig = ["y0"] + sig       # Add intercept from outside function parameters
+    sig = ["y0"] + selectFitModel(yFitIC.fitModel).parNames       # Add intercept from outside function parameters
 
 
     print("\nParent parameters of y-sapce fit:\n")
@@ -469,9 +501,7 @@ def plotYFitHists(analysisIC, yFitIC, yFitHists):
     fig, axs = plt.subplots(2, int(np.ceil(len(yFitHists)/2)), figsize=(12, 7), tight_layout=True)
 
     # To label each histogram, extract signature of function used for the fit
-    model, defaultPars, sharedPars = selectModelAndPars(yFitIC.fitModel)
-    sig = [p for p in defaultPars]
-    sig = ["y0"] + sig       # Add intercept from outside function parameters
+    sig = ["y0"] + selectFitModel(yFitIC.fitModel).parNames       # Add intercept from outside function parameters
 
     for i, (ax, hist, par) in enumerate(zip(axs.flatten(), yFitHists, sig)):
         ax.set_title(f"Fit Parameter: {par}")
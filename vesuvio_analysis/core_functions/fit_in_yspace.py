@@ -5,11 +5,20 @@ from tracemalloc import start
 import matplotlib.pyplot as plt
 import numpy as np
 from mantid.simpleapi import *
+from mantid.api import ITableWorkspace, MatrixWorkspace
+from vesuvio_analysis.core_functions.analysis_functions import passDataIntoWS
 from scipy import optimize
-from scipy import ndimage, signal
+from scipy import ndimage, signal, sparse
 from pathlib import Path
 from iminuit import Minuit, cost, util
 from iminuit.util import make_func_code, describe
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing as mp
+import threading
+import copy
+import hashlib
+import json
+from functools import lru_cache, wraps
 import time
 
 repoPath = Path(__file__).absolute().parent  # Path to the repository
@@ -20,28 +29,135 @@ def fitInYSpaceProcedure(yFitIC, IC, wsFinal):
 
     ncpForEachMass = extractNCPFromWorkspaces(wsFinal, IC)
     wsResSum, wsRes = calculateMantidResolutionFirstMass(IC, yFitIC, wsFinal)
+    wsYSpaceAvg, wsYSpace, wsSubMass = weightedAvgYSpace(yFitIC, IC, wsFinal, ncpForEachMass)
+
+    # Plots shown during the fit are not cached, so fits run again when shown
+    useCache = yFitIC.useYFitCache and not(yFitIC.showPlots)
+    cachePath = yFitCachePath(yFitIC, IC, wsFinal, wsYSpaceAvg, wsResSum) if useCache else None
+    if useCache and cachePath.is_file():
+        print(f"\nInputs unchanged since last fit in y space, loading fits from:\n{cachePath.name}")
+        fittedMinimizers = loadYFitCache(cachePath)
+    else:
+        mantidFits = fitProfileMantidFit(yFitIC, wsYSpaceAvg, wsResSum)    # Runs in the background during Minuit fit
+        fitProfileMinuit(yFitIC, wsYSpaceAvg, wsResSum)
+        fittedMinimizers = ["Minuit"] + mantidFits.result()
+        if useCache:
+            saveYFitCache(cachePath, wsYSpaceAvg.name(), fittedMinimizers)
+    
+    printYSpaceFitResults(wsYSpaceAvg.name(), fittedMinimizers)
+
+    yfitResults = ResultsYFitObject(IC, yFitIC, wsFinal.name(), wsSubMass.name(), fittedMinimizers)
+    yfitResults.save()
+    
+    if yFitIC.globalFit:
+        runGlobalFit(wsYSpace, wsRes, IC, yFitIC) 
+    return yfitResults
+
+
+def weightedAvgYSpace(yFitIC, IC, wsFinal, ncpForEachMass):
+    """Isolates first mass, converts it to y space and performs the weighted avg of all spectra."""
 
     wsSubMass = subtractAllMassesExceptFirst(IC, wsFinal, ncpForEachMass)
     if yFitIC.maskTOFRange != None:     # Mask resonance peak
         wsSubMass = maskResonancePeak(yFitIC, wsSubMass, ncpForEachMass[:, 0, :])  # Mask with ncp from first mass
 
-    wsYSpace, wsQ = convertToYSpace(yFitIC.rebinParametersForYSpaceFit, wsSubMass, IC.masses[0]) 
+    if yFitIC.ySpaceConversion == "NUMPY":
+        wsYSpace, wsQ = convertToYSpaceNumpy(yFitIC.rebinParametersForYSpaceFit, wsSubMass, IC)
+    else:
+        wsYSpace, wsQ = convertToYSpace(yFitIC.rebinParametersForYSpaceFit, wsSubMass, IC.masses[0]) 
     wsYSpaceAvg = weightedAvg(wsYSpace)
     
     if yFitIC.symmetrisationFlag:
         wsYSpaceAvg = symmetrizeWs(wsYSpaceAvg)
+    return wsYSpaceAvg, wsYSpace, wsSubMass
 
-    fitProfileMinuit(yFitIC, wsYSpaceAvg, wsResSum)
-    fitProfileMantidFit(yFitIC, wsYSpaceAvg, wsResSum)
-    
-    printYSpaceFitResults(wsYSpaceAvg.name())
 
-    yfitResults = ResultsYFitObject(IC, yFitIC, wsFinal.name(), wsSubMass.name())
-    yfitResults.save()
-    
-    if yFitIC.globalFit:
-        runGlobalFit(wsYSpace, wsRes, IC, yFitIC) 
-    return yfitResults
+def ySpaceAvgProcedure(yFitIC, IC, wsFinal):
+    """
+    Same steps as fitInYSpaceProcedure() up to the weighted avg in y space, without any fit.
+    Used for bootstrap replicas that are fitted together at the end with fitYSpaceBatch().
+    """
+    ncpForEachMass = extractNCPFromWorkspaces(wsFinal, IC)
+    wsYSpaceAvg, wsYSpace, wsSubMass = weightedAvgYSpace(yFitIC, IC, wsFinal, ncpForEachMass)
+    return ResultsYSpaceAvgObject(wsYSpaceAvg)
+
+
+class ResultsYSpaceAvgObject:
+
+    def __init__(self, wsYSpaceAvg):
+        self.dataX, self.dataY, self.dataE = extractFirstSpectra(wsYSpaceAvg)
+
+
+def yFitCachePath(yFitIC, IC, wsFinal, wsYSpaceAvg, wsResSum):
+    """
+    Path of cached fits of the weighted avg in y space, named after a hash of the inputs of the fits:
+    weighted avg, resolution and settings of yFitIC.
+    """
+    settings = {key: value for key, value in vars(yFitIC).items() 
+                if not key.startswith("_") and key not in ["figSavePath", "showPlots"]}
+
+    hashObj = hashlib.sha1()
+    for arr in [wsYSpaceAvg.extractX(), wsYSpaceAvg.extractY(), wsYSpaceAvg.extractE(), wsResSum.extractX(), wsResSum.extractY()]:
+        hashObj.update(np.ascontiguousarray(arr).tobytes())
+    hashObj.update(repr(sorted(settings.items(), key=lambda item: item[0])).encode())
+
+    cacheDir = IC.ySpaceFitSavePath.parent / "ySpaceFitCache"
+    return cacheDir / (wsFinal.name() + "_" + hashObj.hexdigest() + ".npz")
+
+
+def fittedWorkspaceNames(wsJoYAvgName, fittedMinimizers):
+    """Names of workspaces created by the fits of the weighted avg, tables and fitted curves."""
+    names = []
+    for name in mtd.getObjectNames():
+        for minimizer in fittedMinimizers:
+            fitName = wsJoYAvgName + "_Fitted_" + minimizer
+            if name == fitName or name.startswith(fitName + "_"):
+                names.append(name)
+    return names
+
+
+def saveYFitCache(cachePath, wsJoYAvgName, fittedMinimizers):
+    """Stores the table and matrix workspaces created by the fits of the weighted avg, restored by loadYFitCache()."""
+
+    tables = {}
+    matrices = {}
+    for name in fittedWorkspaceNames(wsJoYAvgName, fittedMinimizers):
+        ws = mtd[name]
+        if isinstance(ws, ITableWorkspace):
+            columns = ws.getColumnNames()
+            tables[name] = {
+                "title": ws.getTitle(),
+                "columns": columns,
+                "types": ["str" if colType=="str" else "float" for colType in ws.columnTypes()],
+                "rows": [list(row) for row in zip(*[ws.column(col) for col in columns])]
+            }
+        elif isinstance(ws, MatrixWorkspace):
+            matrices[name] = {"X": ws.extractX(), "Y": ws.extractY(), "E": ws.extractE()}
+
+    arrays = {f"{name}_{key}": arr for name, data in matrices.items() for key, arr in data.items()}
+    cachePath.parent.mkdir(exist_ok=True)
+    np.savez(cachePath, tables=json.dumps(tables), matrices=json.dumps(list(matrices)), 
+             fittedMinimizers=json.dumps(fittedMinimizers), **arrays)
+
+
+def loadYFitCache(cachePath):
+    """Restores workspaces stored by saveYFitCache(), returns the minimizers of the cached fits."""
+
+    cache = np.load(cachePath)
+
+    for name, table in json.loads(str(cache["tables"])).items():
+        tableWS = CreateEmptyTableWorkspace(OutputWorkspace=name)
+        tableWS.setTitle(table["title"])
+        for col, colType in zip(table["columns"], table["types"]):
+            tableWS.addColumn(type=colType, name=col)
+        for row in table["rows"]:
+            tableWS.addRow(row)
+
+    for name in json.loads(str(cache["matrices"])):
+        dataY = cache[name+"_Y"]
+        CreateWorkspace(DataX=cache[name+"_X"].ravel(), DataY=dataY.ravel(), DataE=cache[name+"_E"].ravel(), 
+                        NSpec=len(dataY), OutputWorkspace=name)
+    return json.loads(str(cache["fittedMinimizers"]))
 
 
 def extractNCPFromWorkspaces(wsFinal, ic):
@@ -63,17 +179,15 @@ def maskResonancePeak(yFitIC, ws, ncp):
     # ncpTotal = np.sum(ncpForEachMass, axis=1)
     start, end = [int(s) for s in yFitIC.maskTOFRange.split(",")]
     assert start <= end, "Start value for masking needs to be smaller or equal than end."
-    dataY = ws.extractY()[:, :-1]
+    dataY = ws.extractY()
     dataX = ws.extractX()[:, :-1]
 
-    # Mask dataY with NCP in given TOF region
+    # Mask dataY with NCP in given TOF region, last column of ws is not part of ncp
     mask = (dataX >= start) & (dataX <= end)
     # dataY[mask] = ncpTotal[mask]
-    dataY[mask] = ncp[mask]
+    dataY[:, :-1][mask] = ncp[mask]
 
-    wsMasked = CloneWorkspace(ws, OutputWorkspace=ws.name()+"_Masked")
-    for i in range(wsMasked.getNumberHistograms()):
-        wsMasked.dataY(i)[:-1] = dataY[i, :]
+    wsMasked = passDataIntoWS(ws, dataY, ws.extractE(), ws.name()+"_Masked")
     SumSpectra(wsMasked, OutputWorkspace=wsMasked.name()+"_Sum")
     return wsMasked
     
@@ -115,21 +229,23 @@ def subtractAllMassesExceptFirst(ic, ws, ncpForEachMass):
     # Sum the ncpTotal for remaining masses
     ncpTotalExceptFirst = np.sum(ncpForEachMassExceptFirst, axis=0)
 
-    wsSubMass = CloneWorkspace(InputWorkspace=ws, OutputWorkspace=ws.name()+"_Mass0")
-    for j in range(wsSubMass.getNumberHistograms()):
-        if wsSubMass.spectrumInfo().isMasked(j):
-            continue
+    dataX, dataY, dataE = ws.extractX(), ws.extractY(), ws.extractE()
+
+    spectrumInfo = ws.spectrumInfo()
+    masked = np.array([spectrumInfo.isMasked(j) for j in range(ws.getNumberHistograms())])
+    masked[ic.maskedDetectorIdx] = True
 
-        # Due to different sizes, last value of original ws remains untouched
-        binWidths = wsSubMass.dataX(j)[1:] - wsSubMass.dataX(j)[:-1]
-        wsSubMass.dataY(j)[:-1] -= ncpTotalExceptFirst[j] * binWidths
+    # Due to different sizes, last value of original ws remains untouched
+    binWidths = dataX[:, 1:] - dataX[:, :-1]
+    dataY[~masked, :-1] -= ncpTotalExceptFirst[~masked] * binWidths[~masked]
 
-     # Mask spectra again, to be seen as masked from Mantid's perspective
+    wsSubMass = passDataIntoWS(ws, dataY, dataE, ws.name()+"_Mass0")
+    # Mask spectra again, to be seen as masked from Mantid's perspective
     MaskDetectors(Workspace=wsSubMass, WorkspaceIndexList=ic.maskedDetectorIdx)  
 
     SumSpectra(InputWorkspace=wsSubMass.name(), OutputWorkspace=wsSubMass.name()+"_Sum")
 
-    if np.any(np.isnan(wsSubMass.extractY())):
+    if np.any(np.isnan(dataY[~masked])):
         raise ValueError("The workspace for the isolated first mass countains NaNs in non-masked spectra, might cause problems!")
     return wsSubMass
 
@@ -162,6 +278,138 @@ def convertToYSpace(rebinPars, ws0, mass):
     return wsJoY, wsQ
 
 
+def convertToYSpaceNumpy(rebinPars, ws0, IC):
+    """
+    Same steps as convertToYSpace() but evaluated with arrays, for all spectra at once.
+    Stores results in workspaces with the same names, so the rest of the procedure is unchanged.
+    """
+    instrPars = loadInstrParsFileIntoArray(IC)
+    assert len(instrPars) == ws0.getNumberHistograms(), "Load of IP file not working correctly, probable issue with indexing."
+    efixed = ws0.getInstrument().getNumberParameter("efixed")[0]    # Final energy used by ConvertToYSpace
+
+    dataX, dataY, dataE, dataQ = convertToYSpaceArr(
+        rebinPars, ws0.extractX(), ws0.extractY(), ws0.extractE(), instrPars, IC.masses[0], efixed
+        )
+    assert np.any(np.isnan(dataY))==False, "Nans present before normalization."
+    dataY, dataE = normaliseArr(dataY, dataE, np.diff(rebinEdges(rebinPars)))
+
+    wsJoY = passArrIntoWS(ws0, dataX, dataY, dataE, ws0.name()+"_JoY")
+    wsQ = passArrIntoWS(ws0, dataX, dataQ, np.zeros(dataQ.shape), ws0.name()+"_Q")
+    return wsJoY, wsQ
+
+
+def passArrIntoWS(parentWs, dataX, dataY, dataE, wsName):
+    """Creates point data workspace in y space with instrument and masking of the parent workspace."""
+    ws = CreateWorkspace(
+        DataX=dataX.ravel(), DataY=dataY.ravel(), DataE=dataE.ravel(), NSpec=len(dataY), 
+        UnitX="Momentum", ParentWorkspace=parentWs, OutputWorkspace=wsName
+        )
+    return ws
+
+
+def convertToYSpaceArr(rebinPars, dataX, dataY, dataE, instrPars, mass, efixed):
+    """
+    Converts TOF point data of all spectra to y space of the given mass and rebins it.
+    Output: bin centers, J(y), errors and Q, each with shape (no of spectra, no of y bins).
+    """
+    ySpaces, dataY, dataE, dataQ = ySpaceConversionArr(dataX, dataY, dataE, instrPars, mass, efixed)
+
+    newEdges = rebinEdges(rebinPars)
+    newY, newE = rebinDistributionArr(ySpaces, dataY, dataE, newEdges)
+    newQ, _ = rebinDistributionArr(ySpaces, dataQ, np.zeros(dataQ.shape), newEdges)
+
+    newX = np.broadcast_to((newEdges[1:] + newEdges[:-1]) / 2, newY.shape).copy()
+    return newX, newY, newE, newQ
+
+
+# Constants of ConvertToYSpace, from Mantid's PhysicalConstants
+NEUTRON_MASS = 1.674927471e-27          # kg
+MEV = 1.602176634e-22                   # J
+MASS_TO_MEV = 0.5 * NEUTRON_MASS / MEV
+E_MEV_TO_WAVENUMBER_SQ = 2.072124652399821
+
+
+def ySpaceConversionArr(dataX, dataY, dataE, instrPars, mass, efixed):
+    """
+    Point by point conversion of ConvertToYSpace, for all spectra at once.
+    Uses the kinematics and constants of the algorithm, not those of the TOF fit, to give the same y values.
+    Values are scaled by Q / E0**0.1 and all arrays are flipped to increasing y.
+    """
+    det, plick, angle, T0, L0, L1 = np.hsplit(instrPars, 6)
+    v1 = np.sqrt(efixed / MASS_TO_MEV)
+    k1 = np.sqrt(efixed / E_MEV_TO_WAVENUMBER_SQ)
+
+    v0 = L0 / ((dataX - T0) * 1e-6 - L1 / v1)
+    E0 = MASS_TO_MEV * v0**2
+    k0 = np.sqrt(E0 / E_MEV_TO_WAVENUMBER_SQ)
+    dataQ = np.sqrt(k0**2 + k1**2 - 2 * k0 * k1 * np.cos(np.deg2rad(angle)))
+    energyRecoil = E_MEV_TO_WAVENUMBER_SQ * dataQ**2 / mass
+    ySpaces = 0.2393 * (mass / dataQ) * (E0 - efixed - energyRecoil)
+
+    prefactor = dataQ / E0**0.1
+    # y decreases with TOF, flip to increasing y
+    return [np.flip(A, axis=1) for A in (ySpaces, dataY * prefactor, dataE * prefactor, dataQ)]
+
+
+def rebinDistributionArr(dataX, dataY, dataE, newEdges):
+    """
+    Same as Rebin on point data flagged as distribution: points are taken as bins centered on them,
+    values are turned into counts with the input widths, split by overlap and divided by the new widths.
+    Squared errors are split by the fraction of each input bin in each new bin, as in Rebin.
+    """
+    edges = pointsToEdges(dataX)
+    widths = np.diff(edges, axis=1)
+    overlap = binOverlaps(edges, newEdges)    # Shape (no of spectra, no of input bins, no of output bins)
+    newWidths = np.diff(newEdges)
+
+    newY = np.einsum("sio,si->so", overlap, dataY) / newWidths
+    newE = np.sqrt(np.einsum("sio,si->so", overlap, np.square(dataE) * widths)) / newWidths
+    return newY, newE
+
+
+def pointsToEdges(dataX):
+    """Bin edges halfway between points, first and last bins with the same width as their neighbours."""
+    mid = (dataX[:, 1:] + dataX[:, :-1]) / 2
+    first = dataX[:, :1] - (mid[:, :1] - dataX[:, :1])
+    last = dataX[:, -1:] + (dataX[:, -1:] - mid[:, -1:])
+    return np.hstack((first, mid, last))
+
+
+def rebinEdges(rebinPars):
+    """Bin edges from Mantid rebin parameters 'start, step, end', keeping only full bins."""
+    rebinPars = [float(p) for p in rebinPars.split(",")]
+    assert len(rebinPars) == 3, "Only rebin parameters of the form 'start, step, end' are supported."
+    start, step, end = rebinPars
+    nBins = int(np.floor((end - start) / step + 1e-9))
+    return start + step * np.arange(nBins+1)
+
+
+def binOverlaps(edges, newEdges):
+    """Width of the overlap between each bin of each row of edges and each of the new bins."""
+    lo = np.maximum(edges[:, :-1, np.newaxis], newEdges[np.newaxis, np.newaxis, :-1])
+    hi = np.minimum(edges[:, 1:, np.newaxis], newEdges[np.newaxis, np.newaxis, 1:])
+    return np.clip(hi - lo, 0, None)
+
+
+def normaliseArr(dataY, dataE, binWidth):
+    """
+    Same as normalise_workspace() on the rebinned distribution: divides each spectrum by its integral,
+    the sum of values times the bin width as in Integration, propagating the errors of both.
+    Spectra with zero integral, e.g. masked, are left as zeros.
+    """
+    norm = np.sum(dataY * binWidth, axis=1)[:, np.newaxis]
+    normE = np.sqrt(np.sum(np.square(dataE * binWidth), axis=1))[:, np.newaxis]
+
+    validRows = (norm != 0).flatten()
+    newY = np.zeros(dataY.shape)
+    newE = np.zeros(dataE.shape)
+    newY[validRows] = dataY[validRows] / norm[validRows]
+    newE[validRows] = np.sqrt(
+        np.square(dataE[validRows] / norm[validRows]) + np.square(dataY[validRows] * normE[validRows] / norm[validRows]**2)
+        )
+    return newY, newE
+
+
 def weightedAvg(wsYSpace):
     """Returns ws with weighted avg of input ws"""
     
@@ -182,21 +430,9 @@ def weightedAvg(wsYSpace):
 def weightedAvgArr(dataYOri, dataEOri):
     """Weighted average over 2D arrays."""
 
-    dataY = dataYOri.copy()  # Copy arrays not to change original data
-    dataE = dataEOri.copy()
-
-    # Ignore invalid data by changing zeros to nans
-    zerosMask = dataE==0
-    dataY[zerosMask] = np.nan  
-    dataE[zerosMask] = np.nan
-
-    meanY = np.nansum(dataY/np.square(dataE), axis=0) / np.nansum(1/np.square(dataE), axis=0)
-    meanE = np.sqrt(1 / np.nansum(1/np.square(dataE), axis=0))
-
-    # Change invalid data back to original format with zeros
-    nanInfMask = meanE==np.inf
-    meanY[nanInfMask] = 0
-    meanE[nanInfMask] = 0
+    acc = WeightedAvgAccumulator(dataYOri.shape[-1])
+    acc.add(dataYOri, dataEOri)
+    meanY, meanE = [avg[0] for avg in acc.average()]
 
     # Test that columns of zeros are left unchanged
     np.testing.assert_allclose((np.sum(dataYOri, axis=0)==0), (meanY==0)), "Collumns of zeros are not being ignored."
@@ -205,6 +441,69 @@ def weightedAvgArr(dataYOri, dataEOri):
     return meanY, meanE
 
 
+class WeightedAvgAccumulator:
+    """
+    Running sums of y/e**2 and 1/e**2 for inverse variance weighted averages of spectra.
+    Points with zero error are invalid and ignored, columns without valid points average to zero.
+    Spectra can be added in any order and in any number of calls, e.g. one run at a time,
+    and accumulators filled by different workers can be merged.
+    Each spectrum belongs to one of nGroups, averages are calculated for every group.
+    """
+
+    def __init__(self, nBins, nGroups=1):
+        self.sumYW = np.zeros((nGroups, nBins))
+        self.sumW = np.zeros((nGroups, nBins))
+        self.counts = np.zeros(nGroups, dtype=int)     # No of spectra added to each group
+
+    def add(self, dataY, dataE, groupIdxs=None):
+        """
+        Adds spectra in rows of dataY and dataE, weights are calculated only once.
+        groupIdxs holds group of each spectrum, all spectra go to first group if None.
+        Spectra with group index outside of range are ignored.
+        Spectra of each group are summed in order of rows, same as np.nansum over axis 0,
+        so results match the weighted avg of the group alone exactly.
+        """
+        dataY, dataE = np.atleast_2d(dataY), np.atleast_2d(dataE)
+        groupIdxs = np.zeros(len(dataY), dtype=int) if groupIdxs is None else np.asarray(groupIdxs)
+
+        valid = (dataE!=0) & np.isfinite(dataE) & np.isfinite(dataY)
+        weights = np.zeros(dataE.shape)
+        weights[valid] = 1 / np.square(dataE[valid])
+        weightedY = np.zeros(dataY.shape)
+        weightedY[valid] = dataY[valid] / np.square(dataE[valid])
+
+        for group in np.unique(groupIdxs[(groupIdxs>=0) & (groupIdxs<len(self.counts))]):
+            inGroup = groupIdxs==group
+            self.sumYW[group] += np.sum(weightedY[inGroup], axis=0)
+            self.sumW[group] += np.sum(weights[inGroup], axis=0)
+            self.counts[group] += np.sum(inGroup)
+        return self
+
+    def merge(self, other):
+        """
+        Adds running sums of other accumulator with same bins and groups.
+        Rows are summed in a different order than in a single add, so results match it up to rounding.
+        """
+        assert self.sumW.shape == other.sumW.shape, "Accumulators need the same number of groups and bins to merge."
+        self.sumYW += other.sumYW
+        self.sumW += other.sumW
+        self.counts += other.counts
+        return self
+
+    def average(self):
+        """Weighted averages and errors, arrays of shape (no of groups, no of bins)."""
+        noData = self.sumW==0
+        sumW = np.where(noData, 1, self.sumW)
+        meanY = np.where(noData, 0, self.sumYW / sumW)
+        meanE = np.where(noData, 0, np.sqrt(1 / sumW))
+        return meanY, meanE
+
+
+def groupsOneHot(groupIdxs, nGroups):
+    """Matrix of shape (nGroups, no of spectra), entry is 1 where spectrum belongs to group."""
+    return (np.asarray(groupIdxs)[np.newaxis, :] == np.arange(nGroups)[:, np.newaxis]).astype(float)
+
+
 def symmetrizeWs(avgYSpace):
     """Symmetrizes workspace after weighted average,
        Needs to have symmetric binning"""
@@ -215,10 +514,7 @@ def symmetrizeWs(avgYSpace):
 
     dataYSym, dataESym = symmetrizeArr(dataY, dataE)
 
-    Sym = CloneWorkspace(avgYSpace, OutputWorkspace=avgYSpace.name()+"_Symmetrised")
-    for i in range(Sym.getNumberHistograms()):
-        Sym.dataY(i)[:] = dataYSym[i]
-        Sym.dataE(i)[:] = dataESym[i] 
+    Sym = passDataIntoWS(avgYSpace, dataYSym, dataESym, avgYSpace.name()+"_Symmetrised")
     return Sym
 
 
@@ -285,10 +581,7 @@ def fitProfileMinuit(yFitIC, wsYSpaceSym, wsRes):
     costFun = cost.LeastSquares(dataXNZ, dataYNZ, dataENZ, convolvedModel)
     m = Minuit(costFun, **defaultPars)
 
-    m.limits["A"] = (0, None)
-    if yFitIC.fitModel=="DOUBLE_WELL":
-        m.limits["d"] = (0, None)
-        m.limits["R"] = (0, None)
+    selectFitModel(yFitIC.fitModel).setMinuitLimits(m)
 
     if yFitIC.fitModel=="SINGLE_GAUSSIAN":
         m.simplex()
@@ -311,8 +604,9 @@ def fitProfileMinuit(yFitIC, wsYSpaceSym, wsRes):
 
     # Best fit and confidence band
     # Calculated for the whole range of dataX, including where zero
-    dataYFit, dataYCov = util.propagate(lambda pars: convolvedModel(dataX, *pars), m.values, m.covariance)
-    dataYSigma = np.sqrt(np.diag(dataYCov))
+    dataYFit = convolvedModel(dataX, *m.values)
+    jac = convolvedModelJacobian(selectFitModel(yFitIC.fitModel), dataX, m.values, resDense, xDelta)
+    dataYSigma = confidenceBand(jac, m.covariance)
     dataYSigma *= chi2        # Weight the confidence band
     Residuals = dataY - dataYFit
 
@@ -335,6 +629,176 @@ def fitProfileMinuit(yFitIC, wsYSpaceSym, wsRes):
     return 
 
 
+def convolvedModelJacobian(fitModel, x, pars, resDense, xDelta):
+    """
+    Derivatives of y0 + model convolved with resolution w.r.t. y0 and each model parameter.
+    Uses the analytic gradient of the model if available, otherwise central differences
+    with all shifted parameter sets evaluated in a single batch.
+    Output has shape (no of parameters including y0, len(x)).
+    """
+
+    modelPars = np.asarray(pars, dtype=float)[1:]
+    if fitModel.grad is not None:
+        grads = fitModel.grad(x, *modelPars)
+    else:
+        steps = 1e-6 * np.maximum(np.abs(modelPars), 1)
+        shifted = fitModel.evalSets(x, np.vstack((modelPars + np.diag(steps), modelPars - np.diag(steps))))
+        grads = (shifted[:len(steps)] - shifted[len(steps):]) / (2*steps[:, np.newaxis])
+
+    convGrads = signal.convolve(grads, resDense[np.newaxis, :], mode="same") * xDelta
+    return np.vstack((np.ones(len(x)), convGrads))
+
+
+def confidenceBand(jac, cov):
+    """Standard deviation of fitted curve from Jacobian of shape (no of pars, no of x) and covariance of parameters."""
+    return np.sqrt(np.einsum("ik,ij,jk->k", jac, np.asarray(cov), jac))
+
+
+def fitYSpaceBatch(yFitIC, dataX, dataY, dataE, resY, parentPars, maxIter=200, tol=1e-10):
+    """
+    Fits the model in yFitIC to many curves in y space at once, e.g. the weighted avgs of bootstrap replicas.
+    Levenberg-Marquardt iterations run on all curves together, starting from the parent best fit.
+    Curves where the positivity constraint ends up violated are refitted individually with Minuit.
+    Inputs: x values, curves and errors with shape (no of curves, no of bins), resolution shared by all curves,
+    parent best fit parameters in the order of the Minuit parameters table: y0, model parameters.
+    Output: popt and perr, rows with the same layout as the Minuit parameters table including the chi2.
+    """
+
+    fitModel = selectFitModel(yFitIC.fitModel)
+    nModelPars = len(fitModel.parNames)
+    nCurves = len(dataY)
+
+    dataY, dataE = np.atleast_2d(dataY), np.atleast_2d(dataE)
+    x = dataX[0]
+    assert np.all(dataX == x), "Batch fit needs all curves on the same x values."
+
+    xDelta, resDense = oddPointsRes(x, resY)
+
+    # Fit only valid values, same as single fit; curves missing points have zero weight there
+    nonZeros = np.any(dataE!=0, axis=0)
+    xNZ = x[nonZeros]
+    dataYNZ = dataY[:, nonZeros]
+    weights = np.zeros(dataYNZ.shape)
+    validE = dataE[:, nonZeros]!=0
+    weights[validE] = 1 / dataE[:, nonZeros][validE]
+
+    def convolvedModel(pars):
+        """Convolved model for each row of parameters: y0, model parameters."""
+        return pars[:, [0]] + signal.convolve(fitModel.evalSets(xNZ, pars[:, 1:]), resDense[np.newaxis, :], mode="same") * xDelta
+
+    def convolvedJacobian(pars):
+        """Derivatives of convolved model from analytic gradient, shape (no of curves, no of points, no of parameters)."""
+        convGrads = signal.convolve(fitModel.gradSets(xNZ, pars[:, 1:]), resDense[np.newaxis, np.newaxis, :], mode="same") * xDelta
+        return np.concatenate((np.ones((len(pars), len(xNZ), 1)), np.swapaxes(convGrads, 1, 2)), axis=2)
+
+    # Lower limits of parameters, same as set in Minuit
+    parNames = ["y0"] + fitModel.parNames
+    lowerLimits = fitModel.lowerLimits(parNames)
+
+    pars = np.tile(np.asarray(parentPars, dtype=float)[:nModelPars+1], (nCurves, 1))
+    jacFunc = convolvedJacobian if fitModel.grad is not None else None
+    pars, chi2, cov = levenbergMarquardtBatch(convolvedModel, pars, dataYNZ, weights, lowerLimits, maxIter, tol, jacFunc)
+
+    if yFitIC.fitModel!="SINGLE_GAUSSIAN":
+        violated = np.any(fitModel.evalSets(xNZ, pars[:, 1:]) < 0, axis=1)
+
+        for i in np.flatnonzero(violated):    # Refit with constraint as in single fit
+            print(f"\nCurve {i} violates positivity constraint in batch fit, refitting with Minuit.")
+            pars[i], chi2[i], cov[i] = fitYSpaceConstrained(
+                fitModel.model, parNames, xNZ, dataYNZ[i], weights[i], convolvedModel, pars[i], lowerLimits
+                )
+
+    dof = np.sum(weights!=0, axis=1) - (nModelPars+1)
+    popt = np.hstack((pars, (chi2/dof)[:, np.newaxis]))
+    perr = np.hstack((np.sqrt(np.diagonal(cov, axis1=1, axis2=2)), np.zeros((nCurves, 1))))
+    return popt, perr
+
+
+def levenbergMarquardtBatch(func, pars, dataY, weights, lowerLimits, maxIter, tol, jacFunc=None):
+    """
+    Minimizes chi2 of func(pars) against each row of dataY, rows of parameters updated independently.
+    Parameters are kept above lowerLimits. 
+    jacFunc(pars) gives the derivatives of func, shape (no of curves, no of points, no of parameters),
+    forward differences are used if not provided.
+    Output: best parameters, chi2 and covariance matrix of each row.
+    """
+    nCurves, nPars = pars.shape
+    curves = np.arange(nCurves)
+
+    def jacobian(p, w):
+        """Derivatives of weighted model, shape (no of curves, no of points, no of parameters)"""
+        if jacFunc is not None:
+            return jacFunc(p) * w[:, :, np.newaxis]
+
+        f0 = func(p)
+        jac = np.zeros((*f0.shape, nPars))
+        for j in range(nPars):
+            step = 1e-7 * np.maximum(np.abs(p[:, j]), 1)
+            pShift = p.copy()
+            pShift[:, j] += step
+            jac[:, :, j] = (func(pShift) - f0) / step[:, np.newaxis]
+        return jac * w[:, :, np.newaxis]
+
+    res = (dataY - func(pars)) * weights
+    chi2 = np.sum(res**2, axis=1)
+    lam = np.full(nCurves, 1e-3)
+    active = np.ones(nCurves, dtype=bool)
+
+    for it in range(maxIter):
+        idx = curves[active]
+        p = pars[idx]
+        jac = jacobian(p, weights[idx])
+        JTJ = np.einsum("cij,cik->cjk", jac, jac)
+        grad = np.einsum("cij,ci->cj", jac, res[idx])
+
+        damping = lam[idx, np.newaxis, np.newaxis] * np.eye(nPars) * np.diagonal(JTJ, axis1=1, axis2=2)[:, np.newaxis, :]
+        step = np.linalg.solve(JTJ + damping + 1e-30*np.eye(nPars), grad[:, :, np.newaxis])[:, :, 0]
+        pNew = np.maximum(p + step, lowerLimits)
+
+        resNew = (dataY[idx] - func(pNew)) * weights[idx]
+        chi2New = np.sum(resNew**2, axis=1)
+
+        accept = chi2New < chi2[idx]
+        converged = (np.abs(chi2[idx] - chi2New) <= tol * np.maximum(chi2[idx], 1)) | (lam[idx] > 1e10)
+
+        acc = idx[accept]
+        pars[acc] = pNew[accept]
+        chi2[acc] = chi2New[accept]
+        res[acc] = resNew[accept]
+        lam[idx] = np.where(accept, lam[idx]/10, lam[idx]*10)
+
+        active[idx[converged]] = False
+        if not np.any(active):
+            break
+
+    jac = jacobian(pars, weights)
+    cov = np.linalg.pinv(np.einsum("cij,cik->cjk", jac, jac))
+    return pars, chi2, cov
+
+
+def fitYSpaceConstrained(model, parNames, xNZ, dataYNZ, weights, convolvedModel, startPars, lowerLimits):
+    """Fit of a single curve from batch fit with Minuit and positivity constraint, as in fitProfileMinuit()."""
+
+    valid = weights!=0
+    def curveModel(x, *pars):
+        return convolvedModel(np.array(pars)[np.newaxis, :])[0][valid]
+    curveModel.func_code = make_func_code(["x"] + parNames)
+
+    costFun = cost.LeastSquares(xNZ[valid], dataYNZ[valid], 1/weights[valid], curveModel)
+    m = Minuit(costFun, **dict(zip(parNames, startPars)))
+    for name, limit in zip(parNames, lowerLimits):
+        if np.isfinite(limit):
+            m.limits[name] = (limit, None)
+
+    def constrFunc(*pars):
+        return model(xNZ, *pars[1:])
+
+    m.simplex()
+    m.scipy(constraints=optimize.NonlinearConstraint(constrFunc, 0, np.inf))
+    m.hesse()
+    return np.array(m.values), m.fval, np.array(m.covariance)
+
+
 def extractFirstSpectra(ws):
     dataY = ws.extractY()[0]
     dataX = ws.extractX()[0]
@@ -345,93 +809,268 @@ def extractFirstSpectra(ws):
 def selectModelAndPars(modelFlag):
     """Selects the function to fit, the starting parameters of that function and the shared parameters in global fit."""
 
-    if modelFlag == "SINGLE_GAUSSIAN":
-        def model(x, A, x0, sigma):
-            return  A / (2*np.pi)**0.5 / sigma * np.exp(-(x-x0)**2/2/sigma**2)
+    fitModel = selectFitModel(modelFlag)
+    print("\nShared Parameters: ", [key for key in fitModel.sharedPars])
+    print("\nUnshared Parameters: ", [key for key in fitModel.defaultPars if key not in fitModel.sharedPars])
 
-        defaultPars = {"y0":0, "A":1, "x0":0, "sigma":5}
-        sharedPars = ["sigma"]    # Used only in Global fit
+    # Copies, callers add the intercept to the starting parameters
+    return fitModel.model, dict(fitModel.defaultPars), list(fitModel.sharedPars)
 
-    elif (modelFlag=="GC_C4_C6"):
-        def model(x, A, x0, sigma1, c4, c6):
-            return  A * np.exp(-(x-x0)**2/2/sigma1**2) / (np.sqrt(2*np.pi*sigma1**2)) \
-                    *(1 + c4/32*(16*((x-x0)/np.sqrt(2)/sigma1)**4 \
-                    -48*((x-x0)/np.sqrt(2)/sigma1)**2+12) \
-                    +c6/384*(64*((x-x0)/np.sqrt(2)/sigma1)**6 \
-                    -480*((x-x0)/np.sqrt(2)/sigma1)**4 + 720*((x-x0)/np.sqrt(2)/sigma1)**2 - 120))
-        
-        defaultPars = {"A":1, "x0":0, "sigma1":6, "c4":0, "c6":0} 
-        sharedPars = ["sigma1", "c4", "c6"]     # Used only in Global fit
-
-    elif modelFlag=="GC_C4":
-        def model(x, A, x0, sigma1, c4):
-            return  A * np.exp(-(x-x0)**2/2/sigma1**2) / (np.sqrt(2*np.pi*sigma1**2)) \
-                    *(1 + c4/32*(16*((x-x0)/np.sqrt(2)/sigma1)**4 \
-                    -48*((x-x0)/np.sqrt(2)/sigma1)**2+12))
-        
-        defaultPars = {"A":1, "x0":0, "sigma1":6, "c4":0} 
-        sharedPars = ["sigma1", "c4"]     # Used only in Global fit   
-    
-    elif modelFlag=="GC_C6":
-        def model(x, A, x0, sigma1, c6):
-            return  A * np.exp(-(x-x0)**2/2/sigma1**2) / (np.sqrt(2*np.pi*sigma1**2)) \
-                    *(1 + +c6/384*(64*((x-x0)/np.sqrt(2)/sigma1)**6 \
-                    -480*((x-x0)/np.sqrt(2)/sigma1)**4 + 720*((x-x0)/np.sqrt(2)/sigma1)**2 - 120))
-        
-        
-        defaultPars = {"A":1, "x0":0, "sigma1":6, "c6":0} 
-        sharedPars = ["sigma1", "c6"]     # Used only in Global fit   
-
-    elif modelFlag=="DOUBLE_WELL":
-        def model(x, A, d, R, sig1, sig2):
-            h = 2.04
-            theta = np.linspace(0, np.pi, 300)[:, np.newaxis]
-            y = x[np.newaxis, :]
-
-            sigTH = np.sqrt( sig1**2*np.cos(theta)**2 + sig2**2*np.sin(theta)**2 )
-            alpha = 2*( d*sig2*sig1*np.sin(theta) / sigTH )**2
-            beta = ( 2*sig1**2*d*np.cos(theta) / sigTH**2 ) * y
-            denom = 2.506628 * sigTH * (1 + R**2 + 2*R*np.exp(-2*d**2*sig1**2))
-            jp = np.exp( -y**2/(2*sigTH**2)) * (1 + R**2 + 2*R*np.exp(-alpha)*np.cos(beta)) / denom
-            jp *= np.sin(theta)
-
-            JBest = np.trapz(jp, x=theta, axis=0)
-            JBest /= np.abs(np.trapz(JBest, x=y))
-            JBest *= A
-            return JBest
-
-        defaultPars = {"A":1, "d":1, "R":1, "sig1":3, "sig2":5}  # TODO: Starting parameters and bounds?
-        sharedPars = ["sig1", "sig2"]           
-
-    elif modelFlag=="DOUBLE_WELL_ANSIO":
-        # Ansiotropic case
-        def model(x, A, sig1, sig2):
-            h = 2.04
-            theta = np.linspace(0, np.pi, 300)[:, np.newaxis]
-            y = x[np.newaxis, :]
-
-            sigTH = np.sqrt( sig1**2*np.cos(theta)**2 + sig2**2*np.sin(theta)**2 )
-            jp = np.exp( -y**2/(2*sigTH**2)) / (2.506628*sigTH)
-            jp *= np.sin(theta)
-
-            JBest = np.trapz(jp, x=theta, axis=0)
-            JBest /= np.abs(np.trapz(JBest, x=y))
-            JBest *= A
-            return JBest
-
-        defaultPars = {"A":1, "sig1":3, "sig2":5}
-        sharedPars = ["sig1", "sig2"]           
 
-    else:
-        raise ValueError("Fitting Model not recognized, available options: 'SINGLE_GAUSSIAN', 'GC_C4_C6', 'GC_C4'")
-    
-    print("\nShared Parameters: ", [key for key in sharedPars])
-    print("\nUnshared Parameters: ", [key for key in defaultPars if key not in sharedPars])
-    
-    assert all(isinstance(item, str) for item in sharedPars), "Parameters in list must be strings."
-    assert describe(model)[-len(sharedPars):]==sharedPars, "Function signature needs to have shared parameters at the end: model(*unsharedPars, *sharedPars)"
-    
-    return model, defaultPars, sharedPars
+def selectFitModel(modelFlag):
+    """Looks up modelFlag in the registry of models for the fit in y space."""
+
+    if modelFlag not in fitModels:
+        raise ValueError(f"Fitting Model not recognized, available options: {list(fitModels)}")
+    return fitModels[modelFlag]
+
+
+def selectModelGradient(modelFlag):
+    """
+    Selects the analytic gradient of the model chosen in selectModelAndPars().
+    Gradient returns array of shape (no of model parameters, *x.shape), one row for each parameter in model signature.
+    Returns None when no analytic gradient is available.
+    """
+    return selectFitModel(modelFlag).grad
+
+
+# Nodes of Gauss-Legendre quadrature over theta in double well models
+thetaNodes = 48
+
+
+@lru_cache(maxsize=None)
+def thetaQuadrature(xDim):
+    """
+    Tables of cos(theta), sin(theta) and quadrature weights times sin(theta) over [0, pi].
+    Shaped (thetaNodes, 1, ...) to broadcast against x with xDim dimensions.
+    Cached, so trig functions are evaluated only once.
+    """
+    nodes, weights = np.polynomial.legendre.leggauss(thetaNodes)
+    theta = np.pi / 2 * (nodes + 1)
+    weights = np.pi / 2 * weights
+
+    shape = (thetaNodes,) + (1,) * xDim
+    tables = [np.cos(theta), np.sin(theta), weights * np.sin(theta)]
+    for t in tables:
+        t.flags.writeable = False
+    return tuple(t.reshape(shape) for t in tables)
+
+
+def memoizeModel(model, maxSize=8):
+    """
+    Caches the last few evaluations of model, keyed on x and parameter values.
+    Avoids repeated evaluations of expensive models at the same point,
+    e.g. by the fit and the positivity constraint within the same minimizer step.
+    Returned arrays are read-only because they are shared between calls.
+    Cache is guarded by a lock, since fits in threads call the same model.
+    """
+    cache = {}
+    lock = threading.Lock()
+
+    @wraps(model)
+    def memoModel(x, *pars):
+        key = tuple((np.shape(p), np.asarray(p, dtype=float).tobytes()) for p in (x, *pars))
+        with lock:
+            if key in cache:
+                return cache[key]
+
+        result = model(x, *pars)    # Evaluated outside of lock, other threads are not blocked
+        result.flags.writeable = False
+
+        with lock:
+            if len(cache) >= maxSize:
+                cache.pop(next(iter(cache)))    # Drop oldest evaluation
+            return cache.setdefault(key, result)
+    return memoModel
+
+
+def gramCharlierGrad(x, A, x0, sigma1, c4, c6):
+    """
+    Derivatives of the Gram-Charlier model with respect to A, x0, sigma1, c4 and c6.
+    Written in terms of t=(x-x0)/sqrt(2)/sigma1, same as in the model.
+    """
+
+    t = (x-x0) / np.sqrt(2) / sigma1
+    gauss = np.exp(-t**2) / (np.sqrt(2*np.pi*sigma1**2))
+
+    h4 = (16*t**4 - 48*t**2 + 12) / 32
+    h6 = (64*t**6 - 480*t**4 + 720*t**2 - 120) / 384
+    poly = 1 + c4*h4 + c6*h6
+    dPolydt = c4*(64*t**3 - 96*t)/32 + c6*(384*t**5 - 1920*t**3 + 1440*t)/384
+
+    dModeldt = A * gauss * (dPolydt - 2*t*poly)     # Derivative through t only
+
+    dA = gauss * poly
+    dx0 = - dModeldt / np.sqrt(2) / sigma1
+    dSigma1 = - A * gauss * poly / sigma1 - dModeldt * t / sigma1
+    dc4 = A * gauss * h4
+    dc6 = A * gauss * h6
+    return np.array(np.broadcast_arrays(dA, dx0, dSigma1, dc4, dc6))
+
+
+class FitModel:
+    """
+    Entry of the registry of models for J(y).
+    Holds the model function, starting parameters, parameters shared in the global fit,
+    bounds of parameters and analytic gradient, if available.
+    Models broadcast x against parameters, so many parameter sets are evaluated in one call.
+    """
+
+    def __init__(self, model, defaultPars, sharedPars, bounds, grad=None):
+        self.model = model
+        self.defaultPars = defaultPars
+        self.sharedPars = sharedPars
+        self.bounds = bounds
+        self.grad = grad
+        self.parNames = describe(model)[1:]
+
+        assert list(defaultPars) == self.parNames, "Starting parameters need to follow model signature."
+        assert all(isinstance(item, str) for item in sharedPars), "Parameters in list must be strings."
+        assert self.parNames[len(self.parNames)-len(sharedPars):]==sharedPars, "Function signature needs to have shared parameters at the end: model(*unsharedPars, *sharedPars)"
+        assert all(name in self.parNames for name in bounds), "Bounds set for parameters not in model."
+
+    def evalSets(self, x, parSets):
+        """
+        Evaluates model at x for each row of parSets, shape (no of sets, no of model parameters).
+        Output has shape (no of sets, len(x)).
+        """
+        parSets = np.atleast_2d(parSets)
+        assert parSets.shape[1] == len(self.parNames), f"Parameter sets need columns for {self.parNames}"
+
+        x = np.asarray(x)
+        vals = self.model(x[np.newaxis, :], *[parSets[:, [j]] for j in range(parSets.shape[1])])
+        return np.broadcast_to(vals, (len(parSets), x.size))
+
+    def gradSets(self, x, parSets):
+        """
+        Analytic gradient at x for each row of parSets, shape (no of sets, no of model parameters).
+        Output has shape (no of sets, no of model parameters, len(x)).
+        """
+        assert self.grad is not None, "No analytic gradient available for this model."
+        parSets = np.atleast_2d(parSets)
+
+        x = np.asarray(x)
+        grads = self.grad(x[np.newaxis, :], *[parSets[:, [j]] for j in range(parSets.shape[1])])
+        return np.moveaxis(np.broadcast_to(grads, (parSets.shape[1], len(parSets), x.size)), 0, 1)
+
+    def setMinuitLimits(self, m, suffixes=[""]):
+        """Sets bounds in Minuit object, suffixes used for unshared parameters in global fit."""
+        for name, bound in self.bounds.items():
+            for suffix in [""] if name in self.sharedPars else suffixes:
+                m.limits[name+suffix] = bound
+
+    def lowerLimits(self, parNames):
+        """Lower bounds for each parameter in parNames, -inf if unbounded."""
+        return np.array([
+            self.bounds[name][0] if name in self.bounds and self.bounds[name][0] is not None else -np.inf 
+            for name in parNames
+            ])
+
+
+def singleGaussian(x, A, x0, sigma):
+    return  A / (2*np.pi)**0.5 / sigma * np.exp(-(x-x0)**2/2/sigma**2)
+
+
+def singleGaussianGrad(x, A, x0, sigma):
+    gauss = singleGaussian(x, 1, x0, sigma)
+    dA = gauss
+    dx0 = A * gauss * (x-x0) / sigma**2
+    dSigma = A * gauss * ((x-x0)**2/sigma**3 - 1/sigma)
+    return np.array(np.broadcast_arrays(dA, dx0, dSigma))
+
+
+def gramCharlierC4C6(x, A, x0, sigma1, c4, c6):
+    return  A * np.exp(-(x-x0)**2/2/sigma1**2) / (np.sqrt(2*np.pi*sigma1**2)) \
+            *(1 + c4/32*(16*((x-x0)/np.sqrt(2)/sigma1)**4 \
+            -48*((x-x0)/np.sqrt(2)/sigma1)**2+12) \
+            +c6/384*(64*((x-x0)/np.sqrt(2)/sigma1)**6 \
+            -480*((x-x0)/np.sqrt(2)/sigma1)**4 + 720*((x-x0)/np.sqrt(2)/sigma1)**2 - 120))
+
+
+def gramCharlierC4(x, A, x0, sigma1, c4):
+    return  A * np.exp(-(x-x0)**2/2/sigma1**2) / (np.sqrt(2*np.pi*sigma1**2)) \
+            *(1 + c4/32*(16*((x-x0)/np.sqrt(2)/sigma1)**4 \
+            -48*((x-x0)/np.sqrt(2)/sigma1)**2+12))
+
+
+def gramCharlierC6(x, A, x0, sigma1, c6):
+    return  A * np.exp(-(x-x0)**2/2/sigma1**2) / (np.sqrt(2*np.pi*sigma1**2)) \
+            *(1 + +c6/384*(64*((x-x0)/np.sqrt(2)/sigma1)**6 \
+            -480*((x-x0)/np.sqrt(2)/sigma1)**4 + 720*((x-x0)/np.sqrt(2)/sigma1)**2 - 120))
+
+
+def gramCharlierC4C6Grad(x, A, x0, sigma1, c4, c6):
+    return gramCharlierGrad(x, A, x0, sigma1, c4, c6)[[0, 1, 2, 3, 4]]
+
+
+def gramCharlierC4Grad(x, A, x0, sigma1, c4):
+    return gramCharlierGrad(x, A, x0, sigma1, c4, 0)[[0, 1, 2, 3]]
+
+
+def gramCharlierC6Grad(x, A, x0, sigma1, c6):
+    return gramCharlierGrad(x, A, x0, sigma1, 0, c6)[[0, 1, 2, 4]]
+
+
+@memoizeModel
+def doubleWell(x, A, d, R, sig1, sig2):
+    cosTH, sinTH, wSinTH = thetaQuadrature(np.ndim(x))
+    y = x[np.newaxis, ...]
+
+    sigTH = np.sqrt( sig1**2*cosTH**2 + sig2**2*sinTH**2 )
+    alpha = 2*( d*sig2*sig1*sinTH / sigTH )**2
+    beta = ( 2*sig1**2*d*cosTH / sigTH**2 ) * y
+    denom = 2.506628 * sigTH * (1 + R**2 + 2*R*np.exp(-2*d**2*sig1**2))
+    jp = np.exp( -y**2/(2*sigTH**2)) * (1 + R**2 + 2*R*np.exp(-alpha)*np.cos(beta)) / denom
+
+    JBest = np.sum(jp * wSinTH, axis=0)     # Integral over theta
+    JBest /= np.abs(np.trapz(JBest, x=x, axis=-1))[..., np.newaxis]
+    JBest *= A
+    return JBest
+
+
+@memoizeModel
+def doubleWellAnsio(x, A, sig1, sig2):
+    """Ansiotropic case of double well."""
+    cosTH, sinTH, wSinTH = thetaQuadrature(np.ndim(x))
+    y = x[np.newaxis, ...]
+
+    sigTH = np.sqrt( sig1**2*cosTH**2 + sig2**2*sinTH**2 )
+    jp = np.exp( -y**2/(2*sigTH**2)) / (2.506628*sigTH)
+
+    JBest = np.sum(jp * wSinTH, axis=0)     # Integral over theta
+    JBest /= np.abs(np.trapz(JBest, x=x, axis=-1))[..., np.newaxis]
+    JBest *= A
+    return JBest
+
+
+# Registry of models available for yFitIC.fitModel
+# Shared parameters are used only in the global fit
+fitModels = {
+    "SINGLE_GAUSSIAN": FitModel(
+        singleGaussian, {"A":1, "x0":0, "sigma":5}, ["sigma"], 
+        bounds={"A":(0, None)}, grad=singleGaussianGrad
+        ),
+    "GC_C4_C6": FitModel(
+        gramCharlierC4C6, {"A":1, "x0":0, "sigma1":6, "c4":0, "c6":0}, ["sigma1", "c4", "c6"], 
+        bounds={"A":(0, None)}, grad=gramCharlierC4C6Grad
+        ),
+    "GC_C4": FitModel(
+        gramCharlierC4, {"A":1, "x0":0, "sigma1":6, "c4":0}, ["sigma1", "c4"], 
+        bounds={"A":(0, None)}, grad=gramCharlierC4Grad
+        ),
+    "GC_C6": FitModel(
+        gramCharlierC6, {"A":1, "x0":0, "sigma1":6, "c6":0}, ["sigma1", "c6"], 
+        bounds={"A":(0, None)}, grad=gramCharlierC6Grad
+        ),
+    "DOUBLE_WELL": FitModel(    # Same starting parameters and limits on d and R as the previous fit
+        doubleWell, {"A":1, "d":1, "R":1, "sig1":3, "sig2":5}, ["sig1", "sig2"], 
+        bounds={"A":(0, None), "d":(0, None), "R":(0, None)}
+        ),
+    "DOUBLE_WELL_ANSIO": FitModel(
+        doubleWellAnsio, {"A":1, "sig1":3, "sig2":5}, ["sig1", "sig2"], 
+        bounds={"A":(0, None)}
+        ),
+}
 
 
 def selectNonZeros(dataX, dataY, dataE):
@@ -518,7 +1157,7 @@ def runMinos(mObj, yFitIC, constrFunc, wsName):
             plotAutoMinos(mObj, wsName)
 
     else:   # Case with positivity constraint on function, use manual implementation
-        merrors, fig = runAndPlotManualMinos(mObj, constrFunc, bestFitVals, bestFitErrs, yFitIC.showPlots)     # Changes values of minuit obj m, do not use m below this point
+        merrors, fig = runAndPlotManualMinos(mObj, constrFunc, bestFitVals, bestFitErrs, yFitIC.showPlots, yFitIC.minosMode, yFitIC.minosWorkers)     # Scans run on copies, m is left at best fit
         
         # Same as above, but the other way around
         minosManErr = []
@@ -533,15 +1172,18 @@ def runMinos(mObj, yFitIC, constrFunc, wsName):
     return    parameters, values, errors, minosAutoErr, minosManErr
 
 
-def runAndPlotManualMinos(minuitObj, constrFunc, bestFitVals, bestFitErrs, showPlots):
+def runAndPlotManualMinos(minuitObj, constrFunc, bestFitVals, bestFitErrs, showPlots, minosMode="GRID", nWorkers=1):
     """
     Runs brute implementation of minos algorithm and
-    plots the profile for each parameter along the way.
+    plots the profile for each parameter.
+    Profiles of all parameters can be calculated concurrently by nWorkers, see runManualMinosScans().
+    minosMode: 'GRID' scans a dense grid of each parameter, 'ROOT' finds the crossings 
+    of the profile directly and only plots the sparse profile evaluated along the way.
     """
-    # Reason for two distinct operations inside the same function is that its easier
-    # to build the minos plots for each parameter as they are being calculated.
     print("\nRunning Minos ... \n")
 
+    profiles = runManualMinosScans(minuitObj, constrFunc, bestFitVals, bestFitErrs, bound=2, minosMode=minosMode, nWorkers=nWorkers)
+
     # Set format of subplots
     height = 2
     width = int(np.ceil(len(minuitObj.parameters)/2))
@@ -552,7 +1194,7 @@ def runAndPlotManualMinos(minuitObj, constrFunc, bestFitVals, bestFitErrs, showP
 
     merrors = {}
     for p, ax in zip(minuitObj.parameters, axs.flat):
-        lerr, uerr = runMinosForPar(minuitObj, constrFunc, p, 2, ax, bestFitVals, bestFitErrs, showPlots)
+        lerr, uerr = plotMinosForPar(ax, p, profiles[p])
         merrors[p] = np.array([lerr, uerr])
 
     # if showPlots:
@@ -568,45 +1210,182 @@ def runAndPlotManualMinos(minuitObj, constrFunc, bestFitVals, bestFitErrs, showP
     return merrors, fig
 
 
-def runMinosForPar(minuitObj, constrFunc, var:str, bound:int, ax, bestFitVals, bestFitErrs, showPlots):
+def plotMinosForPar(ax, var, profile):
+    """Calculates minos errors from constrained Scipy profile and plots both profiles of parameter var."""
+
+    varSpace = profile["varSpace"]
+    varVal, varErr, fValsMin = profile["varVal"], profile["varErr"], profile["fValsMin"]
 
+    if "Migrad" not in profile:    # Errors found by root finding, only sparse constrained profile available
+        lerr, uerr = profile["errors"]
+        plotProfile(ax, var, varSpace, profile["Scipy"], lerr, uerr, fValsMin, varVal, varErr, label="fVals Constr Scipy (sparse)", fmt=".-")
+        return lerr, uerr
+
+    # Calculate minos errors from constrained scipy
+    lerr, uerr = errsFromMinosCurve(varSpace, varVal, profile["Scipy"], fValsMin, dChi2=1)
+    ax.plot(varSpace, profile["Scipy"], label="fVals Constr Scipy")
+
+    # Plot migrad as well to see the difference between constrained and unconstrained
+    plotProfile(ax, var, varSpace, profile["Migrad"], lerr, uerr, fValsMin, varVal, varErr)
+    return lerr, uerr
+
+
+def runManualMinosScans(minuitObj, constrFunc, bestFitVals, bestFitErrs, bound:int, minosMode="GRID", nWorkers=1):
+    """
+    Calculates the profiles of all parameters for manual minos.
+    Scans of each parameter, minimizer and half-range are independent and run in parallel when nWorkers > 1,
+    each scan with its own copy of the Minuit object.
+    Each half-range starts at the best fit and every point is warm-started from its neighbour.
+    Output: dict with varSpace, minimum and profiles of each minimizer for each parameter.
+    In 'ROOT' mode, dict holds instead the errors and the sparse constrained profile.
+    """
+
+    if minosMode == "ROOT":
+        return runManualMinosRoots(minuitObj, constrFunc, bestFitVals, bestFitErrs, bound, nWorkers)
+    assert minosMode == "GRID", "Minos mode not recognized, available options: 'GRID', 'ROOT'"
+
+    parameters = list(minuitObj.parameters)
     resetMinuit(minuitObj, bestFitVals, bestFitErrs)
-    # Run Fitting procedures again to be on the safe side and reset to minimum
-    minuitObj.scipy(constraints=optimize.NonlinearConstraint(constrFunc, 0, np.inf))
-    minuitObj.hesse()
 
-    # Extract parameters from minimum
-    varVal = minuitObj.values[var]
-    varErr = minuitObj.errors[var]
-    # Store fval of best fit
-    fValsMin = minuitObj.fval      # Used to calculate error bands at the end
+    with minosExecutor(minuitObj, constrFunc, bestFitVals, bestFitErrs, nWorkers) as executor:
 
-    varSpace = buildVarRange(bound, varVal, varErr) 
-    
-    # Split variable space into right and left side
-    lhsVarSpace, rhsVarSpace = np.split(varSpace, 2)
-    lhsVarSpace = np.flip(lhsVarSpace)   # Flip to start at minimum
+        # Run Fitting procedures again to be on the safe side and reset to minimum
+        minima = list(executor.map(minosMinimumWorker, parameters))
 
-    for minimizer in ("Scipy", "Migrad"):
-        resetMinuit(minuitObj, bestFitVals, bestFitErrs)
-        rhsMinos = runMinosOnRange(minuitObj, var, rhsVarSpace, minimizer, constrFunc)
-        
-        resetMinuit(minuitObj, bestFitVals, bestFitErrs)
-        lhsMinos = runMinosOnRange(minuitObj, var, lhsVarSpace, minimizer, constrFunc)
+        profiles = {}
+        futures = {}
+        for var, (varVal, varErr, fValsMin) in zip(parameters, minima):
+            varSpace = buildVarRange(bound, varVal, varErr) 
 
-        wholeMinos = np.concatenate((np.flip(lhsMinos), rhsMinos), axis=None)   # Flip left hand side again
+            # Split variable space into right and left side
+            lhsVarSpace, rhsVarSpace = np.split(varSpace, 2)
+            lhsVarSpace = np.flip(lhsVarSpace)   # Flip to start at minimum
 
-        if minimizer == "Scipy":   # Calculate minos errors from constrained scipy
-            lerr, uerr = errsFromMinosCurve(varSpace, varVal, wholeMinos, fValsMin, dChi2=1)
-            ax.plot(varSpace, wholeMinos, label="fVals Constr Scipy")
+            profiles[var] = {"varSpace": varSpace, "varVal": varVal, "varErr": varErr, "fValsMin": fValsMin}
+            for minimizer in ("Scipy", "Migrad"):
+                for side, sideVarSpace in zip(("lhs", "rhs"), (lhsVarSpace, rhsVarSpace)):
+                    futures[(var, minimizer, side)] = executor.submit(minosRangeWorker, var, sideVarSpace, minimizer)
 
-        elif minimizer == "Migrad":   # Plot migrad as well to see the difference between constrained and unconstrained
-            plotProfile(ax, var, varSpace, wholeMinos, lerr, uerr, fValsMin, varVal, varErr)
-        else:
-            raise ValueError("Minimizer not recognized.")
+        for var in parameters:
+            for minimizer in ("Scipy", "Migrad"):
+                lhsMinos = futures[(var, minimizer, "lhs")].result()
+                rhsMinos = futures[(var, minimizer, "rhs")].result()
+                profiles[var][minimizer] = np.concatenate((np.flip(lhsMinos), rhsMinos), axis=None)   # Flip left hand side again
+    return profiles
+
+
+def runManualMinosRoots(minuitObj, constrFunc, bestFitVals, bestFitErrs, bound:int, nWorkers=1):
+    """
+    Finds minos errors as the crossings of the constrained profile with fValsMin+1,
+    using a bracketing root finder on each side of the minimum instead of a dense grid.
+    Output: dict with errors, minimum and sparse constrained profile for each parameter.
+    """
 
+    parameters = list(minuitObj.parameters)
     resetMinuit(minuitObj, bestFitVals, bestFitErrs)
-    return lerr, uerr
+
+    with minosExecutor(minuitObj, constrFunc, bestFitVals, bestFitErrs, nWorkers) as executor:
+
+        # Run Fitting procedures again to be on the safe side and reset to minimum
+        minima = list(executor.map(minosMinimumWorker, parameters))
+
+        futures = {}
+        for var, (varVal, varErr, fValsMin) in zip(parameters, minima):
+            for direction in (-1, 1):
+                futures[(var, direction)] = executor.submit(minosRootWorker, var, varVal, varErr, fValsMin, bound, direction)
+
+        profiles = {}
+        for var, (varVal, varErr, fValsMin) in zip(parameters, minima):
+            lerr, lhsPoints = futures[(var, -1)].result()
+            uerr, rhsPoints = futures[(var, 1)].result()
+
+            if (lerr is None) or (uerr is None):     # Intersections not found, do not plot error range
+                lerr, uerr = 0., 0.
+
+            points = {**lhsPoints, **rhsPoints}
+            varSpace = np.sort(list(points))
+            profiles[var] = {
+                "varSpace": varSpace, "varVal": varVal, "varErr": varErr, "fValsMin": fValsMin,
+                "Scipy": np.array([points[v] for v in varSpace]), "errors": (lerr, uerr)
+                }
+    return profiles
+
+
+def minosRootWorker(var, varVal, varErr, fValsMin, bound, direction, dChi2=1):
+    """
+    Finds crossing of the constrained profile of var with fValsMin+dChi2 on one side of the minimum.
+    The crossing is bracketed first at the hessian error and then at the edge of the range
+    used for the grid, bound*varErr, and refined with Brent's method.
+    Output: error on this side (None if crossing not found) and the profile points evaluated.
+    """
+
+    minuitObj = workerMinuitCopy()
+    constrFunc = minosWorkerState["constrFunc"]
+    minuitObj.fixed[var] = True
+
+    points = {varVal: fValsMin}
+    def profileDChi2(value):
+        if value not in points:
+            minuitObj.values[var] = value      # Warm-started from previously evaluated point
+            minuitObj.scipy(constraints=optimize.NonlinearConstraint(constrFunc, 0, np.inf))
+            points[value] = minuitObj.fval
+        return points[value] - fValsMin - dChi2
+
+    lower = varVal
+    for upper in varVal + direction * varErr * np.array([1, bound]):
+        if profileDChi2(upper) > 0:
+            break
+        lower = upper
+    else:
+        return None, points
+
+    crossing = optimize.brentq(profileDChi2, lower, upper, xtol=1e-3*varErr)
+    return crossing - varVal, points
+
+
+# State of the workers running manual minos, set by initMinosWorker() in each worker
+minosWorkerState = {}
+
+
+def minosExecutor(minuitObj, constrFunc, bestFitVals, bestFitErrs, nWorkers=1):
+    """
+    Pool of workers for manual minos.
+    A single worker runs the scans one after the other in a thread of this process.
+    Otherwise uses forked processes when available, since the cost function closures cannot be pickled,
+    and falls back to threads.
+    """
+    initArgs = (minuitObj, constrFunc, bestFitVals, bestFitErrs)
+
+    if (nWorkers > 1) and ("fork" in mp.get_all_start_methods()):
+        return ProcessPoolExecutor(nWorkers, mp_context=mp.get_context("fork"), initializer=initMinosWorker, initargs=initArgs)
+    return ThreadPoolExecutor(nWorkers, initializer=initMinosWorker, initargs=initArgs)
+
+
+def initMinosWorker(minuitObj, constrFunc, bestFitVals, bestFitErrs):
+    minosWorkerState["minuitObj"] = minuitObj
+    minosWorkerState["constrFunc"] = constrFunc
+    minosWorkerState["bestFitVals"] = bestFitVals
+    minosWorkerState["bestFitErrs"] = bestFitErrs
+
+
+def workerMinuitCopy():
+    """Copy of Minuit object reset to the best fit, not shared with any other scan."""
+    minuitObj = copy.deepcopy(minosWorkerState["minuitObj"])
+    resetMinuit(minuitObj, minosWorkerState["bestFitVals"], minosWorkerState["bestFitErrs"])
+    return minuitObj
+
+
+def minosMinimumWorker(var):
+    """Refits from the best fit and returns value and error of var and the minimum fval."""
+
+    minuitObj = workerMinuitCopy()
+    minuitObj.scipy(constraints=optimize.NonlinearConstraint(minosWorkerState["constrFunc"], 0, np.inf))
+    minuitObj.hesse()
+    return minuitObj.values[var], minuitObj.errors[var], minuitObj.fval
+
+
+def minosRangeWorker(var, varRange, minimizer):
+    return runMinosOnRange(workerMinuitCopy(), var, varRange, minimizer, minosWorkerState["constrFunc"])
 
 
 def resetMinuit(minuitObj, bestFitVals, bestFitErrs):
@@ -692,7 +1471,7 @@ def plotAutoMinos(minuitObj, wsName):
     fig.show()   
 
 
-def plotProfile(ax, var, varSpace, fValsMigrad, lerr, uerr, fValsMin, varVal, varErr):
+def plotProfile(ax, var, varSpace, fValsMigrad, lerr, uerr, fValsMin, varVal, varErr, label="fVals Migrad", fmt="-"):
     """
     Plots likelihood profilef for the Migrad fvals.
     varSpace : x axis
@@ -701,7 +1480,7 @@ def plotProfile(ax, var, varSpace, fValsMigrad, lerr, uerr, fValsMin, varVal, va
 
     ax.set_title(var+f" = {varVal:.3f} {lerr:.3f} {uerr:+.3f}")
 
-    ax.plot(varSpace, fValsMigrad, label="fVals Migrad")
+    ax.plot(varSpace, fValsMigrad, fmt, label=label)
 
     ax.axvspan(lerr+varVal, uerr+varVal, alpha=0.2, color="red", label="Minos error")
     ax.axvspan(varVal-varErr, varVal+varErr, alpha=0.2, color="green", label="Hessian Std error")
@@ -751,71 +1530,100 @@ def oddPointsRes(x, res):
     return xDelta, resDense
 
 
+# Minimizers of Mantid Fit available for cross-check, rows of fit results after Minuit in this order
+mantidMinimizers = ["Levenberg-Marquardt", "Simplex"]
+
+
 def fitProfileMantidFit(yFitIC, wsYSpaceSym, wsRes):
-    print('\nFitting on the sum of spectra in the West domain ...\n')     
-    for minimizer in ['Levenberg-Marquardt','Simplex']:
-        outputName = wsYSpaceSym.name()+"_Fitted_"+minimizer
-        CloneWorkspace(InputWorkspace = wsYSpaceSym, OutputWorkspace = outputName)
-        
-        if yFitIC.fitModel=="SINGLE_GAUSSIAN":
-            function=f"""composite=Convolution,FixResolution=true,NumDeriv=true;
-            name=Resolution,Workspace={wsRes.name()},WorkspaceIndex=0;
-            name=UserFunction,Formula=y0 + A*exp( -(x-x0)^2/2/sigma^2)/(2*3.1415*sigma^2)^0.5,
-            y0=0,A=1,x0=0,sigma=5,   ties=()"""
-
-        elif yFitIC.fitModel=="GC_C4_C6":
-            function = f"""
-            composite=Convolution,FixResolution=true,NumDeriv=true;
-            name=Resolution,Workspace={wsRes.name()},WorkspaceIndex=0,X=(),Y=();
-            name=UserFunction,Formula=y0 + A*exp( -(x-x0)^2/2./sigma1^2)/(sqrt(2.*3.1415*sigma1^2))
-            *(1.+c4/32.*(16.*((x-x0)/sqrt(2)/sigma1)^4-48.*((x-x0)/sqrt(2)/sigma1)^2+12)+c6/384*(64*((x-x0)/sqrt(2)/sigma1)^6 - 480*((x-x0)/sqrt(2)/sigma1)^4 + 720*((x-x0)/sqrt(2)/sigma1)^2 - 120)),
-            y0=0, A=1,x0=0,sigma1=4.0,c4=0.0,c6=0.0,ties=(),constraints=(0<c4,0<c6)
-            """
-        elif yFitIC.fitModel=="GC_C4":
-            function = f"""
-            composite=Convolution,FixResolution=true,NumDeriv=true;
-            name=Resolution,Workspace={wsRes.name()},WorkspaceIndex=0,X=(),Y=();
-            name=UserFunction,Formula=y0 + A*exp( -(x-x0)^2/2./sigma1^2)/(sqrt(2.*3.1415*sigma1^2))
-            *(1.+c4/32.*(16.*((x-x0)/sqrt(2)/sigma1)^4-48.*((x-x0)/sqrt(2)/sigma1)^2+12)),
-            y0=0, A=1,x0=0,sigma1=4.0,c4=0.0,ties=()
-            """
-        elif yFitIC.fitModel=="GC_C6":
-            function = f"""
-            composite=Convolution,FixResolution=true,NumDeriv=true;
-            name=Resolution,Workspace={wsRes.name()},WorkspaceIndex=0,X=(),Y=();
-            name=UserFunction,Formula=y0 + A*exp( -(x-x0)^2/2./sigma1^2)/(sqrt(2.*3.1415*sigma1^2))
-            *(1.+c6/384*(64*((x-x0)/sqrt(2)/sigma1)^6 - 480*((x-x0)/sqrt(2)/sigma1)^4 + 720*((x-x0)/sqrt(2)/sigma1)^2 - 120)),
-            y0=0, A=1,x0=0,sigma1=4.0,c6=0.0,ties=()
-            """
-        elif (yFitIC.fitModel=="DOUBLE_WELL") | (yFitIC.fitModel=="DOUBLE_WELL_ANSIO"):
-            return
-        else: raise ValueError("fitmodel not recognized.")
+    """
+    Cross-check of the Minuit fit with Mantid Fit, one fit for each minimizer in yFitIC.crossCheckMinimizers.
+    Fits run one after the other in a single background thread, the only one running Fit algorithms,
+    while the Minuit fit runs in the main thread on its own workspaces.
+    Returns future with the list of minimizers fitted.
+    """
+    assert all(minimizer in mantidMinimizers for minimizer in yFitIC.crossCheckMinimizers), \
+        f"Cross-check minimizers not recognized, available options: {mantidMinimizers}"
 
-        Fit(
-            Function=function, 
-            InputWorkspace=outputName,
-            Output=outputName,
-            Minimizer=minimizer
-            )
-        # Fit produces output workspaces with results
+    function = mantidFitFunction(yFitIC.fitModel, wsRes)
+    minimizers = [] if function is None else list(yFitIC.crossCheckMinimizers)
+
+    executor = ThreadPoolExecutor(1)
+    future = executor.submit(runMantidFits, function, wsYSpaceSym, minimizers)
+    executor.shutdown(wait=False)     # Thread exits once fits are finished
+    return future
+
+
+def runMantidFits(function, wsYSpaceSym, minimizers):
+    if len(minimizers) > 0:
+        print('\nFitting on the sum of spectra in the West domain ...\n')     
+    for minimizer in minimizers:
+        runMantidFit(function, wsYSpaceSym, minimizer)
+    return minimizers
+
+
+def runMantidFit(function, wsYSpaceSym, minimizer):
+    outputName = wsYSpaceSym.name()+"_Fitted_"+minimizer
+    CloneWorkspace(InputWorkspace = wsYSpaceSym, OutputWorkspace = outputName)
+
+    Fit(
+        Function=function, 
+        InputWorkspace=outputName,
+        Output=outputName,
+        Minimizer=minimizer
+        )
+    # Fit produces output workspaces with results
     return 
 
 
-def printYSpaceFitResults(wsJoYName):
+def mantidFitFunction(fitModel, wsRes):
+    """Function string for Mantid Fit, None for models without a Mantid equivalent."""
+
+    if fitModel=="SINGLE_GAUSSIAN":
+        function=f"""composite=Convolution,FixResolution=true,NumDeriv=true;
+        name=Resolution,Workspace={wsRes.name()},WorkspaceIndex=0;
+        name=UserFunction,Formula=y0 + A*exp( -(x-x0)^2/2/sigma^2)/(2*3.1415*sigma^2)^0.5,
+        y0=0,A=1,x0=0,sigma=5,   ties=()"""
+
+    elif fitModel=="GC_C4_C6":
+        function = f"""
+        composite=Convolution,FixResolution=true,NumDeriv=true;
+        name=Resolution,Workspace={wsRes.name()},WorkspaceIndex=0,X=(),Y=();
+        name=UserFunction,Formula=y0 + A*exp( -(x-x0)^2/2./sigma1^2)/(sqrt(2.*3.1415*sigma1^2))
+        *(1.+c4/32.*(16.*((x-x0)/sqrt(2)/sigma1)^4-48.*((x-x0)/sqrt(2)/sigma1)^2+12)+c6/384*(64*((x-x0)/sqrt(2)/sigma1)^6 - 480*((x-x0)/sqrt(2)/sigma1)^4 + 720*((x-x0)/sqrt(2)/sigma1)^2 - 120)),
+        y0=0, A=1,x0=0,sigma1=4.0,c4=0.0,c6=0.0,ties=(),constraints=(0<c4,0<c6)
+        """
+    elif fitModel=="GC_C4":
+        function = f"""
+        composite=Convolution,FixResolution=true,NumDeriv=true;
+        name=Resolution,Workspace={wsRes.name()},WorkspaceIndex=0,X=(),Y=();
+        name=UserFunction,Formula=y0 + A*exp( -(x-x0)^2/2./sigma1^2)/(sqrt(2.*3.1415*sigma1^2))
+        *(1.+c4/32.*(16.*((x-x0)/sqrt(2)/sigma1)^4-48.*((x-x0)/sqrt(2)/sigma1)^2+12)),
+        y0=0, A=1,x0=0,sigma1=4.0,c4=0.0,ties=()
+        """
+    elif fitModel=="GC_C6":
+        function = f"""
+        composite=Convolution,FixResolution=true,NumDeriv=true;
+        name=Resolution,Workspace={wsRes.name()},WorkspaceIndex=0,X=(),Y=();
+        name=UserFunction,Formula=y0 + A*exp( -(x-x0)^2/2./sigma1^2)/(sqrt(2.*3.1415*sigma1^2))
+        *(1.+c6/384*(64*((x-x0)/sqrt(2)/sigma1)^6 - 480*((x-x0)/sqrt(2)/sigma1)^4 + 720*((x-x0)/sqrt(2)/sigma1)^2 - 120)),
+        y0=0, A=1,x0=0,sigma1=4.0,c6=0.0,ties=()
+        """
+    elif (fitModel=="DOUBLE_WELL") | (fitModel=="DOUBLE_WELL_ANSIO"):
+        return None
+    else: raise ValueError("fitmodel not recognized.")
+    return function
+
+
+def printYSpaceFitResults(wsJoYName, fittedMinimizers=None):
+    """Prints tables of fits of wsJoYName, only of fittedMinimizers if given."""
     print("\nFit in Y Space results:")
     foundWS = []
-    try:
-        wsFitLM = mtd[wsJoYName + "_Fitted_Levenberg-Marquardt_Parameters"]
-        foundWS.append(wsFitLM)
-    except KeyError: pass
-    try:
-        wsFitSimplex = mtd[wsJoYName + "_Fitted_Simplex_Parameters"]
-        foundWS.append(wsFitSimplex)
-    except KeyError: pass
-    try:
-        wsFitMinuit = mtd[wsJoYName + "_Fitted_Minuit_Parameters"]
-        foundWS.append(wsFitMinuit)
-    except KeyError: pass
+    for minimizer in mantidMinimizers + ["Minuit"]:
+        if (fittedMinimizers is not None) and (minimizer not in fittedMinimizers):
+            continue
+        try:
+            foundWS.append(mtd[wsJoYName + "_Fitted_" + minimizer + "_Parameters"])
+        except KeyError: pass
 
     for tableWS in foundWS:
         print("\n"+" ".join(tableWS.getName().split("_")[-3:])+":")
@@ -830,7 +1638,7 @@ def printYSpaceFitResults(wsJoYName):
 
 class ResultsYFitObject:
 
-    def __init__(self, ic, yFitIC, wsFinalName, wsSubMassName):
+    def __init__(self, ic, yFitIC, wsFinalName, wsSubMassName, fittedMinimizers):
         # Extract most relevant information from ws
         wsFinal = mtd[wsFinalName]
         wsMass0 = mtd[wsSubMassName]
@@ -847,24 +1655,13 @@ class ResultsYFitObject:
         self.YSpaceSymSumDataE = wsJoYAvg.extractE()
         self.resolution = wsResSum.extractY()
 
-        # Extract best fit parameters from workspaces
+        # Extract best fit parameters from workspaces of fits performed in this call, older tables are ignored
         poptList = []
         perrList = []
-        try:
-            wsFitMinuit = mtd[wsJoYAvg.name() + "_Fitted_Minuit_Parameters"]
-            poptList.append(wsFitMinuit.column("Value"))
-            perrList.append(wsFitMinuit.column("Error"))
-        except: pass
-        try:
-            wsFitLM = mtd[wsJoYAvg.name() + "_Fitted_Levenberg-Marquardt_Parameters"]
-            poptList.append(wsFitLM.column("Value"))
-            perrList.append(wsFitLM.column("Error"))
-        except: pass
-        try:
-            wsFitSimplex = mtd[wsJoYAvg.name() + "_Fitted_Simplex_Parameters"]
-            poptList.append(wsFitSimplex.column("Value"))
-            perrList.append(wsFitSimplex.column("Error"))
-        except: pass
+        for minimizer in fittedMinimizers:
+            wsFit = mtd[wsJoYAvg.name() + "_Fitted_" + minimizer + "_Parameters"]
+            poptList.append(wsFit.column("Value"))
+            perrList.append(wsFit.column("Error"))
 
         # Number of parameters might not be the same, need to add zeros to some lists to match length
         maxLen = max([len(l) for l in poptList])
@@ -872,9 +1669,14 @@ class ResultsYFitObject:
             for l in pList:
                 while len(l) < maxLen:
                     l.append(0)
-        
-        popt = np.array(poptList)
-        perr = np.array(perrList)
+
+        # Fixed rows, Minuit followed by mantidMinimizers, nans for fits not performed
+        rows = ["Minuit"] + mantidMinimizers
+        popt = np.full((len(rows), maxLen), np.nan)
+        perr = np.full((len(rows), maxLen), np.nan)
+        for minimizer, poptRow, perrRow in zip(fittedMinimizers, poptList, perrList):
+            popt[rows.index(minimizer)] = poptRow
+            perr[rows.index(minimizer)] = perrRow
 
         self.popt = popt
         self.perr = perr
@@ -924,12 +1726,8 @@ def runGlobalFit(wsYSpace, wsRes, IC, yFitIC):
     print("\nRunning Global Fit ...\n")
     m = Minuit(totCost, **initPars)
 
-    for i in range(len(dataY)):     # Set limits for unshared parameters
-        m.limits["A"+str(i)] = (0, np.inf)   
-
-        if yFitIC.fitModel=="DOUBLE_WELL":
-            m.limits["d"+str(i)] = (0, np.inf)
-            m.limits["R"+str(i)] = (0, np.inf) 
+    # Set limits, unshared parameters have index of group as suffix
+    selectFitModel(yFitIC.fitModel).setMinuitLimits(m, suffixes=[str(i) for i in range(len(dataY))])
 
     t0 = time.time()
     if yFitIC.fitModel=="SINGLE_GAUSSIAN":
@@ -938,30 +1736,15 @@ def runGlobalFit(wsYSpace, wsRes, IC, yFitIC):
 
     else:
         totSig = describe(totCost)   # This signature has 'x' already removed
-        sharedIdxs = [totSig.index(shPar) for shPar in sharedPars]
         nCostFunctions = len(totCost)   # Number of individual cost functions
         x = dataX[0]
 
-        def constr(*pars):
-            """
-            Constraint for positivity of Global Gram Carlier.
-            Input: All parameters defined in global cost function.
-            x is the range for each individual cost fun, defined outside function.
-            Builds array with all constraints from individual functions.
-            """
-
-            sharedPars = [pars[i] for i in sharedIdxs]    # sigma1, c4, c6 in original GC
-            unsharedPars = np.delete(pars, sharedIdxs, None)
-            unsharedParsSplit = np.split(unsharedPars, nCostFunctions)   # Splits unshared parameters per individual cost fun
-
-            joinedGC = np.zeros(nCostFunctions * x.size)  
-            for i, unshParsModel in enumerate(unsharedParsSplit):    # Attention to format of unshared and shared parameters when calling model
-                joinedGC[i*x.size : (i+1)*x.size] = model(x, *unshParsModel[1:], *sharedPars)   # Intercept is first of unshared parameters 
-                 
-            return joinedGC
+        constr, constrJac = buildGlobalConstraint(
+            model, selectModelGradient(yFitIC.fitModel), x, totSig, sharedPars, nCostFunctions
+            )
 
         m.simplex()
-        m.scipy(constraints=optimize.NonlinearConstraint(constr, 0, np.inf))
+        m.scipy(constraints=optimize.NonlinearConstraint(constr, 0, np.inf, jac=constrJac))
     
     t1 = time.time()
     print(f"\nTime of fitting: {t1-t0:.2f} seconds")
@@ -978,12 +1761,106 @@ def runGlobalFit(wsYSpace, wsRes, IC, yFitIC):
         print(f"{p:>7s} = {v:>8.4f} \u00B1 {e:<8.4f}")
     print("\n")
 
+    # Best fit and confidence band of each group, stored in workspace similar to single fit
+    dataYFit, dataYSigma = globalFitBands(yFitIC, dataX, dataRes, m, totCost)
+    dataYSigma *= chi2        # Weight the confidence band
+    CreateWorkspace(DataX=dataX.flatten(), DataY=dataYFit.flatten(), DataE=dataYSigma.flatten(), 
+                    NSpec=len(dataY), OutputWorkspace=wsYSpace.name()+"_Fitted_Global")
+
     if yFitIC.showPlots:
-        plotGlobalFit(dataX, dataY, dataE, m, totCost, wsYSpace.name())
+        plotGlobalFit(dataX, dataY, dataE, m, totCost, wsYSpace.name(), dataYSigma)
     
     return np.array(m.values), np.array(m.errors)     # Pass into array to store values in variable
 
 
+def globalFitBands(yFitIC, dataX, dataRes, mObj, totCost):
+    """
+    Best fit curve and its confidence band for each group of global fit.
+    Each band uses only the parameters of its cost function and the corresponding block of the covariance.
+    """
+
+    fitModel = selectFitModel(yFitIC.fitModel)
+    dataYFit = np.zeros(dataX.shape)
+    dataYSigma = np.zeros(dataX.shape)
+    for i, (x, res, costFun) in enumerate(zip(dataX, dataRes, totCost)):
+        signature = describe(costFun)
+        idxs = [mObj.parameters.index(p) for p in signature]
+
+        xDelta, resDense = oddPointsRes(x, res)
+        jac = convolvedModelJacobian(fitModel, x, mObj.values[signature], resDense, xDelta)
+
+        dataYFit[i] = costFun.model(x, *mObj.values[signature])
+        dataYSigma[i] = confidenceBand(jac, np.array(mObj.covariance)[np.ix_(idxs, idxs)])
+    return dataYFit, dataYSigma
+
+
+def buildGlobalConstraint(model, modelGrad, x, totSig, sharedPars, nCostFunctions):
+    """
+    Builds constraint for positivity of the global model and its sparse Jacobian.
+    Input: model and its gradient (None if not available),
+    x range of each individual cost fun, signature of global cost function.
+    Output: constraint function called with all parameters of global cost function
+    and Jacobian function called with array of the same parameters.
+    Each group block of the constraint depends only on its own unshared parameters and the shared ones.
+    """
+
+    nPars = len(totSig)
+    sharedIdxs = np.array([totSig.index(shPar) for shPar in sharedPars], dtype=int)
+    unsharedIdxs = np.delete(np.arange(nPars), sharedIdxs).reshape(nCostFunctions, -1)   # Row for each cost fun, intercept first
+    nUnsharedModel = unsharedIdxs.shape[1] - 1       # Intercept is not part of model()
+    nModelPars = nUnsharedModel + sharedIdxs.size
+
+    # Models are written with elementwise operations and broadcast over groups
+    xGroups = x[np.newaxis, :]
+
+    def modelArgs(pars):
+        """Model parameters of every group, unshared as columns and shared as scalars."""
+        pars = np.asarray(pars, dtype=float)
+        unshPars = pars[unsharedIdxs[:, 1:]]
+        return [p[:, np.newaxis] for p in unshPars.T] + list(pars[sharedIdxs])
+
+    def evalGroups(args):
+        return model(xGroups, *args) * np.ones((nCostFunctions, 1))
+
+    def constr(*pars):
+        """Constraint for positivity of Global model, all constraints from individual functions joined."""
+        return evalGroups(modelArgs(pars)).ravel()
+
+    def gradGroups(args):
+        """Derivatives of every group w.r.t. each model parameter, shape (nModelPars, nCostFunctions, x.size)."""
+        if modelGrad is not None:
+            return np.array([d * np.ones((nCostFunctions, 1)) for d in modelGrad(xGroups, *args)])
+
+        # Forward differences, each model parameter is shifted for all groups at once
+        f0 = evalGroups(args)
+        grads = np.zeros((nModelPars, *f0.shape))
+        for j in range(nModelPars):
+            step = 1e-7 * np.maximum(np.abs(args[j]), 1)
+            shiftedArgs = list(args)
+            shiftedArgs[j] = args[j] + step
+            grads[j] = (evalGroups(shiftedArgs) - f0) / np.reshape(step, (-1, 1))
+        return grads
+
+    # Sparsity pattern of the Jacobian, rows ordered as in constr()
+    rowsBlock = np.arange(nCostFunctions * x.size).reshape(nCostFunctions, x.size)
+    rows = np.concatenate(
+        [rowsBlock.ravel() for j in range(nModelPars)]
+        )
+    cols = np.concatenate(
+        [np.repeat(unsharedIdxs[:, j+1], x.size) for j in range(nUnsharedModel)]
+        + [np.full(rowsBlock.size, idx) for idx in sharedIdxs]
+        )
+    shape = (rowsBlock.size, nPars)
+
+    def constrJac(pars):
+        """Sparse Jacobian of constr(), receives array of parameters as passed by scipy."""
+        assert len(pars) == nPars, "Jacobian of global constraint does not support fixed parameters."
+        data = gradGroups(modelArgs(pars)).ravel()
+        return sparse.csr_matrix((data, (rows, cols)), shape=shape)
+
+    return constr, constrJac
+
+
 def extractData(ws, wsRes, ic):
     dataY = ws.extractY()
     dataE = ws.extractE()
@@ -1051,7 +1928,7 @@ def calcCostFun(model, i, x, y, yerr, res, sharedPars):
     return costFun
 
 
-def plotGlobalFit(dataX, dataY, dataE, mObj, totCost, wsName):
+def plotGlobalFit(dataX, dataY, dataE, mObj, totCost, wsName, dataYSigma):
 
     if len(dataY) > 10:    
         print("\nToo many axes to show in figure, skipping the plot ...\n")
@@ -1072,7 +1949,7 @@ def plotGlobalFit(dataX, dataY, dataE, mObj, totCost, wsName):
         ax.errorbar(x, y, yerr, fmt="k.", label=f"Data Group {i}") 
 
     # Global Fit 
-    for x, costFun, ax in zip(dataX, totCost, axs.flat):
+    for x, costFun, yfitSigma, ax in zip(dataX, totCost, dataYSigma, axs.flat):
         signature = describe(costFun)
 
         values = mObj.values[signature]
@@ -1086,12 +1963,17 @@ def plotGlobalFit(dataX, dataY, dataE, mObj, totCost, wsName):
             leg.append(f"${p} = {v:.3f} \pm {e:.3f}$")
 
         ax.fill_between(x, yfit, label="\n".join(leg), alpha=0.4)
+        ax.fill_between(x, yfit-yfitSigma, yfit+yfitSigma, color="r", alpha=0.4, label="Confidence band")
         ax.legend()
     fig.show()
     return
 
 # ------- Groupings 
 
+# Groupings already found, keyed by theta and L1 of unmasked spectra and number of groups
+groupingsCache = {}
+
+
 def groupDetectors(ipData, yFitIC):
     """
     Uses the method of k-means to find clusters in theta-L1 space.
@@ -1103,8 +1985,30 @@ def groupDetectors(ipData, yFitIC):
 
     print(f"\nNumber of gropus: {yFitIC.nGlobalFitGroups}")
 
-    L1 = ipData[:, -1].copy()
-    theta = ipData[:, 2].copy()  
+    idxList = findDetectorGroups(ipData, yFitIC.nGlobalFitGroups, yFitIC.cacheGroupings)
+
+    if yFitIC.showPlots:
+        fig, ax = plt.subplots(tight_layout=True, subplot_kw={'projection':'mantid'})  
+        fig.canvas.set_window_title("Grouping of detectors")
+        plotFinalGroups(ax, ipData, idxList)
+        fig.show()
+    return idxList
+
+
+def findDetectorGroups(ipData, nGroups, useCache=True):
+    """
+    Groups detectors with k-means in theta-L1 space.
+    Output: list of group lists containing the idx of spectra.
+    """
+
+    L1 = ipData[:, -1].astype(float)
+    theta = ipData[:, 2].astype(float)  
+
+    # Only inputs of the clustering, shape included since bytes alone do not fix the no of spectra
+    cacheKey = (len(L1), L1.tobytes(), theta.tobytes(), int(nGroups))
+    if useCache and (cacheKey in groupingsCache):
+        print("\nUsing groupings found previously for the same detectors.")
+        return [list(idxs) for idxs in groupingsCache[cacheKey]]
 
     # Normalize  ranges to similar values
     L1 /= np.sum(L1)       
@@ -1114,21 +2018,12 @@ def groupDetectors(ipData, yFitIC):
 
     points = np.vstack((L1, theta)).T
     assert points.shape == (len(L1), 2), "Wrong shape."
-    # Initial centers of groups
-    startingIdxs = np.linspace(0, len(points)-1, yFitIC.nGlobalFitGroups).astype(int)
-    centers = points[startingIdxs, :]    # Centers of cluster groups, NOT fitting parameter
-
-    if False:    # Set to True to investigate problems with groupings
-        plotDetsAndInitialCenters(L1, theta, centers)
 
-    clusters, n = kMeansClustering(points, centers)
-    idxList = formIdxList(clusters, n, len(L1))
+    clusters = kMeansClustering(points, nGroups)
+    idxList = formIdxList(clusters, nGroups, len(L1))
 
-    if yFitIC.showPlots:
-        fig, ax = plt.subplots(tight_layout=True, subplot_kw={'projection':'mantid'})  
-        fig.canvas.set_window_title("Grouping of detectors")
-        plotFinalGroups(ax, ipData, idxList)
-        fig.show()
+    if useCache:
+        groupingsCache[cacheKey] = [list(idxs) for idxs in idxList]
     return idxList
 
 
@@ -1145,19 +2040,6 @@ def checkNGroupsValid(yFitIC, ipData):
     return 
 
 
-def plotDetsAndInitialCenters(L1, theta, centers):
-    fig, ax = plt.subplots(tight_layout=True, subplot_kw={'projection':'mantid'})  
-    fig.canvas.set_window_title("Starting centroids for groupings")
-    ax.scatter(L1, theta, alpha=0.3, color="r", label="Detectors")
-    ax.scatter(centers[:, 0], centers[:, 1], color="k", label="Starting centroids")
-    ax.axes.xaxis.set_ticks([])  # Numbers plotted do not correspond to real numbers, so hide them
-    ax.axes.yaxis.set_ticks([]) 
-    ax.set_xlabel("L1")
-    ax.set_ylabel("Theta")
-    ax.legend()
-    fig.show()
-
-
 def plotFinalGroups(ax, ipData, idxList):
     for i, idxs in enumerate(idxList):
         L1 = ipData[idxs, -1]
@@ -1174,58 +2056,91 @@ def plotFinalGroups(ax, ipData, idxList):
     return
 
 
-def kMeansClustering(points, centers):
+def kMeansClustering(points, nGroups, nRestarts=50, seed=0):
     """
     Algorithm used to form groups of detectors.
     Works best for spherical groups with similar scaling on x and y axis.
-    Fails in some rare cases, solution is to try a different number of groups.
+    Runs k-means from several k-means++ starting centers and keeps the clusters with lowest inertia.
+    Seeded, so the same points always give the same groups.
+    Output: array with the group index of each point.
     """
 
-    prevCenters = centers
-    while  True:
-        clusters, nGroups = closestCenter(points, prevCenters)
-        centers = calculateCenters(points, clusters, nGroups)
+    rng = np.random.default_rng(seed)
+    bestClusters = None
+    bestInertia = np.inf
+    for i in range(nRestarts):
+        centers = kMeansPlusPlusCenters(points, nGroups, rng)
+        clusters, inertia = lloydIterations(points, centers)
 
-        if np.all(centers == prevCenters):
-            break
+        if inertia < bestInertia:
+            bestClusters, bestInertia = clusters, inertia
+    return bestClusters
 
-        assert np.isfinite(centers).all(), f"Invalid centers found:\n{centers}\nTry a different number for the groupings."
 
-        prevCenters = centers
-    clusters, n = closestCenter(points, centers)
-    return clusters, n
+def kMeansPlusPlusCenters(points, nGroups, rng):
+    """Starting centers chosen with probability proportional to the squared distance to the closest center already chosen."""
 
+    centers = np.zeros((nGroups, points.shape[1]))
+    centers[0] = points[rng.integers(len(points))]
+    minDist2 = np.sum(np.square(points - centers[0]), axis=1)
 
-def closestCenter(points, centers):
-    """Checks eahc point and assigns it to closest center."""
+    for i in range(1, nGroups):
+        if np.sum(minDist2) > 0:
+            idx = rng.choice(len(points), p=minDist2/np.sum(minDist2))
+        else:    # All points on top of centers, any point is equally good
+            idx = rng.integers(len(points))
+        centers[i] = points[idx]
+        minDist2 = np.minimum(minDist2, np.sum(np.square(points - centers[i]), axis=1))
+    return centers
 
-    clusters = np.zeros(len(points))
-    for p in range(len(points)):
 
-        minCenter = 0
-        minDist = pairDistance(points[p], centers[0])
-        for i in range(1, len(centers)): 
+def lloydIterations(points, centers, maxIter=300):
+    """Alternates between assigning points to closest center and moving centers to mean of their cluster."""
 
-            dist = pairDistance(points[p], centers[i])
+    for i in range(maxIter):
+        dist2 = squaredDistances(points, centers)
+        clusters = repairEmptyClusters(np.argmin(dist2, axis=1), dist2, len(centers))
+        newCenters = calculateCenters(points, clusters, len(centers))
+
+        if np.all(newCenters == centers):
+            break
+        centers = newCenters
+
+    inertia = np.sum(np.square(points - centers[clusters]))
+    return clusters, inertia
+
+
+def squaredDistances(points, centers):
+    """Matrix of squared distances, shape (no of points, no of centers)."""
+    return np.sum(np.square(points[:, np.newaxis, :] - centers[np.newaxis, :, :]), axis=-1)
 
-            if dist < minDist:
-                minDist = dist
-                minCenter = i
-        clusters[p] = minCenter
-    return clusters, len(centers)
 
+def repairEmptyClusters(clusters, dist2, nGroups):
+    """Moves the point furthest from its center into each empty cluster, taken from clusters with more than one point."""
 
-def pairDistance(p1, p2):
-    "Calculates the distance between two points."
-    return np.sqrt(np.sum(np.square(p1-p2)))
+    counts = np.bincount(clusters, minlength=nGroups)
+    pointDist2 = dist2[np.arange(len(clusters)), clusters]
+
+    for emptyGroup in np.flatnonzero(counts==0):
+        candidates = np.flatnonzero(counts[clusters] > 1)
+        p = candidates[np.argmax(pointDist2[candidates])]
+
+        counts[clusters[p]] -= 1
+        counts[emptyGroup] += 1
+        clusters[p] = emptyGroup
+        pointDist2[p] = 0
+    return clusters
 
 
 def calculateCenters(points, clusters, nGroups):
     """Calculates centers for the given clusters"""
 
-    centers = np.zeros((nGroups, 2))
-    for i in range(nGroups):
-        centers[i] = np.mean(points[clusters==i, :], axis=0)  # If cluster i is not present, returns nan
+    counts = np.bincount(clusters, minlength=nGroups)
+    assert np.all(counts > 0), "Empty clusters found when calculating centers."
+
+    centers = np.zeros((nGroups, points.shape[1]))
+    for j in range(points.shape[1]):
+        centers[:, j] = np.bincount(clusters, weights=points[:, j], minlength=nGroups) / counts
     return centers
 
 
@@ -1261,43 +2176,24 @@ def avgWeightDetGroups(dataX, dataY, dataE, dataRes, idxList):
     """
     assert ~np.any(np.all(dataY==0, axis=1)), f"Input data should not include masked spectra at: {np.argwhere(np.all(dataY==0, axis=1))}"
     
-    wDataX, wDataY, wDataE, wDataRes = initiateZeroArr((len(idxList), len(dataY[0])))
-
+    groupIdxs = np.full(len(dataY), -1)
     for i, idxs in enumerate(idxList):
-        groupX, groupY, groupE, groupRes = extractArrByIdx(dataX, dataY, dataE, dataRes, idxs)
-        
-        if len(groupY) == 1:   # Cannot use weight avg in single spec, wrong results
-            meanY, meanE = groupY, groupE
-            meanRes = groupRes
+        groupIdxs[idxs] = i
+        assert np.all(dataX[idxs] == dataX[idxs][0]), "X values should not change with groups"
 
-        else:
-            meanY, meanE = weightedAvgArr(groupY, groupE)
-            meanRes = np.nanmean(groupRes, axis=0)   # Nans are not present but safeguard
+    # Single pass over the data for all groups
+    acc = WeightedAvgAccumulator(dataY.shape[1], len(idxList)).add(dataY, dataE, groupIdxs)
+    wDataY, wDataE = acc.average()
 
-        assert np.all(groupX[0] == np.mean(groupX, axis=0)), "X values should not change with groups"
-        
-        wDataX[i] = groupX[0]
-        wDataY[i] = meanY
-        wDataE[i] = meanE
-        wDataRes[i] = meanRes 
+    # Groups with a single spectrum keep data as is
+    firstIdxs = [idxs[0] for idxs in idxList]
+    single = acc.counts==1
+    wDataY[single] = dataY[firstIdxs][single]
+    wDataE[single] = dataE[firstIdxs][single]
+    wDataX = dataX[firstIdxs]
+
+    wDataRes = np.array([np.nanmean(dataRes[idxs], axis=0) for idxs in idxList])   # Nans are not present but safeguard
     
     assert ~np.any(np.all(wDataY==0, axis=1)), f"Some avg weights in groups are not being performed:\n{np.argwhere(np.all(wDataY==0, axis=1))}"
 
     return wDataX, wDataY, wDataE, wDataRes
-
-
-def initiateZeroArr(shape):
-    wDataX = np.zeros(shape)
-    wDataY = np.zeros(shape)
-    wDataE = np.zeros(shape)
-    wDataRes = np.zeros(shape)  
-    return  wDataX, wDataY, wDataE, wDataRes
-
-
-def extractArrByIdx(dataX, dataY, dataE, dataRes, idxs):
-    groupE = dataE[idxs, :]
-    groupY = dataY[idxs, :]
-    groupX = dataX[idxs, :]
-    groupRes = dataRes[idxs, :]
-    return groupX, groupY, groupE, groupRes
-
@@ -1,5 +1,7 @@
 
-from .analysis_functions import iterativeFitForDataReduction, switchFirstTwoAxis
+from .analysis_functions import iterativeFitForDataReduction, switchFirstTwoAxis, loadRawAndEmptyWsFromUserPath, cropAndMaskWorkspace, \
+    arraysFromWS, histToPointData, loadInstrParsFileIntoArray, prepareFitArgs, fitNcpToArray, createTableWSForFitPars, createMeansAndStdTableWS
+from .fit_in_yspace import findDetectorGroups, WeightedAvgAccumulator, groupsOneHot
 from mantid.api import AnalysisDataService, mtd
 from mantid.simpleapi import CreateEmptyTableWorkspace
 import numpy as np
@@ -15,6 +17,9 @@ def runIndependentIterativeProcedure(IC, clearWS=True):
     # Clear worksapces before running one of the procedures below
     if clearWS:
         AnalysisDataService.clear()
+
+    if runPreview(IC):
+        return None
         
     return iterativeFitForDataReduction(IC)
 
@@ -30,6 +35,88 @@ def runJointBackAndForwardProcedure(bckwdIC, fwdIC, clearWS=True):
     return runJoint(bckwdIC, fwdIC)
 
 
+def runPreview(IC):
+    """
+    Runs preview fit when IC.noOfPreviewGroups is set, skipped for bootstrap replicas.
+    Unless IC.previewOnly, main fit is seeded with the mean parameters from the preview.
+    Returns True when main fit should not run.
+    """
+
+    if (IC.noOfPreviewGroups is None) or IC.runningSampleWS:
+        return False
+
+    groupFitPars = previewFitOfGroups(IC)
+    if IC.previewOnly:
+        return True
+
+    IC.initPars = seedParsFromPreview(IC, groupFitPars)
+    print(f"\nInitial parameters of main fit set from preview:\n{IC.initPars}\n")
+    return False
+
+
+def previewFitOfGroups(IC):
+    """
+    Quick approximate NCP fit: detectors are grouped by similar theta and L1 with k-means,
+    spectra in each group are weight averaged and fitted with the mean instrument parameters of the group.
+    Creates the usual tables of fit parameters and mean widths and intensities with suffix '_Preview'.
+    Output: best fit parameters of each group.
+    """
+
+    ws = cropAndMaskWorkspace(IC, loadRawAndEmptyWsFromUserPath(IC))
+    dataY, dataX, dataE = histToPointData(*arraysFromWS(ws))
+    instrPars = loadInstrParsFileIntoArray(IC.InstrParsPath, IC.firstSpec, IC.lastSpec)
+
+    unmasked = ~np.isin(np.arange(len(dataY)), IC.maskedDetectorIdx) & ~np.all(dataY==0, axis=1)
+    dataY, dataX, dataE, instrPars = dataY[unmasked], dataX[unmasked], dataE[unmasked], instrPars[unmasked]
+    assert np.all(dataX == dataX[0]), "Spectra need the same TOF binning to be grouped."
+
+    nGroups = min(IC.noOfPreviewGroups, len(dataY))
+    print(f"\nRunning preview fit on {nGroups} groups of detectors.")
+    idxList = findDetectorGroups(instrPars, nGroups)
+
+    groupIdxs = np.full(len(dataY), -1)
+    for i, idxs in enumerate(idxList):
+        groupIdxs[idxs] = i
+
+    acc = WeightedAvgAccumulator(dataY.shape[1], nGroups).add(dataY, dataE, groupIdxs)
+    groupY, groupE = acc.average()
+    groupX = dataX[:nGroups]
+
+    # Mean instrument parameters, first spectrum number of each group labels the group
+    groupInstrPars = groupsOneHot(groupIdxs, nGroups) @ instrPars / acc.counts[:, np.newaxis]
+    groupInstrPars[:, 0] = [instrPars[idxs[0], 0] for idxs in idxList]
+
+    resolutionPars, groupInstrPars, kinematicArrays, ySpacesForEachMass = prepareFitArgs(IC, groupX, groupInstrPars)
+
+    print("\nFitting NCP to groups:\n")
+    arrFitPars = fitNcpToArray(IC, groupY, groupE, resolutionPars, groupInstrPars, kinematicArrays, ySpacesForEachMass)
+
+    previewName = ws.name()+"_Preview"
+    createTableWSForFitPars(previewName, IC.noOfMasses, arrFitPars)
+
+    # Few groups, so widths are not filtered by deviation as in the main fit
+    groupFitPars = arrFitPars[:, 1:-2]
+    validPars = groupFitPars[~np.all(groupFitPars==0, axis=1)]
+    widths = validPars[:, 1::3]
+    intensityRatios = validPars[:, 0::3] / np.sum(validPars[:, 0::3], axis=1, keepdims=True)
+
+    createMeansAndStdTableWS(
+        previewName, IC, np.mean(widths, axis=0), np.std(widths, axis=0), 
+        np.mean(intensityRatios, axis=0), np.std(intensityRatios, axis=0)
+        )
+    return groupFitPars
+
+
+def seedParsFromPreview(IC, groupFitPars):
+    """Mean of parameters fitted to groups, kept inside bounds of the main fit."""
+
+    validGroups = ~np.all(groupFitPars==0, axis=1)
+    seedPars = np.mean(groupFitPars[validGroups], axis=0)
+    seedPars = np.fmax(seedPars, IC.bounds[:, 0])   # Nan bounds are ignored
+    seedPars = np.fmin(seedPars, IC.bounds[:, 1])
+    return seedPars
+
+
 def runPreProcToEstHRatio(bckwdIC, fwdIC):
     """
     Used when H is present and H to first mass ratio is not known.
@@ -126,7 +213,11 @@ def calculateHToMassIdxRatio(fwdScatResults):
 
 
 def runJoint(bckwdIC, fwdIC):
+    assert not(bckwdIC.previewOnly or fwdIC.previewOnly), "Preview only is available for independent procedures, not joint."
+
+    runPreview(bckwdIC)
     wsFinal, bckwdScatResults = iterativeFitForDataReduction(bckwdIC)
+    # No preview for forward, initial parameters come from backward results
     setInitFwdParsFromBackResults(bckwdScatResults, bckwdIC, fwdIC)
     wsFinal, fwdScatResults = iterativeFitForDataReduction(fwdIC)
     return wsFinal, bckwdScatResults, fwdScatResults   
@@ -68,6 +68,8 @@ def runScript(userCtr, scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC,
 
         resYFit = None
         for wsName, IC in zip(wsNames, ICs):
+            if IC.previewOnly:     # Main fit was not run
+                continue
             resYFit = fitInYSpaceProcedure(yFitIC, IC, mtd[wsName])
         
         return res, resYFit   # Return results used only in tests
@@ -0,0 +1,59 @@
+from vesuvio_analysis.core_functions.analysis_functions import passDataIntoWS
+from mantid.simpleapi import Load, CloneWorkspace, MaskDetectors
+from mantid.api import AnalysisDataService
+from pathlib import Path
+import numpy as np
+import unittest
+import numpy.testing as nptest
+testPath = Path(__file__).absolute().parent
+
+AnalysisDataService.clear()
+
+wsFinal = Load(str(testPath / "wsFinal.nxs"), OutputWorkspace="tests_pass_data")
+
+
+def perSpectrumWrite(parentWS, dataY, dataE, wsName):
+    """Previous write, clone of parent workspace written one spectrum at a time."""
+    ws = CloneWorkspace(parentWS, OutputWorkspace=wsName)
+    for i in range(ws.getNumberHistograms()):
+        ws.dataY(i)[:] = dataY[i]
+        ws.dataE(i)[:] = dataE[i]
+    return ws
+
+
+class TestPassDataIntoWS(unittest.TestCase):
+    """Workspace created in a single call against the previous write of each spectrum, on the stored workspace."""
+
+    def setUp(self):
+        self.parentWS = CloneWorkspace(wsFinal, OutputWorkspace=wsFinal.name()+"_Parent")
+        MaskDetectors(Workspace=self.parentWS, WorkspaceIndexList=[2, 5])
+        rng = np.random.default_rng(9)
+        shape = self.parentWS.extractY().shape
+        self.dataY, self.dataE = rng.normal(size=shape), rng.uniform(size=shape)
+
+        self.ws = passDataIntoWS(self.parentWS, self.dataY, self.dataE, wsFinal.name()+"_Passed")
+        self.wsPrevious = perSpectrumWrite(self.parentWS, self.dataY, self.dataE, wsFinal.name()+"_Written")
+
+    def test_data(self):
+        for extract in ["extractX", "extractY", "extractE"]:
+            nptest.assert_array_equal(getattr(self.ws, extract)(), getattr(self.wsPrevious, extract)())
+        nptest.assert_array_equal(self.ws.extractY(), self.dataY)
+
+    def test_metadata(self):
+        self.assertEqual(self.ws.getNumberHistograms(), self.wsPrevious.getNumberHistograms())
+        self.assertEqual(self.ws.getAxis(0).getUnit().unitID(), self.wsPrevious.getAxis(0).getUnit().unitID())
+        self.assertEqual(self.ws.YUnitLabel(), self.wsPrevious.YUnitLabel())
+        self.assertEqual(self.ws.isDistribution(), self.wsPrevious.isDistribution())
+        self.assertEqual(self.ws.getInstrument().getName(), self.wsPrevious.getInstrument().getName())
+
+    def test_spectra(self):
+        # Same spectrum numbers, detectors and masking as the parent
+        for i in range(self.ws.getNumberHistograms()):
+            self.assertEqual(self.ws.getSpectrum(i).getSpectrumNo(), self.wsPrevious.getSpectrum(i).getSpectrumNo())
+            self.assertEqual(set(self.ws.getSpectrum(i).getDetectorIDs()), set(self.wsPrevious.getSpectrum(i).getDetectorIDs()))
+            self.assertEqual(self.ws.spectrumInfo().isMasked(i), self.wsPrevious.spectrumInfo().isMasked(i))
+        self.assertTrue(self.ws.spectrumInfo().isMasked(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+from vesuvio_analysis.core_functions.fit_in_yspace import fitYSpaceBatch, selectFitModel, oddPointsRes
+from iminuit import Minuit, cost
+from iminuit.util import make_func_code
+from scipy import optimize, signal
+import numpy as np
+import unittest
+import numpy.testing as nptest
+
+dataX = np.linspace(-20, 20, 81)
+resY = np.exp(-dataX**2 / 2 / 1.5**2)
+resY /= np.sum(resY) * (dataX[1] - dataX[0])
+nReplicas = 4
+
+
+class YFitIC:
+    fitModel = None
+
+
+def replicaCurves(fitModel, truePars):
+    """Convolved profiles of truePars plus noise, one row for each replica."""
+    xDelta, resDense = oddPointsRes(dataX, resY)
+    curve = truePars[0] + signal.convolve(fitModel.model(dataX, *truePars[1:]), resDense, mode="same") * xDelta
+    dataE = np.full((nReplicas, dataX.size), 0.0005)
+    dataY = curve + np.random.default_rng(2).normal(size=dataE.shape) * dataE
+    return np.tile(dataX, (nReplicas, 1)), dataY, dataE
+
+
+def fitReplicaMinuit(modelFlag, dataY, dataE, startPars):
+    """Per replica fit, same steps as fitProfileMinuit()."""
+    fitModel = selectFitModel(modelFlag)
+    xDelta, resDense = oddPointsRes(dataX, resY)
+    def convolvedModel(x, y0, *pars):
+        return y0 + signal.convolve(fitModel.model(x, *pars), resDense, mode="same") * xDelta
+    convolvedModel.func_code = make_func_code(["x", "y0"] + fitModel.parNames)
+
+    m = Minuit(cost.LeastSquares(dataX, dataY, dataE, convolvedModel), *startPars)
+    fitModel.setMinuitLimits(m)
+    m.simplex()
+    if modelFlag=="SINGLE_GAUSSIAN":
+        m.migrad()
+    else:
+        def constrFunc(*pars):
+            return fitModel.model(dataX, *pars[1:])
+        m.scipy(constraints=optimize.NonlinearConstraint(constrFunc, 0, np.inf))
+    m.hesse()
+    chi2 = m.fval / (len(dataX)-m.nfit)
+    return np.append(m.values, chi2), np.append(m.errors, 0)
+
+
+class TestBatchFit(unittest.TestCase):
+    """Batch fit of replicas compared with fitting each replica with Minuit."""
+
+    def compareWithMinuit(self, modelFlag, truePars, parentPars, perrRtol):
+        yFitIC = YFitIC()
+        yFitIC.fitModel = modelFlag
+        x, dataY, dataE = replicaCurves(selectFitModel(modelFlag), truePars)
+
+        popt, perr = fitYSpaceBatch(yFitIC, x, dataY, dataE, resY, parentPars)
+
+        for i in range(nReplicas):
+            poptMinuit, perrMinuit = fitReplicaMinuit(modelFlag, dataY[i], dataE[i], parentPars)
+            # Same minimum up to the tolerance of Minuit, small compared to the errors
+            nptest.assert_array_less(np.abs(popt[i, :-1] - poptMinuit[:-1]), 0.01 * perrMinuit[:-1])
+            nptest.assert_allclose(popt[i, -1], poptMinuit[-1], rtol=1e-6)
+            nptest.assert_allclose(perr[i], perrMinuit, rtol=perrRtol)
+
+    def test_single_gaussian(self):
+        self.compareWithMinuit("SINGLE_GAUSSIAN", [0, 1, 0.2, 5], [0, 1, 0.2, 5.1], perrRtol=0.01)
+
+    def test_gram_charlier(self):
+        # Batch errors from J^T J only, Hesse includes the second derivatives of the model,
+        # which matter for the strongly correlated A, sigma1 and c4
+        self.compareWithMinuit("GC_C4", [0, 1, 0.2, 5, 0.3], [0, 1, 0.2, 5.1, 0.25], perrRtol=0.15)
+
+
+if __name__ == "__main__":
+    unittest.main()
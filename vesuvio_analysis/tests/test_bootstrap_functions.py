@@ -0,0 +1,563 @@
+from vesuvio_analysis.core_functions import analysis_functions, bootstrap
+from vesuvio_analysis.core_functions.bootstrap import bootstrapResidualsSample, jackknifeColumns, formSampleIC, replicaGenerators, \
+    replicaCorrectionsTol, estimateBootstrapRunTime, stageRunTimes, workersCalibration, ParentData, createSampleWS, \
+    BootScattResults, checkpointAttrs, resumeFromCheckpoints, missingReplicas, flushBootstrapStores, closeBootstrapStores, \
+    checkParallelWorkers, runReplicasParallel
+from vesuvio_analysis.core_functions.bootstrap_analysis import jackknifeStd
+from vesuvio_analysis.core_functions.ICHelpers import noOfJackknifeGroups
+from vesuvio_analysis.core_functions.analysis_functions import leaveGroupsOutShifts
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+from pathlib import Path
+import tempfile
+import io
+from unittest import mock
+import unittest
+import numpy as np
+import numpy.testing as nptest
+
+residuals = np.random.default_rng(0).normal(size=(12, 319))
+
+
+def bootstrapResidualsLoop(residuals):
+    """Previous sampling, one spectrum at a time from the global numpy random state."""
+    bootRes = np.zeros(residuals.shape)
+    for i, res in enumerate(residuals):
+        rowIdxs = np.random.randint(0, len(res), len(res))    # [low, high)
+        bootRes[i] = res[rowIdxs]
+    return bootRes
+
+
+class TestBootstrapResidualsSample(unittest.TestCase):
+
+    def test_same_as_loop(self):
+        np.random.seed(1)
+        samples = [bootstrapResidualsSample(residuals) for i in range(3)]
+        np.random.seed(1)
+        loopSamples = [bootstrapResidualsLoop(residuals) for i in range(3)]
+        nptest.assert_array_equal(samples, loopSamples)
+
+    def test_points_from_same_spectrum(self):
+        sample = bootstrapResidualsSample(residuals, np.random.default_rng(1))
+        for res, bootRes in zip(residuals, sample):
+            self.assertTrue(np.all(np.isin(bootRes, res)))
+
+    def test_blocks(self):
+        blockLengths = np.full(len(residuals), 5)
+        sample = bootstrapResidualsSample(residuals, np.random.default_rng(1), blockLengths)
+        # Points within each block are consecutive in the residuals
+        for res, bootRes in zip(residuals, sample):
+            idxs = np.array([np.flatnonzero(res==value)[0] for value in bootRes])
+            blocks = idxs[:len(idxs) - len(idxs) % 5].reshape(-1, 5)
+            nptest.assert_array_equal(np.diff(blocks, axis=1), 1)
+
+
+class TestJackknifeGroups(unittest.TestCase):
+
+    def test_columns_deleted_once(self):
+        for grouping in ["CONTIGUOUS", "STRIDED"]:
+            bootIC = SimpleNamespace(jackknifeGroupSize=4, jackknifeGrouping=grouping)
+            nGroups = noOfJackknifeGroups(20, bootIC)
+            cols = [jackknifeColumns(j, 20, bootIC) for j in range(nGroups)]
+            self.assertEqual(nGroups, 5)
+            self.assertTrue(all(len(c)==4 for c in cols))
+            nptest.assert_array_equal(np.sort(np.concatenate(cols)), np.arange(20))
+
+    def test_unequal_groups_rejected(self):
+        bootIC = SimpleNamespace(jackknifeGroupSize=3, jackknifeGrouping="CONTIGUOUS")
+        with self.assertRaises(AssertionError):
+            noOfJackknifeGroups(20, bootIC)
+
+
+class TestJackknifeStd(unittest.TestCase):
+    """Jackknife of the mean, for which the std is known in closed form."""
+
+    def setUp(self):
+        self.data = np.random.default_rng(3).normal(size=(2, 24))
+
+    def jackknifeMeans(self, groupSize):
+        bootIC = SimpleNamespace(jackknifeGroupSize=groupSize, jackknifeGrouping="CONTIGUOUS")
+        nBins = self.data.shape[-1]
+        samples = []
+        for j in range(noOfJackknifeGroups(nBins, bootIC)):
+            kept = np.delete(self.data, jackknifeColumns(j, nBins, bootIC), axis=-1)
+            samples.append(np.mean(kept, axis=-1))
+        return np.array(samples).T
+
+    def test_single_bins(self):
+        # Usual jackknife of the mean gives the standard error of the mean
+        stdErr = np.std(self.data, axis=-1, ddof=1) / np.sqrt(self.data.shape[-1])
+        nptest.assert_allclose(jackknifeStd(self.jackknifeMeans(1)), stdErr)
+
+    def test_groups(self):
+        # Deleting groups gives the standard error from the means of the groups
+        groupMeans = np.mean(self.data.reshape(2, 6, 4), axis=-1)
+        stdErr = np.std(groupMeans, axis=-1, ddof=1) / np.sqrt(6)
+        nptest.assert_allclose(jackknifeStd(self.jackknifeMeans(4)), stdErr)
+
+    def test_all_groups_present(self):
+        samples = self.jackknifeMeans(4)
+        nptest.assert_allclose(jackknifeStd(samples, samples.shape[-1]), jackknifeStd(samples))
+
+    def test_failed_replicas(self):
+        # Samples repeated twice, so losing one copy of each leaves the spread of the samples unchanged
+        samples = self.jackknifeMeans(4)
+        repeated = np.concatenate([samples, samples], axis=-1)
+        nptest.assert_allclose(jackknifeStd(samples, repeated.shape[-1]), jackknifeStd(repeated))
+
+
+class TestLeaveGroupsOutShifts(unittest.TestCase):
+    """Shifts are exact for a model linear in the parameters, compared with refitting without each group."""
+
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        x = np.linspace(-5, 5, 40)
+        self.design = np.stack([np.ones(x.size), x, np.exp(-x**2 / 2)], axis=1)
+        self.dataE = rng.uniform(0.5, 1.5, x.size)
+        self.dataY = self.design @ [0.3, -0.1, 2] + rng.normal(size=x.size) * self.dataE
+
+    def weightedFit(self, rows):
+        return np.linalg.lstsq(self.design[rows] / self.dataE[rows, np.newaxis], self.dataY[rows] / self.dataE[rows], rcond=None)[0]
+
+    def shiftsFromParent(self, design, groupOfColumns, nGroups):
+        parentPars = self.weightedFit(np.arange(self.dataY.size))
+        residuals = (self.dataY - self.design @ parentPars) / self.dataE
+        jac = design / self.dataE[:, np.newaxis]
+        return parentPars, leaveGroupsOutShifts(residuals, jac, groupOfColumns, nGroups)
+
+    def test_same_as_refit(self):
+        bootIC = SimpleNamespace(jackknifeGroupSize=4, jackknifeGrouping="STRIDED")
+        groupOfColumns = np.full(self.dataY.size, -1)
+        for j in range(9):       # Last 4 columns never deleted
+            groupOfColumns[jackknifeColumns(j, 36, bootIC)] = j
+
+        parentPars, shifts = self.shiftsFromParent(self.design, groupOfColumns, 9)
+
+        self.assertEqual(shifts.shape, (9, 3))
+        for j in range(9):
+            refitPars = self.weightedFit(groupOfColumns!=j)
+            nptest.assert_allclose(parentPars + shifts[j], refitPars, rtol=1e-10, atol=1e-12)
+
+    def test_parameter_without_effect(self):
+        # Parameter that does not change the model is never shifted, others as without it
+        groupOfColumns = np.arange(self.dataY.size)
+        design = np.concatenate([self.design, np.zeros((self.dataY.size, 1))], axis=1)
+
+        parentPars, shifts = self.shiftsFromParent(design, groupOfColumns, self.dataY.size)
+        parentPars, shiftsFull = self.shiftsFromParent(self.design, groupOfColumns, self.dataY.size)
+
+        nptest.assert_array_equal(shifts[:, -1], 0)
+        nptest.assert_allclose(shifts[:, :-1], shiftsFull, rtol=1e-8, atol=1e-12)
+
+
+class TestWarmStartReplicas(unittest.TestCase):
+
+    def setUp(self):
+        # Parent best fit parameters of 2 spectra at each of 3 MS iterations
+        self.fitPars = np.arange(3*2*6, dtype=float).reshape(3, 2, 6) + 1
+        self.parentData = {"fwd": SimpleNamespace(fitPars=self.fitPars)}
+
+    def replicaInitPars(self, skipMSIterations, warmStartReplicas=True):
+        bckwdIC, fwdIC = SimpleNamespace(), SimpleNamespace(noOfMSIterations=2)
+        bootIC = SimpleNamespace(procedure="FORWARD", runningJackknife=False, skipMSIterations=skipMSIterations,
+                                 warmStartReplicas=warmStartReplicas, replicaCorrections="RECOMPUTE", verboseReplicas=False)
+        formSampleIC(bckwdIC, fwdIC, bootIC, {"fwdWS": "sample"}, {"fwdWS": "parent"}, self.parentData)
+        return fwdIC.replicaInitPars
+
+    def test_each_MS_iteration(self):
+        nptest.assert_array_equal(self.replicaInitPars(skipMSIterations=False), self.fitPars)
+
+    def test_skip_MS_iterations(self):
+        # Single fit of the replica starts from the parent fit of the last corrected ws
+        replicaInitPars = self.replicaInitPars(skipMSIterations=True)
+        self.assertEqual(len(replicaInitPars), 1)
+        nptest.assert_array_equal(replicaInitPars[0], self.fitPars[-1])
+
+    def test_no_warm_start(self):
+        self.assertIsNone(self.replicaInitPars(skipMSIterations=False, warmStartReplicas=False))
+
+    def test_failed_parent_fit(self):
+        # Spectrum with zero parent parameters starts from initPars
+        ic = SimpleNamespace(initPars=np.array([1., 12, 0, 1, 16, 0]))
+        specInitPars = np.array([[2., 13, 0.1, 2, 17, 0.1], np.zeros(6), [3., 14, 0.2, 3, 18, 0.2]])
+        dataY = np.ones((3, 10))
+
+        usedInitPars = []
+        def fitSpec(dataY, dataE, ySpaces, resolutionPars, instrPars, kinematicArrays, ic, initPars, fitInfo):
+            usedInitPars.append(initPars)
+            return np.ones(len(ic.initPars)+3)
+
+        with mock.patch.object(analysis_functions, "fitNcpToSingleSpec", side_effect=fitSpec):
+            analysis_functions.fitNcpToArray(ic, dataY, dataY, *[np.zeros((3, 1))]*4, specInitPars)
+
+        nptest.assert_array_equal(usedInitPars, [specInitPars[0], ic.initPars, specInitPars[2]])
+
+
+class TestReplicaGenerators(unittest.TestCase):
+
+    def bootIC(self, masterSeed, nWorkers, runningJackknife=False):
+        return SimpleNamespace(masterSeed=masterSeed, nWorkers=nWorkers, runningJackknife=runningJackknife)
+
+    def test_serial_without_seed(self):
+        # Global random state, as used for the stored bootstrap samples
+        bootIC = self.bootIC(None, 1)
+        self.assertEqual(replicaGenerators(bootIC, 3), [None] * 3)
+        self.assertIsNone(bootIC.masterSeed)
+
+    def test_same_seed_any_workers(self):
+        samples = [[bootstrapResidualsSample(residuals, rng) for rng in replicaGenerators(self.bootIC(5, nWorkers), 3)]
+                   for nWorkers in [1, 4]]
+        nptest.assert_array_equal(samples[0], samples[1])
+
+    def test_parallel_without_seed(self):
+        # Seed drawn from global random state and kept to resume the run
+        np.random.seed(2)
+        bootIC = self.bootIC(None, 4)
+        rngs = replicaGenerators(bootIC, 3)
+        self.assertIsNotNone(bootIC.masterSeed)
+        np.random.seed(2)
+        sameRngs = replicaGenerators(self.bootIC(None, 4), 3)
+        nptest.assert_array_equal([r.random() for r in rngs], [r.random() for r in sameRngs])
+
+    def test_jackknife(self):
+        self.assertEqual(replicaGenerators(self.bootIC(5, 4, runningJackknife=True), 2), [None] * 2)
+
+
+class TestCheckParallelWorkers(unittest.TestCase):
+
+    def check(self, nWorkers, startMethods, infinitesimalJackknife=False):
+        bootIC = SimpleNamespace(nWorkers=nWorkers, runningJackknife=infinitesimalJackknife, infinitesimalJackknife=infinitesimalJackknife)
+        with mock.patch.object(bootstrap.mp, "get_all_start_methods", return_value=startMethods):
+            checkParallelWorkers(bootIC)
+
+    def test_without_fork(self):
+        # Not run serially without notice
+        with self.assertRaises(ValueError):
+            self.check(2, ["spawn"])
+
+    def test_serial_without_fork(self):
+        self.check(1, ["spawn"])
+
+    def test_infinitesimal_jackknife_without_fork(self):
+        self.check(2, ["spawn"], infinitesimalJackknife=True)
+
+    def test_with_fork(self):
+        self.check(4, ["fork", "spawn", "forkserver"])
+
+
+@unittest.skipUnless("fork" in bootstrap.mp.get_all_start_methods(), "Parallel replicas need fork.")
+class TestRunReplicasParallel(unittest.TestCase):
+    """Forked workers with a replica standing in for the procedure, against running replicas serially."""
+
+    def setUp(self):
+        self.parentResults = SimpleNamespace(all_spec_best_par_chi_nit=np.ones((2, 3, 8)))
+        bckwdIC, fwdIC = [SimpleNamespace(resultsSavePath=Path("results.npz"), ySpaceFitSavePath=Path("yfit.npz")) for i in range(2)]
+        self.ICs = (bckwdIC, fwdIC, SimpleNamespace(nWorkers=3, masterSeed=7, runningJackknife=False), SimpleNamespace())
+
+        patcher = mock.patch.multiple(bootstrap, runReplica=self.fakeReplica, AnalysisDataService=FakeADS())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fakeReplica(self, bckwdIC, fwdIC, bootIC, yFitIC, parentData, i, rng):
+        fitPars = np.full((2, 3, 8), float(i))
+        fitPars[..., :-1] += rng.normal(size=(2, 3, 7))
+        return {"fwdScat": SimpleNamespace(all_spec_best_par_chi_nit=fitPars)}
+
+    def test_same_as_serial(self):
+        bootIC = self.ICs[2]
+        rngs = replicaGenerators(bootIC, 10)
+        parallelResults = {"fwdScat": BootScattResults(self.parentResults, 10, None)}
+        runReplicasParallel(parallelResults, *self.ICs, None, list(range(10)), rngs)
+
+        serialResults = {"fwdScat": BootScattResults(self.parentResults, 10, None)}
+        for i, rng in enumerate(replicaGenerators(bootIC, 10)):
+            serialResults["fwdScat"].storeBootIterResults(i, self.fakeReplica(*self.ICs, None, i, rng)["fwdScat"])
+
+        nptest.assert_array_equal(parallelResults["fwdScat"].bootSamples, serialResults["fwdScat"].bootSamples)
+        nptest.assert_array_equal(parallelResults["fwdScat"].bootIterations, serialResults["fwdScat"].bootIterations)
+
+
+class TestParentCorrectionsToReuse(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.parentY = rng.uniform(1, 2, (3, 10))
+        self.parentY[2] = 0       # Masked spectrum
+        self.msY, self.msE = rng.uniform(0, 0.1, (2, 3, 10))
+        self.gcY, self.gcE = rng.uniform(0, 0.1, (2, 3, 10))
+        self.parentCorrections = {0: {
+            "meanWidths": np.array([5., 10]), "meanIntensityRatios": np.array([0.6, 0.4]),
+            "dataIntegrals": np.sum(self.parentY, axis=1),
+            "_MulScattering": (self.msY, self.msE), "_Gamma_Background": (self.gcY, self.gcE)
+            }}
+        # Replica with more counts in first spectrum and fewer in second
+        self.replicaY = self.parentY * np.array([[1.2], [0.9], [1]])
+
+    def replicaIC(self, replicaCorrections, runningJackknife=False, verboseReplicas=False):
+        bootIC = SimpleNamespace(replicaCorrections=replicaCorrections, correctionsDriftTol=0.02)
+        return SimpleNamespace(name="sample", runningSampleWS=True, runningJackknife=runningJackknife, verboseReplicas=verboseReplicas,
+                               parentCorrections=self.parentCorrections, correctionsDriftTol=replicaCorrectionsTol(bootIC))
+
+    def corrections(self, ic, meanWidths, meanIntensityRatios=np.array([0.6, 0.4])):
+        ws = SimpleNamespace(extractY=lambda: self.replicaY, extractX=lambda: np.tile(np.arange(11.), (3, 1)), isDistribution=lambda: False)
+        output = io.StringIO()
+        with mock.patch.object(analysis_functions, "mtd", {"sample": ws}), redirect_stdout(output):
+            corrections = analysis_functions.parentCorrectionsToReuse(ic, 0, meanWidths, meanIntensityRatios)
+        return corrections, output.getvalue()
+
+    def assertScaled(self, corrections):
+        scales = np.array([[1.2], [0.9], [1]])     # Masked spectrum left unscaled
+        for suffix, (dataY, dataE) in zip(["_MulScattering", "_Gamma_Background"], [(self.msY, self.msE), (self.gcY, self.gcE)]):
+            nptest.assert_allclose(corrections[suffix][0], dataY * scales)
+            nptest.assert_allclose(corrections[suffix][1], dataE * scales)
+
+    def test_reuse(self):
+        # Reused regardless of drift, scaled to the counts of the replica
+        corrections, output = self.corrections(self.replicaIC("REUSE"), np.array([6., 10]))
+        self.assertScaled(corrections)
+        self.assertEqual(output, "")
+
+    def test_drift_within_tolerance(self):
+        corrections, output = self.corrections(self.replicaIC("DRIFT"), np.array([5.05, 10]))
+        self.assertScaled(corrections)
+
+    def test_drift_beyond_tolerance(self):
+        corrections, output = self.corrections(self.replicaIC("DRIFT"), np.array([5., 10]), np.array([0.63, 0.37]))
+        self.assertIsNone(corrections)
+
+    def test_nan_drift(self):
+        corrections, output = self.corrections(self.replicaIC("DRIFT"), np.array([np.nan, 10]))
+        self.assertIsNone(corrections)
+
+    def test_recompute(self):
+        ic = self.replicaIC("RECOMPUTE")
+        ic.parentCorrections = None        # Not cached by parent
+        self.assertIsNone(self.corrections(ic, np.array([5., 10]))[0])
+
+    def test_jackknife(self):
+        # Corrections of jackknife replicas come from the parent ws, so are not scaled
+        corrections, output = self.corrections(self.replicaIC("REUSE", runningJackknife=True), np.array([5., 10]))
+        self.assertIs(corrections, self.parentCorrections[0])
+
+    def test_verbose(self):
+        output = [self.corrections(self.replicaIC("DRIFT", verboseReplicas=True), np.array([widths, 10]))[1] for widths in [5., 6.]]
+        self.assertIn("Reusing", output[0])
+        self.assertIn("recomputing", output[1])
+
+
+class TestBootstrapRunTime(unittest.TestCase):
+
+    def setUp(self):
+        # Fits take 1e-3 s per spectrum, bin and mass, corrections 1e-3 s per spectrum and bin
+        self.record = {"mode": "FORWARD", "nSpec": 10, "nBins": 100, "nMasses": 2, "MSCorrection": True, "GammaCorrection": True,
+                       "tFits": [2., 2., 2.], "tCorrections": [1., 1.]}
+        self.runTimes = {"procedures": [self.record], "bootstrap": []}
+
+    def procedureIC(self, nSpec=20, nMasses=2, noOfMSIterations=2, saveRunTimes=True):
+        return SimpleNamespace(modeRunning="FORWARD", noOfMSIterations=noOfMSIterations, MSCorrectionFlag=True, GammaCorrectionFlag=True,
+                               runTimeScales={"nSpec": nSpec, "nBins": 100, "nMasses": nMasses}, saveRunTimes=saveRunTimes, runningSampleWS=False)
+
+    def bootIC(self, nWorkers=1, skipMSIterations=False):
+        return SimpleNamespace(procedure="FORWARD", runningJackknife=False, nSamples=10, nWorkers=nWorkers, skipMSIterations=skipMSIterations)
+
+    def test_stage_run_times_scaled(self):
+        tFit, tCorrection = stageRunTimes(self.procedureIC(nSpec=20, nMasses=3), self.runTimes)
+        self.assertAlmostEqual(tFit, 6)
+        self.assertAlmostEqual(tCorrection, 2)
+
+    def test_no_stored_procedures(self):
+        runTimes = {"procedures": [], "bootstrap": []}
+        self.assertIsNone(estimateBootstrapRunTime(None, self.procedureIC(), self.bootIC(), runTimes))
+
+    def test_parent_and_replicas(self):
+        # Each procedure runs 3 fits of 4 s and 2 corrections of 2 s, parent and 10 replicas
+        runTime = estimateBootstrapRunTime(None, self.procedureIC(), self.bootIC(), self.runTimes)
+        self.assertAlmostEqual(runTime, 11 * 16)
+
+    def test_skip_MS_iterations(self):
+        # Replicas run a single fit
+        runTime = estimateBootstrapRunTime(None, self.procedureIC(), self.bootIC(skipMSIterations=True), self.runTimes)
+        self.assertAlmostEqual(runTime, 16 + 10 * 4)
+
+    def test_workers_calibration(self):
+        self.assertEqual(workersCalibration(self.bootIC(nWorkers=4), self.runTimes), 0.25)
+        self.runTimes["bootstrap"] = [{"nWorkers": 4, "tReplicas": t, "tEstimate": 100} for t in [30, 40, 60]] \
+            + [{"nWorkers": 1, "tReplicas": 150, "tEstimate": 100}]
+        self.assertAlmostEqual(workersCalibration(self.bootIC(nWorkers=4), self.runTimes), 0.4)
+        runTime = estimateBootstrapRunTime(None, self.procedureIC(), self.bootIC(nWorkers=4), self.runTimes)
+        self.assertAlmostEqual(runTime, 16 + 10 * 16 * 0.4)
+
+    def test_saved_only_when_set(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            for saveRunTimes in [False, True]:
+                ic = self.procedureIC(nSpec=10, saveRunTimes=saveRunTimes)
+                ic.runTimesPath = Path(tmpDir) / "running_times.json"
+                analysis_functions.saveProcedureRunTimes(ic, self.record["tFits"], self.record["tCorrections"])
+                self.assertEqual(ic.runTimesPath.is_file(), saveRunTimes)
+
+            self.assertEqual(analysis_functions.loadRunTimes(ic.runTimesPath), self.runTimes)
+
+    def test_replicas_not_saved(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            ic = self.procedureIC()
+            ic.runningSampleWS = True
+            ic.runTimesPath = Path(tmpDir) / "running_times.json"
+            analysis_functions.saveProcedureRunTimes(ic, [1.], [1.])
+            self.assertFalse(ic.runTimesPath.is_file())
+
+
+class FakeWS:
+    """Workspace holding arrays, counts extractions of its data."""
+    def __init__(self, name, dataY, dataE):
+        self.wsName, self.dataY, self.dataE = name, dataY, dataE
+        self.nExtracts = 0
+
+    def name(self):
+        return self.wsName
+
+    def extractY(self):
+        self.nExtracts += 1
+        return self.dataY.copy()
+
+    def extractE(self):
+        self.nExtracts += 1
+        return self.dataE.copy()
+
+
+class FakeADS(dict):
+    def addOrReplace(self, name, ws):
+        self[name] = ws
+
+
+class TestParentData(unittest.TestCase):
+    """Replicas formed from the parent arrays kept in memory, while the ADS is cleared between replicas."""
+
+    def setUp(self):
+        rng = np.random.default_rng(10)
+        self.dataY = rng.normal(1, 0.1, (4, 21))
+        self.dataE = rng.uniform(0.05, 0.1, (4, 21))
+        self.ncp = rng.normal(1, 0.05, (4, 20))
+        self.ads = FakeADS()
+
+        def passData(parentWS, dataY, dataE, wsName):
+            return FakeWS(wsName, dataY, dataE)
+
+        patcher = mock.patch.multiple(bootstrap, CloneWorkspace=lambda ws, StoreInADS: ws, AnalysisDataService=self.ads, 
+                                      mtd=self.ads, passDataIntoWS=passData)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.parentWS = FakeWS("Parent_Back", self.dataY, self.dataE)
+        self.parentNCP = FakeWS("Parent_Back_Profiles", self.ncp, np.zeros(self.ncp.shape))
+        self.parentData = {"bckwd": ParentData(self.parentWS, self.parentNCP, "Parent_Back")}
+
+    def bootIC(self, runningJackknife):
+        return SimpleNamespace(runningJackknife=runningJackknife, jackknifeGroupSize=4, jackknifeGrouping="CONTIGUOUS")
+
+    def test_bootstrap_replicas(self):
+        residuals = self.dataY[:, :-1] - self.ncp
+        for seed in range(3):
+            self.ads.clear()      # Cleared at each replica
+            sampleWS, parentWS = createSampleWS(self.parentData, 0, self.bootIC(False), np.random.default_rng(seed))
+
+            expectedY = self.ncp + bootstrapResidualsSample(residuals, np.random.default_rng(seed))
+            nptest.assert_array_equal(sampleWS["bckwdWS"].dataY[:, :-1], expectedY)
+            nptest.assert_array_equal(sampleWS["bckwdWS"].dataY[:, -1], self.dataY[:, -1])
+            nptest.assert_array_equal(sampleWS["bckwdWS"].dataE, self.dataE)
+            self.assertIs(parentWS["bckwdWS"], self.ads["Parent_Back"])
+            self.assertIs(parentWS["bckwdNCP"], self.ads["Parent_Back_NCP"])
+
+        # Parent data extracted once, when stored
+        self.assertEqual(self.parentWS.nExtracts, 2)
+        self.assertEqual(self.parentNCP.nExtracts, 1)
+
+    def test_jackknife_replicas(self):
+        for j in range(5):
+            self.ads.clear()
+            sampleWS, parentWS = createSampleWS(self.parentData, j, self.bootIC(True))
+            jackY, jackE = sampleWS["bckwdWS"].dataY, sampleWS["bckwdWS"].dataE
+            cols = np.arange(4*j, 4*j+4)
+            nptest.assert_array_equal(jackY[:, cols], 0)
+            nptest.assert_array_equal(jackE[:, cols], 0)
+            nptest.assert_array_equal(np.delete(jackY, cols, axis=1), np.delete(self.dataY, cols, axis=1))
+            self.assertIn("Parent_Back", self.ads)
+
+        # Parent arrays are not changed by the replicas
+        nptest.assert_array_equal(self.parentData["bckwd"].dataY, self.dataY)
+        nptest.assert_array_equal(self.parentData["bckwd"].dataE, self.dataE)
+
+
+class TestBootSamplesStore(unittest.TestCase):
+    """Replicas stored in the memory mapped files, interrupted and resumed, then consolidated."""
+
+    def setUp(self):
+        tmpDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpDir.cleanup)
+        self.IC = SimpleNamespace(bootSavePath=Path(tmpDir.name) / "boot.npz", bootSavePathLog="boot log")
+
+        rng = np.random.default_rng(11)
+        self.parentResults = SimpleNamespace(all_spec_best_par_chi_nit=rng.uniform(1, 2, (3, 2, 8)))
+        self.replicaResults = [SimpleNamespace(all_spec_best_par_chi_nit=rng.uniform(1, 2, (3, 2, 8))) for i in range(4)]
+
+    def bootIC(self, resumeRun=False, masterSeed=5, nSamples=4):
+        bootIC = SimpleNamespace(**{attr: None for attr in checkpointAttrs})
+        bootIC.resumeRun, bootIC.masterSeed, bootIC.nSamples = resumeRun, masterSeed, nSamples
+        return bootIC
+
+    def openedResults(self, bootIC):
+        bootResults = {"bckwdScat": BootScattResults(self.parentResults, bootIC.nSamples, None)}
+        bootResults["bckwdScat"].openStore(self.IC, bootIC)
+        return bootResults
+
+    def storeReplicas(self, bootResults, idxs):
+        for i in idxs:
+            bootResults["bckwdScat"].storeBootIterResults(i, self.replicaResults[i])
+        flushBootstrapStores(bootResults)
+
+    def test_round_trip(self):
+        bootResults = self.openedResults(self.bootIC())
+        self.storeReplicas(bootResults, [0, 2])
+        del bootResults      # Interrupted run, store is not closed
+
+        bootIC = self.bootIC(resumeRun=True, masterSeed=None)
+        bootResults = {"bckwdScat": BootScattResults(self.parentResults, 4, None)}
+        self.assertTrue(resumeFromCheckpoints(bootResults, self.IC, None, bootIC))
+        self.assertEqual(bootIC.masterSeed, 5)    # Seed of interrupted run
+
+        bootResults["bckwdScat"].openStore(self.IC, bootIC)
+        self.assertEqual(missingReplicas(bootResults, 0, 4), [1, 3])
+        self.storeReplicas(bootResults, [1, 3])
+
+        closeBootstrapStores(bootResults)
+        self.assertFalse(any(self.IC.bootSavePath.parent.glob("*_samples*")))
+        bootResults["bckwdScat"].saveResults(self.IC)
+
+        stored = np.load(self.IC.bootSavePath)
+        nptest.assert_array_equal(stored["boot_samples"], [r.all_spec_best_par_chi_nit[-1] for r in self.replicaResults])
+        nptest.assert_array_equal(stored["boot_iterations"], [np.sum(r.all_spec_best_par_chi_nit[:, :, -1], axis=1) for r in self.replicaResults])
+        nptest.assert_array_equal(stored["parent_result"], self.parentResults.all_spec_best_par_chi_nit[-1])
+
+    def test_no_run_to_resume(self):
+        bootResults = {"bckwdScat": BootScattResults(self.parentResults, 4, None)}
+        self.assertFalse(resumeFromCheckpoints(bootResults, self.IC, None, self.bootIC(resumeRun=True)))
+
+    def test_new_run_overwrites(self):
+        self.storeReplicas(self.openedResults(self.bootIC()), [0])
+        bootResults = self.openedResults(self.bootIC(resumeRun=False))
+        self.assertEqual(missingReplicas(bootResults, 0, 4), [0, 1, 2, 3])
+
+    def test_different_settings(self):
+        self.openedResults(self.bootIC())
+        bootIC = self.bootIC(resumeRun=True)
+        bootIC.blockBootstrap = True
+        with self.assertRaises(ValueError):
+            resumeFromCheckpoints({"bckwdScat": BootScattResults(self.parentResults, 4, None)}, self.IC, None, bootIC)
+
+    def test_different_shape(self):
+        self.openedResults(self.bootIC())
+        with self.assertRaises(ValueError):
+            self.openedResults(self.bootIC(resumeRun=True, nSamples=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
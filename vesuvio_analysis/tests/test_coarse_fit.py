@@ -0,0 +1,59 @@
+from vesuvio_analysis.core_functions.analysis_functions import arraysFromWS, histToPointData, prepareFitArgs, fitNcpToArray, fitNcpToCoarseBins
+from vesuvio_analysis.core_functions.ICHelpers import completeICFromInputs
+from mantid.simpleapi import Load
+from pathlib import Path
+import numpy as np
+import unittest
+import numpy.testing as nptest
+from .tests_IC import scriptName, wsFrontIC, fwdIC
+testPath = Path(__file__).absolute().parent
+
+completeICFromInputs(fwdIC, scriptName, wsFrontIC)
+
+class CoarseForwardIC(fwdIC):
+    coarseTOFBinningFactor = 4
+
+wsFinal = Load(str(testPath / "wsFinal.nxs"), OutputWorkspace="tests_coarse_fit")
+dataY, dataX, dataE = histToPointData(*arraysFromWS(wsFinal))
+fitArgs = prepareFitArgs(fwdIC, dataX)
+
+directNfevs, seededNfevs = np.zeros(len(dataY)), np.zeros(len(dataY))
+directPars = fitNcpToArray(fwdIC, dataY, dataE, *fitArgs, nfevs=directNfevs)
+coarsePars = fitNcpToCoarseBins(CoarseForwardIC, dataY, dataX, dataE, fitArgs[1])
+seededPars = fitNcpToArray(CoarseForwardIC, dataY, dataE, *fitArgs, coarsePars, seededNfevs)
+
+
+class TestCoarseSeededFit(unittest.TestCase):
+    """
+    Fit seeded from coarse binning compared with fit from initial parameters on the stored workspace.
+    Centers of the heavier masses are poorly determined and can end far apart at the same chi2, so are not compared.
+    """
+    def setUp(self):
+        self.fitted = ~np.all(directPars==0, axis=1)
+        self.direct = directPars[self.fitted]
+        self.seeded = seededPars[self.fitted]
+
+    def test_skipped_spectra(self):
+        nptest.assert_array_equal(np.all(seededPars==0, axis=1), ~self.fitted)
+
+    def test_chi2(self):
+        nptest.assert_allclose(self.seeded[:, -2], self.direct[:, -2], rtol=1e-5)
+
+    def test_intensities(self):
+        nptest.assert_allclose(self.seeded[:, 1:-2:3], self.direct[:, 1:-2:3], atol=1e-3)
+
+    def test_widths(self):
+        nptest.assert_allclose(self.seeded[:, 2:-2:3], self.direct[:, 2:-2:3], atol=1e-2)
+
+    def test_H_center(self):
+        nptest.assert_allclose(self.seeded[:, 3], self.direct[:, 3], atol=1e-2)
+
+    def test_function_evaluations(self):
+        # Evaluations on the requested binning, coarse pass is reported separately
+        self.assertLess(np.sum(seededNfevs), np.sum(directNfevs))
+        nptest.assert_array_equal(directNfevs[~self.fitted], 0)
+        self.assertTrue(np.all(coarsePars[self.fitted, -1] > 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+from vesuvio_analysis.core_functions.fit_in_yspace import selectModelAndPars
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import unittest
+import numpy.testing as nptest
+np.set_printoptions(suppress=True, precision=8, linewidth=150)
+
+
+def trapzDoubleWell(x, A, d, R, sig1, sig2, nTheta=300):
+    """Previous implementation of DOUBLE_WELL, integrated over theta with trapz."""
+    theta = np.linspace(0, np.pi, nTheta)[:, np.newaxis]
+    y = x[np.newaxis, :]
+
+    sigTH = np.sqrt( sig1**2*np.cos(theta)**2 + sig2**2*np.sin(theta)**2 )
+    alpha = 2*( d*sig2*sig1*np.sin(theta) / sigTH )**2
+    beta = ( 2*sig1**2*d*np.cos(theta) / sigTH**2 ) * y
+    denom = 2.506628 * sigTH * (1 + R**2 + 2*R*np.exp(-2*d**2*sig1**2))
+    jp = np.exp( -y**2/(2*sigTH**2)) * (1 + R**2 + 2*R*np.exp(-alpha)*np.cos(beta)) / denom
+    jp *= np.sin(theta)
+
+    JBest = np.trapz(jp, x=theta, axis=0)
+    JBest /= np.abs(np.trapz(JBest, x=y))
+    JBest *= A
+    return JBest
+
+
+def trapzDoubleWellAnsio(x, A, sig1, sig2, nTheta=300):
+    """Previous implementation of DOUBLE_WELL_ANSIO, integrated over theta with trapz."""
+    theta = np.linspace(0, np.pi, nTheta)[:, np.newaxis]
+    y = x[np.newaxis, :]
+
+    sigTH = np.sqrt( sig1**2*np.cos(theta)**2 + sig2**2*np.sin(theta)**2 )
+    jp = np.exp( -y**2/(2*sigTH**2)) / (2.506628*sigTH)
+    jp *= np.sin(theta)
+
+    JBest = np.trapz(jp, x=theta, axis=0)
+    JBest /= np.abs(np.trapz(JBest, x=y))
+    JBest *= A
+    return JBest
+
+
+x = np.linspace(-30, 30, 241)
+parsDoubleWell = [(1, 1, 1, 3, 5), (1, 0.5, 0.3, 4, 6), (2, 2, 1, 5, 3), (1, 3, 2, 6, 6)]
+parsAnsio = [(1, 3, 5), (2, 5, 3), (1, 6, 6)]
+
+
+class TestDoubleWell(unittest.TestCase):
+    def setUp(self):
+        self.model = selectModelAndPars("DOUBLE_WELL")[0]
+        self.atol = 1e-4     # Relative to peak height
+
+    def test_trapz300(self):
+        for pars in parsDoubleWell:
+            ori = trapzDoubleWell(x, *pars)
+            opt = self.model(x, *pars)
+            nptest.assert_allclose(opt, ori, rtol=0, atol=self.atol*ori.max())
+
+    def test_converged(self):
+        for pars in parsDoubleWell:
+            ori = trapzDoubleWell(x, *pars, nTheta=20001)
+            opt = self.model(x, *pars)
+            nptest.assert_allclose(opt, ori, rtol=0, atol=1e-7*ori.max())
+
+    def test_memoized(self):
+        opt = self.model(x, *parsDoubleWell[0])
+        self.assertIs(opt, self.model(x, *parsDoubleWell[0]))
+        self.assertIsNot(opt, self.model(x+1e-9, *parsDoubleWell[0]))
+
+    def test_threads(self):
+        parSets = [(1, d, 1, 3, 5) for d in np.linspace(0.5, 3, 20)] * 5
+        expected = [trapzDoubleWell(x, *pars, nTheta=20001) for pars in parSets[:20]] * 5
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda pars: self.model(x, *pars), parSets))
+        for opt, ori in zip(results, expected):
+            nptest.assert_allclose(opt, ori, rtol=0, atol=1e-7*ori.max())
+
+    def test_broadcast(self):
+        A, d, R, sig1, sig2 = np.array(parsDoubleWell[:2]).T
+        opt = self.model(x[np.newaxis, :], A[:, np.newaxis], d[:, np.newaxis], R[:, np.newaxis], sig1[0], sig2[0])
+        for i, pars in enumerate(parsDoubleWell[:2]):
+            nptest.assert_allclose(opt[i], self.model(x, *pars[:3], sig1[0], sig2[0]))
+
+
+class TestDoubleWellAnsio(unittest.TestCase):
+    def setUp(self):
+        self.model = selectModelAndPars("DOUBLE_WELL_ANSIO")[0]
+        self.atol = 1e-4
+
+    def test_trapz300(self):
+        for pars in parsAnsio:
+            ori = trapzDoubleWellAnsio(x, *pars)
+            opt = self.model(x, *pars)
+            nptest.assert_allclose(opt, ori, rtol=0, atol=self.atol*ori.max())
+
+    def test_converged(self):
+        for pars in parsAnsio:
+            ori = trapzDoubleWellAnsio(x, *pars, nTheta=20001)
+            opt = self.model(x, *pars)
+            nptest.assert_allclose(opt, ori, rtol=0, atol=1e-7*ori.max())
+
+
+if __name__ == "__main__":
+    unittest.main()
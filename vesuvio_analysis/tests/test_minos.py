@@ -0,0 +1,102 @@
+from vesuvio_analysis.core_functions.fit_in_yspace import runManualMinosScans, selectModelAndPars, resetMinuit, buildVarRange, runMinosOnRange, errsFromMinosCurve
+from iminuit import Minuit, cost
+from scipy import optimize
+import numpy as np
+import copy
+import unittest
+import numpy.testing as nptest
+
+np.random.seed(1)
+
+# Gram-Charlier profile with positivity constraint, as used by the manual minos
+model, defaultPars, sharedPars = selectModelAndPars("GC_C4")
+dataX = np.linspace(-20, 20, 81)
+dataE = np.full(dataX.shape, 0.002)
+dataY = model(dataX, 1, 0.3, 5, 0.4) + np.random.normal(size=dataX.shape) * dataE
+
+def constrFunc(*pars):
+    return model(dataX, *pars)
+
+m = Minuit(cost.LeastSquares(dataX, dataY, dataE, model), **defaultPars)
+m.limits["A"] = (0, None)
+m.simplex()
+m.scipy(constraints=optimize.NonlinearConstraint(constrFunc, 0, np.inf))
+m.hesse()
+
+bestFitVals = {p: v for p, v in zip(m.parameters, m.values)}
+bestFitErrs = {p: e for p, e in zip(m.parameters, m.errors)}
+
+
+def serialMinosForPar(minuitObj, var, bound):
+    """Previous scan of one parameter, on the same Minuit object for all parameters, without plotting."""
+    resetMinuit(minuitObj, bestFitVals, bestFitErrs)
+    minuitObj.scipy(constraints=optimize.NonlinearConstraint(constrFunc, 0, np.inf))
+    minuitObj.hesse()
+
+    varVal = minuitObj.values[var]
+    varErr = minuitObj.errors[var]
+    fValsMin = minuitObj.fval
+
+    varSpace = buildVarRange(bound, varVal, varErr)
+    lhsVarSpace, rhsVarSpace = np.split(varSpace, 2)
+    lhsVarSpace = np.flip(lhsVarSpace)
+
+    profile = {"varSpace": varSpace, "varVal": varVal, "varErr": varErr, "fValsMin": fValsMin}
+    for minimizer in ("Scipy", "Migrad"):
+        resetMinuit(minuitObj, bestFitVals, bestFitErrs)
+        rhsMinos = runMinosOnRange(minuitObj, var, rhsVarSpace, minimizer, constrFunc)
+        resetMinuit(minuitObj, bestFitVals, bestFitErrs)
+        lhsMinos = runMinosOnRange(minuitObj, var, lhsVarSpace, minimizer, constrFunc)
+        profile[minimizer] = np.concatenate((np.flip(lhsMinos), rhsMinos), axis=None)
+
+    resetMinuit(minuitObj, bestFitVals, bestFitErrs)
+    return profile
+
+
+def serialMinos(minuitObj, bound=2):
+    return {p: serialMinosForPar(minuitObj, p, bound) for p in minuitObj.parameters}
+
+
+class TestSerialMinos(unittest.TestCase):
+    """Scans of the workers compared with the previous serial scan of all parameters."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.serial = serialMinos(copy.deepcopy(m))
+
+    def test_grid(self):
+        for nWorkers in [1, 2]:
+            profiles = runManualMinosScans(m, constrFunc, bestFitVals, bestFitErrs, bound=2, minosMode="GRID", nWorkers=nWorkers)
+            self.assertEqual(list(profiles), list(self.serial))
+            for par in self.serial:
+                for key in self.serial[par]:
+                    nptest.assert_allclose(profiles[par][key], self.serial[par][key], rtol=1e-6)
+
+    def test_root(self):
+        # Crossings refined by root finding instead of interpolated on the grid
+        profiles = runManualMinosScans(m, constrFunc, bestFitVals, bestFitErrs, bound=2, minosMode="ROOT", nWorkers=2)
+        for par, profile in self.serial.items():
+            serialErrs = errsFromMinosCurve(profile["varSpace"], profile["varVal"], profile["Scipy"], profile["fValsMin"])
+            nptest.assert_allclose(profiles[par]["errors"], serialErrs, rtol=0.02)
+
+
+class TestParallelMinos(unittest.TestCase):
+
+    def runScans(self, minosMode, nWorkers):
+        return runManualMinosScans(m, constrFunc, bestFitVals, bestFitErrs, bound=2, minosMode=minosMode, nWorkers=nWorkers)
+
+    def assertProfilesEqual(self, serial, parallel):
+        self.assertEqual(list(serial), list(parallel))
+        for par in serial:
+            for key in serial[par]:
+                nptest.assert_array_equal(serial[par][key], parallel[par][key])
+
+    def testGrid(self):
+        self.assertProfilesEqual(self.runScans("GRID", 1), self.runScans("GRID", 2))
+
+    def testRoot(self):
+        self.assertProfilesEqual(self.runScans("ROOT", 1), self.runScans("ROOT", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
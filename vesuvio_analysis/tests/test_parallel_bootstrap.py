@@ -0,0 +1,56 @@
+from vesuvio_analysis.core_functions.run_script import runScript
+import unittest
+import numpy as np
+import numpy.testing as nptest
+from .tests_IC import  scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC
+
+
+class SerialBootstrapInitialConditions:
+    runBootstrap = True
+
+    procedure = "FORWARD"
+    fitInYSpace = "FORWARD"
+
+    runningJackknife = False
+    nSamples = 4
+    skipMSIterations = False
+    runningTest = True
+    userConfirmation = False
+
+    nWorkers = 1
+    masterSeed = 1      # Same replicas for any number of workers
+
+
+class ParallelBootstrapInitialConditions(SerialBootstrapInitialConditions):
+    nWorkers = 2
+
+
+class UserScriptControls:
+    runRoutine = False
+    procedure = "FORWARD"
+    fitInYSpace = None
+
+userCtr = UserScriptControls
+
+# Change yFItIC to default settings, running tests for yfit before hand changes this
+yFitIC.fitModel = "SINGLE_GAUSSIAN"
+yFitIC.symmetrisationFlag = True
+
+serialRes, noneRes = runScript(userCtr, scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC, SerialBootstrapInitialConditions)
+parallelRes, noneRes = runScript(userCtr, scriptName, wsBackIC, wsFrontIC, bckwdIC, fwdIC, yFitIC, ParallelBootstrapInitialConditions)
+
+
+class TestParallelBootstrap(unittest.TestCase):
+    """Replicas run in forked workers match the serial run with the same master seed."""
+
+    def testScat(self):
+        self.assertTrue(np.all(serialRes["fwdScat"].completedReplicas()))
+        nptest.assert_array_equal(parallelRes["fwdScat"].bootSamples, serialRes["fwdScat"].bootSamples)
+
+    def testYFit(self):
+        self.assertTrue(np.all(serialRes["fwdYFit"].completedReplicas()))
+        nptest.assert_array_equal(parallelRes["fwdYFit"].bootSamples, serialRes["fwdYFit"].bootSamples)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+from vesuvio_analysis.core_functions import procedures
+from vesuvio_analysis.core_functions.bootstrap import runBootstrap
+from types import SimpleNamespace
+from unittest import mock
+import numpy as np
+import unittest
+import numpy.testing as nptest
+
+
+def backwardIC():
+    return SimpleNamespace(
+        modeRunning="BACKWARD", noOfPreviewGroups=4, previewOnly=False, runningSampleWS=False,
+        masses=np.array([12, 16, 27]), noOfMasses=3, HToMassIdxRatio=19.06, massIdx=0,
+        initPars=np.array([1, 12, 0., 1, 12, 0., 1, 12.5, 0.]),
+        bounds=np.array([[0, np.nan], [8, 16], [-3, 1]] * 3)
+    )
+
+
+def forwardIC():
+    return SimpleNamespace(
+        modeRunning="FORWARD", noOfPreviewGroups=4, previewOnly=False, runningSampleWS=False,
+        masses=np.array([1.0079, 12, 16, 27]), noOfMasses=4,
+        initPars=np.array([1, 4.7, 0, 1, 12.71, 0., 1, 8.76, 0., 1, 13.897, 0.]),
+        bounds=np.array([[0, np.nan], [3, 6], [-3, 1]] * 4)
+    )
+
+
+class TestJointPreview(unittest.TestCase):
+
+    def test_forward_pars_from_backward(self):
+        bckwdIC, fwdIC = backwardIC(), forwardIC()
+        backResults = SimpleNamespace(all_mean_widths=np.array([[10., 12., 13.]]), all_mean_intensities=np.array([[0.5, 0.3, 0.2]]))
+        groupFitPars = np.tile([0.9, 11, 0.1, 1.1, 13, 0.2, 1, 12, 0], (4, 1))
+
+        fwdInitPars = []
+        def fitProcedure(IC):
+            if IC is fwdIC:
+                fwdInitPars.append(IC.initPars.copy())
+            return "ws", backResults
+
+        with mock.patch.object(procedures, "previewFitOfGroups", return_value=groupFitPars) as preview, \
+             mock.patch.object(procedures, "iterativeFitForDataReduction", side_effect=fitProcedure):
+            procedures.runJoint(bckwdIC, fwdIC)
+
+        # Preview seeds only the backward fit
+        preview.assert_called_once_with(bckwdIC)
+        nptest.assert_allclose(bckwdIC.initPars, groupFitPars[0])
+
+        # Forward fit starts from backward results
+        HIntensity = 19.06 * 0.5
+        intensities = np.array([HIntensity, 0.5, 0.3, 0.2]) / (HIntensity + 1)
+        nptest.assert_allclose(fwdInitPars[0][0::3], intensities)
+        nptest.assert_allclose(fwdInitPars[0][4::3], [10., 12., 13.])
+
+    def test_preview_only_not_in_joint(self):
+        bckwdIC, fwdIC = backwardIC(), forwardIC()
+        fwdIC.previewOnly = True
+        with self.assertRaises(AssertionError):
+            procedures.runJoint(bckwdIC, fwdIC)
+
+
+class TestBootstrapPreview(unittest.TestCase):
+
+    def test_preview_only_rejected(self):
+        for mode in ["BACKWARD", "FORWARD"]:
+            bckwdIC, fwdIC = backwardIC(), forwardIC()
+            {"BACKWARD": bckwdIC, "FORWARD": fwdIC}[mode].previewOnly = True
+            bootIC = SimpleNamespace(procedure=mode, runningTest=True, runningJackknife=False)
+            with self.assertRaises(AssertionError):
+                runBootstrap(bckwdIC, fwdIC, bootIC, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
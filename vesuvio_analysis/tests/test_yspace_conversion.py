@@ -0,0 +1,116 @@
+from vesuvio_analysis.core_functions.fit_in_yspace import convertToYSpace, convertToYSpaceNumpy, convertToYSpaceArr, \
+    rebinDistributionArr, rebinEdges, normaliseArr, weightedAvgArr, symmetrizeArr, loadInstrParsFileIntoArray
+from mantid.simpleapi import Load, CloneWorkspace, ConvertToYSpace, Rebin
+from mantid.api import AnalysisDataService
+from pathlib import Path
+import numpy as np
+import unittest
+import numpy.testing as nptest
+from .tests_IC import fwdIC, yFitIC
+testPath = Path(__file__).absolute().parent
+
+AnalysisDataService.clear()
+
+wsFinal = Load(str(testPath / "wsFinal.nxs"), OutputWorkspace="tests_conversion")
+efixed = wsFinal.getInstrument().getNumberParameter("efixed")[0]
+
+
+def assertSpectraClose(mantidData, numpyData, atol):
+    """Compares spectra with tolerance relative to the peak of each spectrum, spectra with zeros or nans skipped."""
+    validRows = np.any(mantidData!=0, axis=1) & np.all(np.isfinite(mantidData), axis=1)
+    assert np.any(validRows)
+    mantidData = mantidData[validRows]
+    numpyData = numpyData[validRows]
+    nptest.assert_equal(mantidData.shape, numpyData.shape)
+    peak = np.max(np.abs(mantidData), axis=1)[:, np.newaxis]
+    nptest.assert_allclose(numpyData / peak, mantidData / peak, rtol=0, atol=atol)
+
+
+class TestStoredYSpace(unittest.TestCase):
+    """
+    NumPy conversion, normalisation and averaging of the stored isolated first mass,
+    compared with the stored results of ConvertToYSpace, Rebin and normalise_workspace.
+    Tolerance of 1e-6 relative to the peak, as for the stored results of the full fit in y space.
+    """
+    def setUp(self):
+        self.atol = 1e-6
+
+    def ySpaceAvg(self, storedResults, symmetrise):
+        dataX, dataY, dataE, dataQ = convertToYSpaceArr(
+            yFitIC.rebinParametersForYSpaceFit, wsFinal.extractX(), storedResults["HdataY"], wsFinal.extractE(),
+            loadInstrParsFileIntoArray(fwdIC), fwdIC.masses[0], efixed
+            )
+        dataY, dataE = normaliseArr(dataY, dataE, np.diff(rebinEdges(yFitIC.rebinParametersForYSpaceFit)))
+        meanY, meanE = weightedAvgArr(dataY, dataE)
+        if symmetrise:
+            return symmetrizeArr(meanY[np.newaxis, :], meanE[np.newaxis, :])
+        return meanY[np.newaxis, :], meanE[np.newaxis, :]
+
+    def compareStored(self, fileName, symmetrise):
+        storedResults = np.load(testPath / fileName)
+        meanY, meanE = self.ySpaceAvg(storedResults, symmetrise)
+        assertSpectraClose(storedResults["YSpaceSymSumDataY"], meanY, self.atol)
+        assertSpectraClose(storedResults["YSpaceSymSumDataE"], meanE, self.atol)
+
+    def test_weighted_avg(self):
+        self.compareStored("stored_yspace_fit_GC.npz", symmetrise=False)
+
+    def test_symmetrised(self):
+        self.compareStored("stored_yspace_fit.npz", symmetrise=True)
+
+
+class TestRebinDistribution(unittest.TestCase):
+    """Rebin step alone, on the output of ConvertToYSpace."""
+
+    def setUp(self):
+        wsJoY, wsQ = ConvertToYSpace(
+            InputWorkspace=wsFinal, Mass=fwdIC.masses[0],
+            OutputWorkspace=wsFinal.name()+"_JoY", QWorkspace=wsFinal.name()+"_Q"
+            )
+        self.wsJoY = wsJoY
+        self.wsRebin = Rebin(
+            InputWorkspace=wsJoY, Params=yFitIC.rebinParametersForYSpaceFit,
+            FullBinsOnly=True, OutputWorkspace=wsFinal.name()+"_JoY_Rebin"
+            )
+
+    def test_same_as_rebin(self):
+        validRows = np.all(np.isfinite(self.wsJoY.extractX()), axis=1)
+        newY, newE = rebinDistributionArr(
+            self.wsJoY.extractX()[validRows], self.wsJoY.extractY()[validRows], self.wsJoY.extractE()[validRows],
+            rebinEdges(yFitIC.rebinParametersForYSpaceFit)
+            )
+        nptest.assert_allclose(newY, self.wsRebin.extractY()[validRows], rtol=1e-10, atol=1e-14)
+        nptest.assert_allclose(newE, self.wsRebin.extractE()[validRows], rtol=1e-10, atol=1e-14)
+
+
+class TestConvertToYSpaceNumpy(unittest.TestCase):
+    """NumPy conversion compared with ConvertToYSpace, Rebin and normalise_workspace on the stored workspace."""
+
+    @classmethod
+    def setUpClass(cls):
+        wsMantid = CloneWorkspace(wsFinal, OutputWorkspace=wsFinal.name()+"_Mantid")
+        wsNumpy = CloneWorkspace(wsFinal, OutputWorkspace=wsFinal.name()+"_Numpy")
+        cls.wsJoYMantid, cls.wsQMantid = convertToYSpace(yFitIC.rebinParametersForYSpaceFit, wsMantid, fwdIC.masses[0])
+        cls.wsJoYNumpy, cls.wsQNumpy = convertToYSpaceNumpy(yFitIC.rebinParametersForYSpaceFit, wsNumpy, fwdIC)
+
+    def setUp(self):
+        self.atol = 1e-6
+
+    def test_dataX(self):
+        mantidX = self.wsJoYMantid.extractX()
+        if self.wsJoYMantid.isHistogramData():     # Compare with bin centers
+            mantidX = (mantidX[:, 1:] + mantidX[:, :-1]) / 2
+        nptest.assert_allclose(self.wsJoYNumpy.extractX(), mantidX)
+
+    def test_dataY(self):
+        assertSpectraClose(self.wsJoYMantid.extractY(), self.wsJoYNumpy.extractY(), self.atol)
+
+    def test_dataE(self):
+        assertSpectraClose(self.wsJoYMantid.extractE(), self.wsJoYNumpy.extractE(), self.atol)
+
+    def test_dataQ(self):
+        assertSpectraClose(self.wsQMantid.extractY(), self.wsQNumpy.extractY(), self.atol)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,525 @@
+from vesuvio_analysis.core_functions import fit_in_yspace
+from vesuvio_analysis.core_functions.fit_in_yspace import buildGlobalConstraint, calcCostFun, selectFitModel, ResultsYFitObject, fitProfileMantidFit, \
+    kMeansClustering, repairEmptyClusters, lloydIterations, squaredDistances, findDetectorGroups, fitInYSpaceProcedure, \
+    WeightedAvgAccumulator, weightedAvgArr, convolvedModelJacobian, confidenceBand, globalFitBands, oddPointsRes, fitModels
+from iminuit import Minuit
+from iminuit.util import propagate
+from scipy import signal
+from iminuit.util import describe
+from types import SimpleNamespace
+from unittest import mock
+from pathlib import Path
+import tempfile
+import threading
+from scipy import optimize
+import numpy as np
+import unittest
+import numpy.testing as nptest
+
+testPath = Path(__file__).absolute().parent
+
+dataX = np.linspace(-20, 20, 41)
+resY = np.exp(-dataX**2 / 2 / 1.5**2)
+
+
+def globalCost(fitModel, nCostFunctions):
+    """Sum of cost functions of each group, as built in the global fit."""
+    totCost = 0
+    for i in range(nCostFunctions):
+        totCost += calcCostFun(fitModel.model, i, dataX, np.ones(dataX.size), np.ones(dataX.size), resY, fitModel.sharedPars)
+    return totCost
+
+
+def baselineWeightedAvg(dataYOri, dataEOri):
+    """Previous weighted average, invalid points with zero error changed to nans and ignored."""
+    dataY = dataYOri.copy()
+    dataE = dataEOri.copy()
+    zerosMask = dataE==0
+    dataY[zerosMask] = np.nan  
+    dataE[zerosMask] = np.nan
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        meanY = np.nansum(dataY/np.square(dataE), axis=0) / np.nansum(1/np.square(dataE), axis=0)
+        meanE = np.sqrt(1 / np.nansum(1/np.square(dataE), axis=0))
+
+    nanInfMask = meanE==np.inf
+    meanY[nanInfMask] = 0
+    meanE[nanInfMask] = 0
+    return meanY, meanE
+
+
+class TestGlobalConstraint(unittest.TestCase):
+    """Sparse Jacobian of the positivity constraint against finite differences of the constraint."""
+
+    def compareJacobians(self, modelFlag, useGrad):
+        fitModel = selectFitModel(modelFlag)
+        nCostFunctions = 3
+        totSig = describe(globalCost(fitModel, nCostFunctions))
+
+        constr, constrJac = buildGlobalConstraint(
+            fitModel.model, fitModel.grad if useGrad else None, dataX, totSig, fitModel.sharedPars, nCostFunctions
+            )
+
+        # Each unshared parameter different in every group
+        pars = np.random.default_rng(5).uniform(0.5, 1.5, len(totSig))
+        for name in ["x00", "x01", "x02"]:
+            pars[totSig.index(name)] -= 1
+        jacFD = optimize.approx_fprime(pars, lambda p: constr(*p), 1e-7)
+
+        jac = constrJac(pars)
+        self.assertEqual(jac.shape, (nCostFunctions*dataX.size, len(totSig)))
+        nptest.assert_allclose(jac.toarray(), jacFD, rtol=1e-4, atol=1e-6 * np.max(np.abs(jacFD)))
+
+        # Rows of each group depend only on its own unshared parameters and the shared ones
+        for i in range(nCostFunctions):
+            rows = jac.toarray()[i*dataX.size:(i+1)*dataX.size]
+            usedPars = [name for name, col in zip(totSig, rows.T) if np.any(col!=0)]
+            expected = [name for name in totSig if name in fitModel.sharedPars or (name.endswith(str(i)) and not name.startswith("y0"))]
+            self.assertEqual(usedPars, expected)
+
+    def test_analytic_gradient(self):
+        self.compareJacobians("GC_C4_C6", useGrad=True)
+
+    def test_forward_differences(self):
+        self.compareJacobians("GC_C4", useGrad=False)
+
+    def test_single_shared_parameter(self):
+        self.compareJacobians("SINGLE_GAUSSIAN", useGrad=True)
+
+
+def fakeWS(name, dataY=np.zeros((1, 3))):
+    return SimpleNamespace(name=lambda: name, extractY=lambda: dataY, extractE=lambda: dataY)
+
+
+def fakeTable(values):
+    return SimpleNamespace(column=lambda col: list(values) if col=="Value" else [v/10 for v in values])
+
+
+class TestResultsYFit(unittest.TestCase):
+    """Rows of fit results in fixed order, read only from fits of the current call."""
+
+    def setUp(self):
+        avgName = "ws_H_JoY_Weighted_Avg_Symmetrised"
+        self.ads = {
+            "ws": fakeWS("ws"), "ws_H": fakeWS("ws_H"), avgName: fakeWS(avgName), "ws_Resolution_Sum": fakeWS("ws_Resolution_Sum"),
+            avgName+"_Fitted_Minuit_Parameters": fakeTable([1, 2, 3, 4, 5]),
+            avgName+"_Fitted_Levenberg-Marquardt_Parameters": fakeTable([6, 7, 8, 9, 10, 11]),
+            avgName+"_Fitted_Simplex_Parameters": fakeTable([12, 13, 14, 15, 16, 17]),     # Left over from previous fit
+        }
+        self.ic = SimpleNamespace(ySpaceFitSavePath="results.npz")
+        self.yFitIC = SimpleNamespace(symmetrisationFlag=True, fitModel="SINGLE_GAUSSIAN")
+
+    def results(self, fittedMinimizers):
+        with mock.patch.object(fit_in_yspace, "mtd", self.ads):
+            return ResultsYFitObject(self.ic, self.yFitIC, "ws", "ws_H", fittedMinimizers)
+
+    def test_skipped_fit(self):
+        res = self.results(["Minuit", "Levenberg-Marquardt"])
+        nptest.assert_array_equal(res.popt[:2], [[1, 2, 3, 4, 5, 0], [6, 7, 8, 9, 10, 11]])
+        self.assertTrue(np.all(np.isnan(res.popt[2])))
+        self.assertTrue(np.all(np.isnan(res.perr[2])))
+
+    def test_only_minuit(self):
+        res = self.results(["Minuit"])
+        self.assertEqual(res.popt.shape, (3, 5))
+        nptest.assert_array_equal(res.popt[0], [1, 2, 3, 4, 5])
+        self.assertTrue(np.all(np.isnan(res.popt[1:])))
+
+    def test_mantid_rows_in_fixed_order(self):
+        res = self.results(["Minuit", "Simplex"])
+        self.assertTrue(np.all(np.isnan(res.popt[1])))
+        nptest.assert_array_equal(res.popt[2], [12, 13, 14, 15, 16, 17])
+
+
+class TestMantidCrossCheck(unittest.TestCase):
+
+    def runCrossCheck(self, fitModel, minimizers):
+        threads = []
+        def fit(function, ws, minimizer):
+            threads.append(threading.current_thread())
+
+        yFitIC = SimpleNamespace(fitModel=fitModel, crossCheckMinimizers=minimizers)
+        with mock.patch.object(fit_in_yspace, "runMantidFit", side_effect=fit):
+            fitted = fitProfileMantidFit(yFitIC, fakeWS("ws"), fakeWS("wsRes")).result()
+        return fitted, threads
+
+    def test_background_thread(self):
+        fitted, threads = self.runCrossCheck("SINGLE_GAUSSIAN", ["Simplex", "Levenberg-Marquardt"])
+        self.assertEqual(fitted, ["Simplex", "Levenberg-Marquardt"])
+        self.assertEqual(len(set(threads)), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_no_mantid_function(self):
+        self.assertEqual(self.runCrossCheck("DOUBLE_WELL", ["Simplex"]), ([], []))
+
+
+def blobs(centers, nPoints=10, seed=6):
+    """Points around each center, spread much smaller than the distance between centers."""
+    rng = np.random.default_rng(seed)
+    return np.concatenate([c + 0.01 * rng.normal(size=(nPoints, 2)) for c in centers])
+
+
+class TestKMeans(unittest.TestCase):
+
+    def setUp(self):
+        self.points = blobs([[0, 0], [1, 0], [0, 1]])
+
+    def test_finds_separated_groups(self):
+        clusters = kMeansClustering(self.points, 3)
+        for block in clusters.reshape(3, 10):
+            self.assertEqual(len(set(block)), 1)
+        self.assertEqual(len(set(clusters)), 3)
+
+    def test_same_seed_same_groups(self):
+        points = np.random.default_rng(7).uniform(size=(40, 2))     # No clear groups, depends on starting centers
+        nptest.assert_array_equal(kMeansClustering(points, 5, seed=3), kMeansClustering(points, 5, seed=3))
+
+    def test_repair_empty_clusters(self):
+        points = np.array([[0, 0], [0.1, 0], [0.5, 0], [5, 5]])
+        centers = np.array([[0, 0], [5, 5], [10, 10]])     # Last center is closest to no point
+        dist2 = squaredDistances(points, centers)
+        clusters = repairEmptyClusters(np.argmin(dist2, axis=1), dist2, 3)
+        # Point furthest from its center, in a cluster with more than one point, moved to empty cluster
+        nptest.assert_array_equal(clusters, [0, 0, 2, 1])
+
+    def test_no_empty_clusters_after_iterations(self):
+        centers = np.array([[0, 0], [1, 0], [50, 50]])
+        clusters, inertia = lloydIterations(self.points, centers)
+        nptest.assert_array_equal(np.bincount(clusters, minlength=3) > 0, True)
+
+
+def ipDataOfDetectors(points):
+    """Instrument parameters with theta and L1 of each detector, other columns unused by the grouping."""
+    ipData = np.zeros((len(points), 6))
+    ipData[:, 0] = np.arange(len(points)) + 3
+    ipData[:, 2] = points[:, 1] * 100 + 40
+    ipData[:, -1] = points[:, 0] + 10
+    return ipData
+
+
+class TestGroupingsCache(unittest.TestCase):
+
+    def setUp(self):
+        fit_in_yspace.groupingsCache.clear()
+        self.ipData = ipDataOfDetectors(blobs([[0, 0], [1, 0], [0, 1]]))
+
+    def tearDown(self):
+        fit_in_yspace.groupingsCache.clear()
+
+    def test_cached_same_as_new(self):
+        idxList = findDetectorGroups(self.ipData, 3)
+        idxList[0].append(100)     # Cache is not changed by callers
+        nptest.assert_equal(findDetectorGroups(self.ipData, 3), findDetectorGroups(self.ipData, 3, useCache=False))
+
+    def test_other_inputs(self):
+        findDetectorGroups(self.ipData, 3)
+        for ipData, nGroups in [(self.ipData, 2), (self.ipData[:-3], 3), (self.ipData[::-1].copy(), 3)]:
+            nptest.assert_equal(findDetectorGroups(ipData, nGroups), findDetectorGroups(ipData, nGroups, useCache=False))
+
+    def test_same_bytes_other_shape(self):
+        # Two spectra per row, same bytes as ipData but with half the spectra
+        findDetectorGroups(self.ipData, 3)
+        ipData = self.ipData.reshape(-1, 12)
+        nptest.assert_equal(findDetectorGroups(ipData, 3), findDetectorGroups(ipData, 3, useCache=False))
+
+    def test_unused_columns(self):
+        # Other instrument parameters do not change the groups
+        idxList = findDetectorGroups(self.ipData, 3)
+        ipData = self.ipData.copy()
+        ipData[:, 1] += 1
+        self.assertEqual(len(fit_in_yspace.groupingsCache), 1)
+        nptest.assert_equal(findDetectorGroups(ipData, 3), idxList)
+        self.assertEqual(len(fit_in_yspace.groupingsCache), 1)
+
+
+class TestFitModelSets(unittest.TestCase):
+    """Batched evaluation of each registered model against evaluating one parameter set at a time."""
+
+    def parSets(self, fitModel):
+        defaultPars = np.array(list(fitModel.defaultPars.values()), dtype=float)
+        return defaultPars + np.random.default_rng(8).uniform(0, 0.5, (4, defaultPars.size))
+
+    def test_eval_sets(self):
+        for modelFlag, fitModel in fitModels.items():
+            parSets = self.parSets(fitModel)
+            vals = fitModel.evalSets(dataX, parSets)
+            self.assertEqual(vals.shape, (len(parSets), dataX.size))
+            for pars, val in zip(parSets, vals):
+                nptest.assert_allclose(val, fitModel.model(dataX, *pars), rtol=1e-12, atol=1e-15, err_msg=modelFlag)
+
+    def test_grad_sets(self):
+        for modelFlag, fitModel in fitModels.items():
+            if fitModel.grad is None:
+                continue
+            parSets = self.parSets(fitModel)
+            grads = fitModel.gradSets(dataX, parSets)
+            self.assertEqual(grads.shape, (len(parSets), parSets.shape[1], dataX.size))
+            for pars, grad in zip(parSets, grads):
+                nptest.assert_allclose(grad, fitModel.grad(dataX, *pars), rtol=1e-12, atol=1e-15, err_msg=modelFlag)
+
+    def test_single_set(self):
+        fitModel = fitModels["GC_C4_C6"]
+        pars = self.parSets(fitModel)[0]
+        nptest.assert_allclose(fitModel.evalSets(dataX, pars)[0], fitModel.model(dataX, *pars))
+
+
+class TestConfidenceBand(unittest.TestCase):
+    """Analytic band of the convolved model against linear propagation with iminuit and a Monte Carlo band."""
+
+    def setUp(self):
+        self.xDelta, self.resDense = oddPointsRes(dataX, resY)
+
+    def fitAndCov(self, modelFlag):
+        fitModel = selectFitModel(modelFlag)
+        pars = np.array([0.01, *fitModel.defaultPars.values()], dtype=float)
+        # Small correlated errors, for which the model is close to linear
+        sigmas = 0.02 * np.abs(pars) + 0.01
+        corr = np.full((pars.size, pars.size), 0.3) + 0.7 * np.eye(pars.size)
+        return fitModel, pars, corr * np.outer(sigmas, sigmas)
+
+    def convolvedSets(self, fitModel, parSets):
+        return parSets[:, [0]] + signal.convolve(fitModel.evalSets(dataX, parSets[:, 1:]), self.resDense[np.newaxis, :], mode="same") * self.xDelta
+
+    def band(self, fitModel, pars, cov):
+        return confidenceBand(convolvedModelJacobian(fitModel, dataX, pars, self.resDense, self.xDelta), cov)
+
+    def test_same_as_propagate(self):
+        for modelFlag in ["SINGLE_GAUSSIAN", "GC_C4_C6", "DOUBLE_WELL"]:    # Double well without analytic gradient
+            fitModel, pars, cov = self.fitAndCov(modelFlag)
+            y, yCov = propagate(lambda p: self.convolvedSets(fitModel, p[np.newaxis, :])[0], pars, cov)
+            sigma = np.sqrt(np.diag(yCov))
+            nptest.assert_allclose(self.band(fitModel, pars, cov), sigma, rtol=1e-4, atol=1e-6 * np.max(sigma), err_msg=modelFlag)
+
+    def test_monte_carlo(self):
+        for modelFlag in ["SINGLE_GAUSSIAN", "DOUBLE_WELL"]:
+            fitModel, pars, cov = self.fitAndCov(modelFlag)
+            parSets = np.random.default_rng(6).multivariate_normal(pars, cov, size=20000)
+            sigmaMC = np.std(self.convolvedSets(fitModel, parSets), axis=0)
+            nptest.assert_allclose(self.band(fitModel, pars, cov), sigmaMC, rtol=0.03, err_msg=modelFlag)
+
+    def test_global_fit_bands(self):
+        # Each group uses its own parameters and the shared ones, with the matching block of the covariance
+        fitModel = selectFitModel("GC_C4_C6")
+        rng = np.random.default_rng(7)
+        dataYs = [fitModel.model(dataX, 1, x0, 5, 0.1, 0) + rng.normal(0, 0.01, dataX.size) for x0 in [-0.5, 0, 0.5]]
+        totCost = sum(calcCostFun(fitModel.model, i, dataX, y, np.full(dataX.size, 0.01), resY, fitModel.sharedPars) 
+                      for i, y in enumerate(dataYs))
+        m = Minuit(totCost, **{name: 1 if name.startswith("A") else 5 if name=="sigma1" else 0 for name in describe(totCost)})
+        m.hesse()
+
+        yFitIC = SimpleNamespace(fitModel="GC_C4_C6")
+        dataYFit, dataYSigma = globalFitBands(yFitIC, np.tile(dataX, (3, 1)), np.tile(resY, (3, 1)), m, totCost)
+
+        cov = np.array(m.covariance)
+        for i, costFun in enumerate(totCost):
+            idxs = [m.parameters.index(p) for p in describe(costFun)]
+            y, yCov = propagate(lambda p: costFun.model(dataX, *p), np.array(m.values)[idxs], cov[np.ix_(idxs, idxs)])
+            nptest.assert_allclose(dataYFit[i], y)
+            nptest.assert_allclose(dataYSigma[i], np.sqrt(np.diag(yCov)), rtol=1e-4, atol=1e-6 * np.max(dataYSigma[i]))
+
+
+class TestWeightedAvgAccumulator(unittest.TestCase):
+    """Accumulator against the previous weighted average, on the stored spectra with a masked spectrum and masked points."""
+
+    def setUp(self):
+        storedResults = np.load(testPath / "stored_yspace_fit.npz")
+        self.dataY = storedResults["finalRawDataY"].copy()
+        self.dataE = storedResults["finalRawDataE"].copy()
+        self.dataY[3], self.dataE[3] = 0, 0
+        self.dataY[:, 100:110], self.dataE[:, 100:110] = 0, 0
+        self.groupIdxs = np.array([0, 1, 2] * 4)
+
+    def test_same_as_baseline(self):
+        meanY, meanE = weightedAvgArr(self.dataY, self.dataE)
+        baseY, baseE = baselineWeightedAvg(self.dataY, self.dataE)
+        nptest.assert_array_equal(meanY, baseY)
+        nptest.assert_array_equal(meanE, baseE)
+
+    def test_groups(self):
+        meanY, meanE = WeightedAvgAccumulator(self.dataY.shape[1], 3).add(self.dataY, self.dataE, self.groupIdxs).average()
+        for group in range(3):
+            inGroup = self.groupIdxs==group
+            baseY, baseE = baselineWeightedAvg(self.dataY[inGroup], self.dataE[inGroup])
+            nptest.assert_array_equal(meanY[group], baseY)
+            nptest.assert_array_equal(meanE[group], baseE)
+
+    def test_merged(self):
+        # Partial accumulators, e.g. from each worker, sum rows in a different order than a single pass,
+        # so agree with the baseline up to rounding only
+        accs = [WeightedAvgAccumulator(self.dataY.shape[1], 3).add(self.dataY[rows], self.dataE[rows], self.groupIdxs[rows]) 
+                for rows in [slice(0, 5), slice(5, 9), slice(9, None)]]
+        merged = accs[0].merge(accs[1]).merge(accs[2])
+        nptest.assert_array_equal(merged.counts, [4, 4, 4])
+
+        meanY, meanE = merged.average()
+        for group in range(3):
+            inGroup = self.groupIdxs==group
+            baseY, baseE = baselineWeightedAvg(self.dataY[inGroup], self.dataE[inGroup])
+            nptest.assert_allclose(meanY[group], baseY, rtol=0, atol=1e-14*np.max(np.abs(baseY)))
+            nptest.assert_allclose(meanE[group], baseE, rtol=1e-14, atol=0)
+
+    def test_single_spectra_merged(self):
+        # Merging spectra one at a time, in order, sums as in a single pass
+        acc = WeightedAvgAccumulator(self.dataY.shape[1])
+        for dataY, dataE in zip(self.dataY, self.dataE):
+            acc.merge(WeightedAvgAccumulator(self.dataY.shape[1]).add(dataY, dataE))
+        baseY, baseE = baselineWeightedAvg(self.dataY, self.dataE)
+        meanY, meanE = acc.average()
+        nptest.assert_array_equal(meanY[0], baseY)
+        nptest.assert_array_equal(meanE[0], baseE)
+
+
+class FakeADS(dict):
+    def getObjectNames(self):
+        return list(self.keys())
+
+
+class FakeMatrixWS:
+    def __init__(self, name, dataX, dataY, dataE):
+        self._name, self.dataX, self.dataY, self.dataE = name, dataX, dataY, dataE
+
+    def name(self):
+        return self._name
+
+    def extractX(self):
+        return self.dataX.copy()
+
+    def extractY(self):
+        return self.dataY.copy()
+
+    def extractE(self):
+        return self.dataE.copy()
+
+
+class FakeTableWS:
+    def __init__(self):
+        self.title, self.columns, self.types, self.rows = "", [], [], []
+
+    def setTitle(self, title):
+        self.title = title
+
+    def getTitle(self):
+        return self.title
+
+    def addColumn(self, type, name):
+        self.types.append(type)
+        self.columns.append(name)
+
+    def addRow(self, row):
+        self.rows.append(list(row))
+
+    def getColumnNames(self):
+        return self.columns
+
+    def columnTypes(self):
+        return self.types
+
+    def column(self, col):
+        return [row[self.columns.index(col)] for row in self.rows]
+
+
+class TestYFitCache(unittest.TestCase):
+    """Fits of the weighted avg run once for the same inputs, and their workspaces are restored from the cache."""
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.ads = FakeADS()
+        self.avg = self.matrixWS("ws_H_JoY_Weighted_Avg", np.arange(5.))
+        self.res = self.matrixWS("ws_Resolution_Sum", np.ones(5))
+        self.ic = SimpleNamespace(ySpaceFitSavePath=Path(self.tmpDir.name) / "yfit.npz")
+        self.yFitIC = SimpleNamespace(useYFitCache=True, showPlots=False, globalFit=False, fitModel="SINGLE_GAUSSIAN")
+        self.noOfFits = 0
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def matrixWS(self, name, dataY):
+        dataY = np.atleast_2d(dataY)
+        dataX = np.tile(np.arange(dataY.shape[1]+1.), (len(dataY), 1))     # Histogram data
+        ws = FakeMatrixWS(name, dataX, dataY, np.sqrt(dataY))
+        self.ads[name] = ws
+        return ws
+
+    def createTable(self, OutputWorkspace):
+        self.ads[OutputWorkspace] = FakeTableWS()
+        return self.ads[OutputWorkspace]
+
+    def createWorkspace(self, DataX, DataY, DataE, NSpec, OutputWorkspace):
+        self.ads[OutputWorkspace] = FakeMatrixWS(OutputWorkspace, *[A.reshape(NSpec, -1) for A in (DataX, DataY, DataE)])
+
+    def fitMinuit(self, yFitIC, wsAvg, wsRes):
+        self.noOfFits += 1
+        table = self.createTable(wsAvg.name()+"_Fitted_Minuit_Parameters")
+        table.setTitle("Minuit Fit")
+        table.addColumn("str", "Name")
+        table.addColumn("float", "Value")
+        table.addRow(["sigma", 5.])
+        self.matrixWS(wsAvg.name()+"_Fitted_Minuit", np.arange(15.).reshape(3, 5))
+
+    def fitMantid(self, yFitIC, wsAvg, wsRes):
+        self.createTable(wsAvg.name()+"_Fitted_Simplex_Parameters").addColumn("float", "Value")
+        return SimpleNamespace(result=lambda: ["Simplex"])
+
+    def runProcedure(self):
+        results = mock.Mock()
+        patches = dict(
+            mtd=self.ads, ITableWorkspace=FakeTableWS, MatrixWorkspace=FakeMatrixWS, 
+            CreateEmptyTableWorkspace=self.createTable, CreateWorkspace=self.createWorkspace,
+            extractNCPFromWorkspaces=mock.Mock(), printYSpaceFitResults=mock.Mock(), ResultsYFitObject=results,
+            calculateMantidResolutionFirstMass=mock.Mock(return_value=(self.res, None)),
+            weightedAvgYSpace=mock.Mock(return_value=(self.avg, None, fakeWS("ws_H"))),
+            fitProfileMinuit=self.fitMinuit, fitProfileMantidFit=self.fitMantid
+            )
+        with mock.patch.multiple(fit_in_yspace, **patches):
+            fitInYSpaceProcedure(self.yFitIC, self.ic, fakeWS("ws"))
+        return results.call_args[0][-1]     # Minimizers of fits read by results
+
+    def clearFits(self):
+        for name in [name for name in self.ads if "_Fitted_" in name]:
+            del self.ads[name]
+
+    def cacheFiles(self):
+        return list((Path(self.tmpDir.name) / "ySpaceFitCache").glob("*.npz"))
+
+    def test_hit_restores_fits(self):
+        self.ads[self.avg.name()+"_Fitted_Levenberg-Marquardt_Parameters"] = FakeTableWS()    # Left over from previous fit
+        self.assertEqual(self.runProcedure(), ["Minuit", "Simplex"])
+        fitted = {name: self.ads[name] for name in self.ads if "_Fitted_" in name}
+        self.clearFits()
+
+        self.assertEqual(self.runProcedure(), ["Minuit", "Simplex"])
+        self.assertEqual(self.noOfFits, 1)
+        self.assertEqual(sorted(name for name in self.ads if "_Fitted_" in name), 
+                         sorted(name for name in fitted if "Levenberg" not in name))
+        table = self.ads[self.avg.name()+"_Fitted_Minuit_Parameters"]
+        self.assertEqual((table.getTitle(), table.column("Name"), table.column("Value")), ("Minuit Fit", ["sigma"], [5.]))
+        for extract in ["extractX", "extractY", "extractE"]:
+            nptest.assert_array_equal(getattr(self.ads[self.avg.name()+"_Fitted_Minuit"], extract)(), 
+                                      getattr(fitted[self.avg.name()+"_Fitted_Minuit"], extract)())
+
+    def test_miss_on_changed_avg(self):
+        self.runProcedure()
+        self.avg.dataY[0, 2] += 1
+        self.runProcedure()
+        self.assertEqual(self.noOfFits, 2)
+        self.assertEqual(len(self.cacheFiles()), 2)
+
+    def test_cache_disabled(self):
+        self.yFitIC.useYFitCache = False
+        with mock.patch.object(fit_in_yspace, "yFitCachePath") as cachePath:
+            self.runProcedure()
+            self.runProcedure()
+        cachePath.assert_not_called()
+        self.assertEqual(self.noOfFits, 2)
+        self.assertEqual(self.cacheFiles(), [])
+
+    def test_shown_plots(self):
+        self.yFitIC.showPlots = True
+        self.runProcedure()
+        self.runProcedure()
+        self.assertEqual(self.noOfFits, 2)
+        self.assertEqual(self.cacheFiles(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()